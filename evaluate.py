@@ -0,0 +1,45 @@
+from skull_king.evaluation import (evaluate_duplicate, evaluate_sequential, format_sequential, format_summary,
+                                   summarize)
+
+
+def main(args):
+    if args.lineup is not None:
+        lineup = args.lineup
+    else:
+        # Alternate the two agents around the table
+        lineup = [args.agents[i % len(args.agents)] for i in range(4)]
+
+    if args.sequential:
+        result = evaluate_sequential(lineup, alpha=args.alpha, max_deals=args.deals, min_deals=args.min_deals,
+                                     n_workers=args.workers, seed=args.seed, greedy=not args.stochastic,
+                                     cache_size=args.cache_size)
+        print(format_sequential(result))
+        return
+
+    result = evaluate_duplicate(lineup, args.deals, n_workers=args.workers, seed=args.seed,
+                                greedy=not args.stochastic, cache_size=args.cache_size)
+    print(format_summary(summarize(result)))
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Compare agents with duplicate deals rotated through every seat")
+    parser.add_argument("agents", nargs="*", default=["random"],
+                        help="Agent specs to compare, e.g. rl:local/a.torch rl:local/b.torch")
+    parser.add_argument("--lineup", nargs="+", default=None,
+                        help="Explicit spec for every seat instead of alternating the agents")
+    parser.add_argument("--deals", type=int, default=100, help="Deals to play (the maximum with --sequential)")
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: one per core)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stochastic", action="store_true",
+                        help="Let learned agents sample their actions instead of acting greedily")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Stop as soon as it is clear which of the first two agents is stronger")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Error rate of the sequential test")
+    parser.add_argument("--min-deals", type=int, default=20, help="Deals to play before the sequential test may stop")
+    parser.add_argument("--cache-size", type=int, default=0,
+                        help="Memoize learned agents' network outputs for up to this many observations")
+
+    args = parser.parse_args()
+    main(args)
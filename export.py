@@ -0,0 +1,69 @@
+import torch
+
+from skull_king.agents import RLAgent
+from skull_king.agents.inference import benchmark_latency, check_agreement, collect_states, export_checkpoint
+
+
+def export_numpy(args):
+    import numpy as np
+
+    from skull_king.agents import NumpyRLAgent
+
+    agent = RLAgent(0, **RLAgent.checkpoint_kwargs(args.checkpoint))
+    agent.load(args.checkpoint)
+    agent.save_numpy(args.output)
+    print(f"Exported {args.checkpoint} weights to {args.output}")
+
+    runtime = NumpyRLAgent(0, args.output, max_seats=agent.max_seats)
+    states = collect_states(max(args.check_games, 1), max_seats=agent.max_seats)
+    with torch.no_grad():
+        expected = agent.play_network(states["play_states"]).numpy()
+    actual = runtime.forward(runtime.play_layers, states["play_states"].numpy())
+    print(f"Max play logit difference from torch on {len(actual)} states: {np.abs(actual - expected).max():.2e}")
+
+
+def main(args):
+    if args.output.endswith(".npz"):
+        export_numpy(args)
+        return
+
+    export_checkpoint(args.checkpoint, args.output, quantize=not args.no_quantize)
+    print(f"Exported {args.checkpoint} to {args.output}")
+
+    reference = RLAgent(0, **RLAgent.checkpoint_kwargs(args.checkpoint))
+    reference.load(args.checkpoint)
+    reference.bid_network.eval()
+    reference.play_network.eval()
+    exported = RLAgent(0, max_seats=reference.max_seats)
+    exported.load_inference(args.output)
+
+    if args.check_games > 0:
+        states = collect_states(args.check_games, max_seats=reference.max_seats)
+        bid_agreement, play_agreement = check_agreement(reference, exported, states)
+        print(f"Agreement with float32 on {len(states['bid_states'])} bids: {bid_agreement:.2%}, "
+              f"{len(states['play_states'])} plays: {play_agreement:.2%}")
+
+    if args.benchmark:
+        n_obs = reference._get_obs_size()
+        torch.set_num_threads(args.threads)
+        for name, agent in [("float32 eager", reference), ("exported", exported)]:
+            for network_name in ["bid_network", "play_network"]:
+                latency = benchmark_latency(getattr(agent, network_name), n_obs)
+                print(f"{name:>14} {network_name:>12}: " + "  ".join(f"batch {b}: {ms:.3f} ms" for b, ms in latency.items()))
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Export a training checkpoint as a compiled, quantized inference policy")
+    parser.add_argument("checkpoint", type=str)
+    parser.add_argument("output", type=str,
+                        help="TorchScript file, or a .npz file of weights for the torch-free NumpyRLAgent")
+    parser.add_argument("--no-quantize", action="store_true", help="Keep float32 weights")
+    parser.add_argument("--check-games", type=int, default=20,
+                        help="Random games used as held-out states for the agreement check (0 to skip)")
+    parser.add_argument("--benchmark", action="store_true", help="Report latency at batch 1 and 256")
+    parser.add_argument("--threads", type=int, default=1)
+
+    args = parser.parse_args()
+    main(args)
@@ -21,7 +21,8 @@ def main(args):
         logging.error("Must have 4 players when using a RLAgent. Try adding more random agents with --num_random <n>")
 
     game = SkullKingGame(n_manual=n_manual, n_random=n_random, n_irl=n_irl,
-                         n_rl=n_agents, checkpoint_filepath=args.filepath)
+                         n_rl=n_agents, checkpoint_filepath=args.filepath,
+                         inference_filepath=args.inference_filepath)
     game.play_game()
 
 
@@ -31,7 +32,10 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--mode", "-m", default="singleplayer")
     parser.add_argument("--debug", "-d", action='store_true')
-    parser.add_argument("-f", "--filepath", type=str, default=None)
+    parser.add_argument("-f", "--filepath", type=str, default=None,
+                        help="RLAgent checkpoint, .npz weights from export.py to play without torch, or a .ppo PPO checkpoint")
+    parser.add_argument("-i", "--inference-filepath", type=str, default=None,
+                        help="Policy exported with export.py, used instead of a training checkpoint")
     parser.add_argument("--num_random", type=int, default=0)
     parser.add_argument("--num_irl", type=int, default=0)
 
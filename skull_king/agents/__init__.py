@@ -1,11 +1,87 @@
+from importlib import import_module
+from typing import List
+
 from .base_agent import BaseAgent
 from .manual_agent import ManualAgent
 from .random_agent import RandomAgent
-from .rl_agent import RLAgent
+
+# Agents are resolved lazily by name, so modules that need torch are only imported
+# once an agent that uses them is actually built.
+AGENT_REGISTRY = {
+    "manual": "skull_king.agents.manual_agent:ManualAgent",
+    "random": "skull_king.agents.random_agent:RandomAgent",
+    "rl": "skull_king.agents.rl_agent:RLAgent",
+    "numpy_rl": "skull_king.agents.numpy_agent:NumpyRLAgent",
+    "heuristic": "skull_king.agents.heuristic_agent:HeuristicAgent",
+    "ppo": "skull_king.agents.ppo_agent:PPOAgent",
+}
+
+
+def register_agent(name: str, target: str) -> None:
+    """Register an agent class under `name`, given as "module.path:ClassName"."""
+    AGENT_REGISTRY[name] = target
+
+
+def get_agent_class(name: str) -> type:
+    module_name, class_name = AGENT_REGISTRY[name].split(":")
+    return getattr(import_module(module_name), class_name)
+
+
+def make_agent(name: str, id: int, **kwargs) -> BaseAgent:
+    return get_agent_class(name)(id, **kwargs)
+
+
+def build_agents(agent_specs: List[str], greedy: bool = False, cache_size: int = 0) -> List[BaseAgent]:
+    """
+    Build one agent per spec. A spec is a registered agent name, optionally followed by a
+    checkpoint, e.g. "random", "rl:local/player_3.torch", "numpy_rl:policy.npz" or "ppo:local/ppo.ppo".
+    RLAgents loaded from a checkpoint act with their final (lowest) exploration rate, or, if
+    `greedy`, learned agents always take their best action. RLAgents memoize their network
+    outputs for up to `cache_size` observations.
+    """
+    players = []
+    for pid, spec in enumerate(agent_specs):
+        name, _, path = spec.partition(":")
+        if name == "numpy_rl":
+            kwargs = get_agent_class(name).checkpoint_kwargs(path) if path else {}
+            players.append(make_agent(name, pid, weights_filepath=path or None, greedy=greedy, **kwargs))
+        elif name == "rl":
+            # Checkpoints record the observation layout and network family to build the agent with
+            kwargs = get_agent_class(name).checkpoint_kwargs(path) if path else {}
+            agent = make_agent(name, pid, greedy=greedy, cache_size=cache_size, **kwargs)
+            if path:
+                agent.load(path)
+                agent.eps_start = agent.eps_end
+            players.append(agent)
+        elif name == "ppo":
+            kwargs = get_agent_class(name).checkpoint_kwargs(path) if path else {}
+            agent = make_agent(name, pid, greedy=greedy, **kwargs)
+            if path:
+                agent.load(path)
+            players.append(agent)
+        else:
+            players.append(make_agent(name, pid))
+    return players
+
+
+def __getattr__(name: str):
+    # Keep `from skull_king.agents import RLAgent` working without importing torch up front
+    if name == "RLAgent":
+        return get_agent_class("rl")
+    if name == "NumpyRLAgent":
+        return get_agent_class("numpy_rl")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = [
     "BaseAgent",
     "ManualAgent",
     "RandomAgent",
-    "RLAgent"
+    "RLAgent",
+    "NumpyRLAgent",
+    "AGENT_REGISTRY",
+    "register_agent",
+    "get_agent_class",
+    "make_agent",
+    "build_agents"
 ]
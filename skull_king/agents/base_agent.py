@@ -63,6 +63,7 @@ class BaseAgent:
             - player_scores: List[int]
             - tricks_taken: List[int]
             - cards_played: List[int]
+            - public: PublicState
         """
         legal_actions = np.zeros(len(game.ALL_CARDS))
 
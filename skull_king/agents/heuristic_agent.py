@@ -0,0 +1,225 @@
+"""
+A fast rule-based agent driven by precomputed card-strength tables.
+
+Bids are the number of tricks the hand is expected to take: the sum over its cards of the
+probability that the card wins its trick, looked up by round and by the seat's position after the
+round's starting player. The tables are estimated by simulation (`build_tables`, or run this
+module) and shipped as heuristic_tables.npz, which is loaded once, on first use.
+
+Cards are played by a ranked policy against the tricks still needed for the bid: while it needs
+tricks the agent wins as cheaply as it can, and otherwise it throws its strongest card that cannot
+win. Decisions only look up per-card integer tables and test bitmasks of card ids, with no torch
+and no Card comparisons.
+"""
+import os
+from typing import Callable, List
+
+import numpy as np
+
+import skull_king.game as game
+from skull_king.agents import BaseAgent
+
+TABLES_PATH = os.path.join(os.path.dirname(__file__), "heuristic_tables.npz")
+
+N_CARDS = len(game.ALL_CARDS)
+N_ROUNDS = 10
+
+# Card kinds, for deciding whether a card beats the one currently winning the trick
+ESCAPE, NUMBER, PIRATE, MERMAID, SKULL_KING, KRAKEN, WHITE_WHALE = range(7)
+
+
+def _kind(card: game.Card) -> int:
+    if isinstance(card, game.Number):
+        return NUMBER
+    if isinstance(card, (game.Pirate, game.Tigress)):  # the Tigress is always played as a pirate
+        return PIRATE
+    if isinstance(card, game.Mermaid):
+        return MERMAID
+    if isinstance(card, game.SkullKing):
+        return SKULL_KING
+    if isinstance(card, game.Kraken):
+        return KRAKEN
+    if isinstance(card, game.WhiteWhale):
+        return WHITE_WHALE
+    return ESCAPE  # Escape and Loot
+
+
+KIND = [_kind(card) for card in game.ALL_CARDS]
+COLOR = [card.color if isinstance(card, game.Number) else -1 for card in game.ALL_CARDS]
+VALUE = [card.value if isinstance(card, game.Number) else 0 for card in game.ALL_CARDS]
+
+NUMBER_BITS = sum(1 << i for i in range(N_CARDS) if KIND[i] == NUMBER)
+COLOR_BITS = [sum(1 << i for i in range(N_CARDS) if COLOR[i] == color) for color in range(4)]
+
+# SPECIAL_BEATS[kind] is a bitmask of the kinds a special card beats when played after them
+SPECIAL_BEATS = {
+    ESCAPE: 0,
+    PIRATE: 1 << ESCAPE | 1 << NUMBER | 1 << MERMAID,
+    MERMAID: 1 << ESCAPE | 1 << NUMBER | 1 << SKULL_KING,
+    SKULL_KING: 1 << ESCAPE | 1 << NUMBER | 1 << PIRATE,
+    KRAKEN: 0,
+    WHITE_WHALE: 0,
+}
+
+_tables: np.ndarray = None
+
+
+def load_tables() -> np.ndarray:
+    """Win probability of every card, indexed by [round - 1, position after the starting player, card id]."""
+    global _tables
+    if _tables is None:
+        _tables = np.load(TABLES_PATH)["win_probability"]
+    return _tables
+
+
+def card_strength(tables: np.ndarray) -> List[int]:
+    """Rank of every card by how often it wins overall, as integers for the play policy."""
+    return np.argsort(np.argsort(tables.mean(axis=(0, 1)), kind="stable")).tolist()
+
+
+class HeuristicAgent(BaseAgent):
+    """Bids the expected tricks of its hand from precomputed tables and plays to make the bid."""
+    def __init__(self, id: int, tables: np.ndarray = None) -> None:
+        super().__init__(id)
+        self.tables = load_tables() if tables is None else tables
+        self.strength = card_strength(self.tables)
+        self._table_rows = self.tables.tolist()  # plain lists are faster to index one card at a time
+        self.bet = 0
+
+    def bid(self, game_state: dict) -> int:
+        """Make a bid prediction based on the current player's hand."""
+        position = (self.id - game_state["starting_player"]) % len(game_state["player_bets"])
+        position = min(position, self.tables.shape[1] - 1)
+        row = self._table_rows[game_state["current_round"] - 1][position]
+        expected = sum(row[card.id] for card in self.hand.cards)
+        self.bet = min(int(expected + 0.5), len(self.hand.cards))
+        return self.bet
+
+    def _legal_bits(self, hand_bits: int, color: int) -> int:
+        if color is None:
+            return hand_bits
+        follow = hand_bits & COLOR_BITS[color]
+        return (hand_bits & ~NUMBER_BITS) | follow if follow else hand_bits
+
+    def _winning_bits(self, legal_ids: List[int], trick: game.Trick, winning_card) -> int:
+        """Bitmask of the legal cards that would take the lead in `trick`."""
+        if trick.kraken_played:
+            return 0  # nobody takes this trick
+
+        if winning_card is game.Mermaid:
+            # A pirate, mermaid and skull king have all been played, and compute_winner gives the
+            # Mermaid class rather than the winning card: a mermaid is winning
+            winner_id, winner_kind = None, MERMAID
+        else:
+            winner_id, winner_kind = winning_card.id, KIND[winning_card.id]
+        bits = 0
+        for i in legal_ids:
+            kind = KIND[i]
+            if trick.white_whale_played:
+                # Only the highest number counts
+                wins = kind == NUMBER and VALUE[i] > VALUE[winner_id]
+            elif kind == NUMBER:
+                if winner_kind == NUMBER:
+                    wins = (VALUE[i] > VALUE[winner_id] if COLOR[i] == COLOR[winner_id]
+                            else COLOR[i] == game.CARD_COLOR_BLACK)
+                else:
+                    wins = winner_kind == ESCAPE
+            else:
+                wins = bool(SPECIAL_BEATS[kind] >> winner_kind & 1)
+            if wins:
+                bits |= 1 << i
+        return bits
+
+    def play(self, game_state: dict) -> game.Card:
+        """Play a card from the agent's hand, given the current global state and the agent's internal state."""
+        trick: game.Trick = game_state["current_trick"]
+        hand_ids = [card.id for card in self.hand.cards]
+        hand_bits = 0
+        for i in hand_ids:
+            hand_bits |= 1 << i
+        legal_bits = self._legal_bits(hand_bits, trick.color)
+        legal_ids = [i for i in hand_ids if legal_bits >> i & 1]
+        need = self.bet - len(self.tricks)
+        strength = self.strength.__getitem__
+
+        if len(trick) == 0:
+            # Leading: push the strongest card while tricks are needed, otherwise the weakest
+            action = max(legal_ids, key=strength) if need > 0 else min(legal_ids, key=strength)
+        else:
+            winning_bits = self._winning_bits(legal_ids, trick, game_state["public"].trick_winning_card)
+            winning = [i for i in legal_ids if winning_bits >> i & 1]
+            losing = [i for i in legal_ids if not winning_bits >> i & 1]
+            if need > 0:
+                # Win as cheaply as possible, or throw away the weakest card
+                action = min(winning, key=strength) if winning else min(losing, key=strength)
+            else:
+                # Get rid of the strongest card that loses; if every card wins, spend the strongest
+                action = max(losing, key=strength) if losing else max(winning, key=strength)
+
+        return self.hand.pick_card(action)
+
+
+def build_tables(n_games: int, make_player: Callable[[int], BaseAgent] = None, n_players: int = 4,
+                 seed: int = 0, prior_weight: float = 4.0) -> np.ndarray:
+    """
+    Estimate the win probability table by playing `n_games` games with `make_player(seat)` in every
+    seat (default: RandomAgent). Each cell is shrunk towards 1 / n_players with the weight of
+    `prior_weight` observations.
+    """
+    import random
+
+    from skull_king.agents import RandomAgent
+    from skull_king.env import SkullKingGame
+
+    if make_player is None:
+        make_player = RandomAgent
+
+    random.seed(seed)
+    np.random.seed(seed)
+
+    wins = np.zeros((N_ROUNDS, n_players, N_CARDS))
+    counts = np.zeros((N_ROUNDS, n_players, N_CARDS))
+
+    class Counter:
+        def __init__(self) -> None:
+            self.starting_player = 0
+
+        def on_bid(self, player_id, player, state, bid):
+            self.starting_player = state["starting_player"]
+
+        def on_trick(self, winner_id, trick):
+            for player_id, card in trick.cards:
+                position = (player_id - self.starting_player) % n_players
+                counts[env.round - 1, position, card.id] += 1
+                if player_id == winner_id:
+                    wins[env.round - 1, position, card.id] += 1
+
+        def __getattr__(self, name):
+            return lambda *args: None
+
+    env = SkullKingGame(n_manual=0, n_random=n_players)
+    env.players = [make_player(i) for i in range(n_players)]
+    env.recorder = Counter()
+    for _ in range(n_games):
+        env.play_game()
+        env.reset_game()
+
+    return (wins + prior_weight / n_players) / (counts + prior_weight)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Estimate HeuristicAgent's win probability tables by self-play")
+    parser.add_argument("--games", type=int, default=10000, help="Games per pass")
+    parser.add_argument("--output", type=str, default=TABLES_PATH)
+    parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+
+    # Bootstrap from random play, then re-estimate with the heuristic agents themselves,
+    # whose play is what the bids have to predict
+    tables = build_tables(args.games, seed=args.seed)
+    tables = build_tables(args.games, lambda i: HeuristicAgent(i, tables=tables), seed=args.seed + 1)
+    np.savez_compressed(args.output, win_probability=tables.astype(np.float32))
+    print(f"Wrote {args.output}")
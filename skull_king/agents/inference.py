@@ -0,0 +1,132 @@
+"""
+Inference-only export of RLAgent checkpoints.
+
+A checkpoint's bid and play networks are bundled into one module, the Linear layers are
+dynamically quantized to int8, and the result is compiled with TorchScript and frozen. The exported
+file can be loaded with `RLAgent.load_inference` for acting (not training).
+"""
+import random
+import time
+from typing import List, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.ao.quantization import quantize_dynamic
+
+from skull_king.agents.random_agent import RandomAgent
+from skull_king.agents.rl_agent import RLAgent
+
+
+class InferencePolicy(nn.Module):
+    """Bid and play networks bundled for acting only."""
+    def __init__(self, bid_network: nn.Module, play_network: nn.Module) -> None:
+        super().__init__()
+        self.bid_network = bid_network
+        self.play_network = play_network
+
+    def forward(self, x):
+        return self.play_network(x)
+
+    @torch.jit.export
+    def bid(self, x):
+        return self.bid_network(x)
+
+
+def build_inference_policy(agent: RLAgent, quantize: bool = True) -> torch.jit.ScriptModule:
+    policy = InferencePolicy(agent.bid_network, agent.play_network).eval()
+    if quantize:
+        policy = quantize_dynamic(policy, {nn.Linear}, dtype=torch.qint8)
+    scripted = torch.jit.script(policy)
+    return torch.jit.freeze(scripted, preserved_attrs=["bid"])
+
+
+def export_checkpoint(checkpoint_path: str, output_path: str, quantize: bool = True) -> torch.jit.ScriptModule:
+    """Export an RLAgent checkpoint saved with `RLAgent.save` as an inference-only TorchScript file."""
+    agent = RLAgent(0, **RLAgent.checkpoint_kwargs(checkpoint_path))
+    agent.load(checkpoint_path)
+    policy = build_inference_policy(agent, quantize)
+    torch.jit.save(policy, output_path)
+    return policy
+
+
+class _RecordingAgent(RandomAgent):
+    """Random agent that records the observation RLAgent would see at each of its decisions."""
+    def __init__(self, id: int, encoder: RLAgent, record: dict) -> None:
+        super().__init__(id)
+        self.encoder = encoder
+        self.record = record
+
+    def _obs(self, game_state: dict) -> torch.Tensor:
+        self.encoder.id = self.id
+        self.encoder.hand = self.hand
+        return self.encoder.get_obs(game_state)
+
+    def bid(self, game_state: dict) -> int:
+        self.record["bid_states"].append(self._obs(game_state))
+        self.record["rounds"].append(game_state["current_round"])
+        return super().bid(game_state)
+
+    def play(self, game_state: dict):
+        self.record["play_states"].append(self._obs(game_state))
+        self.record["legal_actions"].append(torch.tensor(self._get_legal_actions(game_state), dtype=torch.float32))
+        return super().play(game_state)
+
+
+def collect_states(n_games: int = 20, seed: int = 0, max_seats: int = None) -> dict:
+    """
+    Play random games and collect the observations and legal actions of every decision, as a held-out set.
+    Observations use the layout of RLAgents with `max_seats`.
+    """
+    from skull_king.env import SkullKingGame
+
+    random.seed(seed)
+    np.random.seed(seed)
+
+    record = {"bid_states": [], "rounds": [], "play_states": [], "legal_actions": []}
+    encoder = RLAgent(0, max_seats=max_seats)
+    env = SkullKingGame(n_manual=0, n_random=4)
+    env.players = [_RecordingAgent(i, encoder, record) for i in range(4)]
+    for _ in range(n_games):
+        env.play_game()
+        env.reset_game()
+
+    return {
+        "bid_states": torch.stack(record["bid_states"]),
+        "rounds": torch.tensor(record["rounds"]),
+        "play_states": torch.stack(record["play_states"]),
+        "legal_actions": torch.stack(record["legal_actions"]),
+    }
+
+
+@torch.no_grad()
+def check_agreement(reference: RLAgent, candidate: RLAgent, states: dict) -> Tuple[float, float]:
+    """
+    Fraction of held-out bid and play decisions on which `candidate` makes the same greedy choice as
+    `reference`, e.g. a float32 agent against the same checkpoint loaded with `load_inference`.
+    """
+    bid_mask = torch.arange(11).unsqueeze(0) <= states["rounds"].unsqueeze(1)
+
+    def choices(agent: RLAgent) -> Tuple[torch.Tensor, torch.Tensor]:
+        bids = agent.bid_network(states["bid_states"]).masked_fill(~bid_mask, float('-inf')).argmax(1)
+        plays = agent.play_network(states["play_states"]).masked_fill(states["legal_actions"] == 0, float('-inf')).argmax(1)
+        return bids, plays
+
+    ref_bids, ref_plays = choices(reference)
+    bids, plays = choices(candidate)
+    return (bids == ref_bids).float().mean().item(), (plays == ref_plays).float().mean().item()
+
+
+@torch.no_grad()
+def benchmark_latency(network, n_obs: int, batch_sizes: List[int] = (1, 256), iters: int = 200) -> dict:
+    """Mean forward latency in milliseconds of `network` at each batch size."""
+    results = {}
+    for batch_size in batch_sizes:
+        x = torch.randn(batch_size, n_obs)
+        for _ in range(10):
+            network(x)
+        start = time.perf_counter()
+        for _ in range(iters):
+            network(x)
+        results[batch_size] = (time.perf_counter() - start) / iters * 1000
+    return results
@@ -0,0 +1,96 @@
+import re
+from typing import List, Tuple
+
+import numpy as np
+
+import skull_king.game as game
+from skull_king.agents import BaseAgent
+from skull_king.obs import bid_mask, encode_obs
+
+
+class NumpyRLAgent(BaseAgent):
+    """
+    Acts with an RLAgent's bid and play networks exported by `RLAgent.save_numpy`, using only numpy.
+    Importing and building this agent never loads torch, which keeps play and simulation startup fast.
+    """
+    def __init__(self, id: int, weights_filepath: str = None, greedy: bool = False, max_seats: int = None) -> None:
+        """`max_seats` is the observation layout the weights were trained with (see RLAgent)."""
+        super().__init__(id)
+        self.greedy = greedy
+        self.max_seats = max_seats
+        self.bid_layers: List[Tuple[np.ndarray, np.ndarray]] = []
+        self.play_layers: List[Tuple[np.ndarray, np.ndarray]] = []
+        self.current_bid: int = None
+
+        if weights_filepath is not None:
+            self.load(weights_filepath)
+
+    @staticmethod
+    def _layers(arrays, prefix: str) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Collect the Linear layers of an exported nn.Sequential in order, as (W^T, b) pairs."""
+        indices = sorted({int(m.group(1)) for key in arrays.files
+                          if (m := re.fullmatch(re.escape(prefix) + r"\.main\.(\d+)\.weight", key))})
+        return [(np.ascontiguousarray(arrays[f"{prefix}.main.{i}.weight"].T, dtype=np.float32),
+                 arrays[f"{prefix}.main.{i}.bias"].astype(np.float32))
+                for i in indices]
+
+    @staticmethod
+    def _saved_max_seats(arrays) -> int:
+        # Exports of 4 player networks don't record it
+        return int(arrays["max_seats"]) if "max_seats" in arrays.files else None
+
+    @classmethod
+    def checkpoint_kwargs(cls, filepath: str) -> dict:
+        """Constructor arguments for an agent whose observations fit the weights exported to `filepath`."""
+        with np.load(filepath) as arrays:
+            return {"max_seats": cls._saved_max_seats(arrays)}
+
+    def load(self, filepath: str) -> None:
+        with np.load(filepath) as arrays:
+            saved = self._saved_max_seats(arrays)
+            if saved != self.max_seats:
+                raise ValueError(f"{filepath} was exported with max_seats={saved}, not {self.max_seats}")
+            self.bid_layers = self._layers(arrays, "bid_network")
+            self.play_layers = self._layers(arrays, "play_network")
+
+    @staticmethod
+    def forward(layers: List[Tuple[np.ndarray, np.ndarray]], x: np.ndarray) -> np.ndarray:
+        """Linear layers with ReLU in between, i.e. BidNetwork/PlayNetwork without the final softmax."""
+        for i, (weight, bias) in enumerate(layers):
+            x = x @ weight + bias
+            if i < len(layers) - 1:
+                np.maximum(x, 0, out=x)
+        return x
+
+    def round_cleanup(self):
+        super().round_cleanup()
+        self.current_bid = None
+
+    def bid(self, game_state: dict) -> int:
+        """Make a bid prediction based on the current player's hand."""
+        obs = encode_obs(self.hand, game_state, self.id, max_seats=self.max_seats)
+        logits = self.forward(self.bid_layers, obs)
+        # The bid network ends in a softmax, which doesn't change the argmax
+        logits[~bid_mask(game_state["current_round"])] = -np.inf
+        self.current_bid = int(np.argmax(logits))
+        return self.current_bid
+
+    def play(self, game_state: dict) -> game.Card:
+        """Play a card with the play network, masked to legal actions."""
+        obs = encode_obs(self.hand, game_state, self.id, max_seats=self.max_seats)
+        legal_actions = self._get_legal_actions(game_state)
+
+        logits = self.forward(self.play_layers, obs)
+        logits[legal_actions == 0] = -np.inf
+        if self.greedy:
+            action_id = int(np.argmax(logits))
+        else:
+            probs = np.exp(logits - logits.max())
+            probs /= probs.sum()
+            action_id = int(np.random.choice(len(probs), p=probs))
+
+        card = self.hand.pick_card(action_id)
+        if card is not None:
+            return card
+
+        raise ValueError(f"Selected card ID {action_id} not found in hand! Current hand: {self.hand}")
@@ -0,0 +1,84 @@
+"""
+Memoized network outputs for repeated observations.
+
+Early rounds have few distinct observations (round 1 is a single card in a handful of contexts),
+yet RLAgent runs a forward pass for every decision. A PolicyCache sits in front of a network and
+keeps its outputs in a bounded LRU, keyed by the bit-packed observation and legal-action mask
+(about 60 bytes for four players, like ObsCodec's encoding). Optimizer steps and `load_state_dict` modify parameters in place, which bumps
+their version counters; the cache notices and clears itself, so it never serves outputs of old
+weights. It pays off for frozen checkpoints in evaluation and serving.
+"""
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from skull_king.metrics import METRICS
+from skull_king.obs import score_indices
+
+
+class PolicyCache:
+    def __init__(self, maxsize: int = 100000, n_players: int = 4) -> None:
+        self.maxsize = maxsize
+        self.score_index = score_indices(n_players)
+        self.entries = OrderedDict()
+        self.weights_key = None
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def key(self, obs: torch.Tensor, mask: np.ndarray) -> bytes:
+        # Every entry but the scores is 0/1, so the nonzero pattern plus the scores identifies the observation
+        obs = obs.numpy()
+        return (np.packbits(obs != 0).tobytes() + obs[self.score_index].astype(np.int16).tobytes()
+                + np.packbits(np.asarray(mask) != 0).tobytes())
+
+    def _check_weights(self, network) -> None:
+        # Parameters count their in-place modifications, so the sum changes whenever the weights do.
+        # Exported policies (see RLAgent.load_inference) are frozen and expose no parameters.
+        parameters = network.parameters() if isinstance(network, nn.Module) else ()
+        weights_key = (id(network), sum(p._version for p in parameters))
+        if weights_key != self.weights_key:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.weights_key = weights_key
+
+    def get(self, network, obs: torch.Tensor, mask: np.ndarray,
+            compute: Callable[[], torch.Tensor]) -> torch.Tensor:
+        """The output of `compute()` (which runs `network` on `obs`) for this observation and mask, cached."""
+        self._check_weights(network)
+        key = self.key(obs, mask)
+        output = self.entries.get(key)
+        if output is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            if METRICS.enabled:
+                METRICS.count("policy_cache_hits")
+            return output
+
+        self.misses += 1
+        if METRICS.enabled:
+            METRICS.count("policy_cache_misses")
+        output = compute()
+        self.entries[key] = output
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return output
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "size": len(self.entries),
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,115 @@
+from typing import List, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from skull_king import game
+from skull_king.agents import BaseAgent
+from skull_king.obs import N_BIDS, N_CARDS, bid_mask, encode_obs, obs_size
+
+N_ACTIONS = N_BIDS + N_CARDS  # bids first, then card ids offset by N_BIDS
+BID, PLAY = 0, 1
+
+
+class PolicyValueNetwork(nn.Module):
+    """Shared torso with one policy head over bids and cards and one value head per decision kind."""
+    def __init__(self, n_obs: int, hidden: int = 256) -> None:
+        super().__init__()
+
+        self.torso = nn.Sequential(
+            nn.Linear(n_obs, hidden),
+            nn.ReLU(),
+            nn.Linear(hidden, hidden),
+            nn.ReLU(),
+        )
+        self.policy = nn.Linear(hidden, N_ACTIONS)
+        self.value = nn.Linear(hidden, 2)
+
+    def forward(self, x):
+        h = self.torso(x)
+        return self.policy(h), self.value(h)
+
+
+def masked_logits(logits: torch.Tensor, mask: torch.Tensor) -> torch.Tensor:
+    # A large negative rather than -inf keeps the entropy of masked distributions finite
+    return logits.masked_fill(~mask, -1e9)
+
+
+@torch.no_grad()
+def select_actions(network: nn.Module, obs: np.ndarray, masks: np.ndarray, kinds: np.ndarray,
+                   greedy: bool = False) -> List[Tuple[int, float, float]]:
+    """(action, log probability, value estimate) for each row of a batch of decisions."""
+    logits, values = network(torch.from_numpy(obs))
+    logits = masked_logits(logits, torch.from_numpy(masks))
+    if greedy:
+        actions = logits.argmax(dim=-1)
+    else:
+        actions = torch.distributions.Categorical(logits=logits).sample()
+    log_probs = torch.log_softmax(logits, dim=-1).gather(1, actions.unsqueeze(1)).squeeze(1)
+    values = values.gather(1, torch.from_numpy(kinds).unsqueeze(1)).squeeze(1)
+    return list(zip(actions.tolist(), log_probs.tolist(), values.tolist()))
+
+
+class PPOAgent(BaseAgent):
+    """
+    An agent acting with a PolicyValueNetwork, trained on-policy by `skull_king.ppo.PPOTrainer`.
+
+    While a trainer collects rollouts it sets `server` (to batch decisions across games) and
+    `sink`, which receives each round's decisions along with the round's score.
+    """
+    def __init__(self, id: int, network: nn.Module = None, greedy: bool = False, max_seats: int = None) -> None:
+        super().__init__(id)
+        self.max_seats = max_seats
+        self.network = network if network is not None else PolicyValueNetwork(obs_size(max_seats=max_seats))
+        self.greedy = greedy
+
+        self.server = None
+        self.sink = None
+        self.trajectory = []  # [(obs, mask, kind, action, log_prob, value), ...] this round
+
+    def save(self, filepath: str) -> None:
+        torch.save({"ppo_network": self.network.state_dict(), "max_seats": self.max_seats}, filepath)
+
+    @staticmethod
+    def checkpoint_kwargs(filepath: str) -> dict:
+        """Constructor arguments for an agent whose network fits the checkpoint saved at `filepath`."""
+        return {"max_seats": torch.load(filepath)["max_seats"]}
+
+    def load(self, filepath: str) -> None:
+        checkpoint = torch.load(filepath)
+        if checkpoint["max_seats"] != self.max_seats:
+            raise ValueError(f"{filepath} was trained with max_seats={checkpoint['max_seats']}, not {self.max_seats}")
+        self.network.load_state_dict(checkpoint["ppo_network"])
+
+    def _act(self, game_state: dict, mask: np.ndarray, kind: int) -> int:
+        obs = encode_obs(self.hand, game_state, self.id, max_seats=self.max_seats)
+        if self.server is not None:
+            action, log_prob, value = self.server.submit(None, (obs, mask, kind))
+        else:
+            (action, log_prob, value), = select_actions(self.network, obs[None], mask[None],
+                                                        np.array([kind]), self.greedy)
+        if self.sink is not None:
+            self.trajectory.append((obs, mask, kind, action, log_prob, value))
+        return action
+
+    def bid(self, game_state: dict) -> int:
+        mask = np.zeros(N_ACTIONS, dtype=bool)
+        mask[:N_BIDS] = bid_mask(game_state["current_round"])
+        return self._act(game_state, mask, BID)
+
+    def play(self, game_state: dict) -> game.Card:
+        mask = np.zeros(N_ACTIONS, dtype=bool)
+        mask[N_BIDS:] = self._get_legal_actions(game_state) != 0
+        action = self._act(game_state, mask, PLAY)
+        return self.hand.pick_card(action - N_BIDS)
+
+    def compute_score(self, round_number: int, bet: int) -> int:
+        score = super().compute_score(round_number, bet)
+        if self.sink is not None and self.trajectory:
+            self.sink(self.trajectory, score)
+        return score
+
+    def round_cleanup(self):
+        super().round_cleanup()
+        self.trajectory = []
@@ -1,30 +1,22 @@
+import contextlib
+import copy
+import logging
 import math
 import random
-from collections import deque
+import time
 
 import numpy as np
 import torch
 import torch.nn as nn
 
 from skull_king.agents import BaseAgent
+from skull_king.agents.policy_cache import PolicyCache
 from skull_king import game
+from skull_king.metrics import METRICS
+from skull_king.obs import bid_mask, encode_card_sets, encode_obs, obs_size, trick_reward
+from skull_king.replay import PackedReplayMemory, PrioritizedReplayMemory, ReplayMemory
 
-class ReplayMemory:
-    """
-    Captures interactions between agents and the environment so they can be
-    used to train the neural networks for RL-based agents.
-    """
-    def __init__(self, capacity: int) -> None:
-        self.memory = deque([], maxlen=capacity)
-
-    def push(self, x):
-        self.memory.append(x)
-
-    def sample(self, batch_size: int):
-        return random.sample(self.memory, batch_size)
-
-    def __len__(self):
-        return len(self.memory)
+logger = logging.getLogger(__name__)
 
 
 class BidNetwork(nn.Module):
@@ -77,8 +69,22 @@ class RLAgent(BaseAgent):
                  eps_start: float = 0.95,
                  eps_end: float = 0.1,
                  eps_decay: float = 2000,
-                 target_update: int = 2) -> None:
+                 target_update: int = 2,
+                 lr: float = 0.00001,
+                 bid_lr: float = 0.001,
+                 greedy: bool = False,
+                 cache_size: int = 0,
+                 max_seats: int = None) -> None:
+        """
+        `greedy` agents never explore and always play their highest-scoring legal card, e.g. for evaluation.
+        With `cache_size` > 0 the bid and play network outputs are memoized for up to that many
+        observations each (see PolicyCache).
+        By default observations describe a 4 player table. With `max_seats` they use the
+        seat-relative layout padded to that many seats, so the agent can play at any table
+        size up to it (see skull_king.obs.encode_obs).
+        """
         super().__init__(id)
+        self.max_seats = max_seats
 
         # Neural Networks
         n_obs = self._get_obs_size()
@@ -96,8 +102,8 @@ class RLAgent(BaseAgent):
         self.play_network = play_network
         self.target_network = target_network
 
-        self.play_optimizer = torch.optim.Adam(self.play_network.parameters(), lr=0.00001)
-        self.bid_optimizer = torch.optim.Adam(self.bid_network.parameters())
+        self.play_optimizer = torch.optim.Adam(self.play_network.parameters(), lr=lr)
+        self.bid_optimizer = torch.optim.Adam(self.bid_network.parameters(), lr=bid_lr)
 
         # RL Components
         if bid_memory is None:
@@ -110,35 +116,52 @@ class RLAgent(BaseAgent):
         else:
             self.memory = play_memory
 
+        # Guards the replay memories when they are pushed to and sampled from on different threads
+        self.memory_lock = contextlib.nullcontext()
+
         self.batch_size = batch_size
         self.gamma = gamma
         self.eps_start = eps_start
         self.eps_end = eps_end
         self.eps_decay = eps_decay
         self.target_update = target_update
+        self.greedy = greedy
+
+        # Set networks (skull_king.agents.set_networks) read observations as card ids
+        self.card_sets = getattr(play_network, "takes_card_sets", False)
+        if self.card_sets and cache_size > 0:
+            raise ValueError("Policy caches key on dense observations, so they can't be used with set networks")
+
+        if cache_size > 0:
+            n_seats = 4 if max_seats is None else max_seats
+            self.bid_cache = PolicyCache(cache_size, n_seats)
+            self.play_cache = PolicyCache(cache_size, n_seats)
+        else:
+            self.bid_cache = self.play_cache = None
 
         # Training State
+        self.inference_only = False
         self.games_played = 0
         self.round_traj = [] # [(state, action, immediate_reward), ...]
         self.current_round_rewards = []
         self.current_bid: int = None
+        # Set when the round was restored mid-play (SkullKingGame.set_position), so its bid wasn't observed
+        self.resumed = False
 
-    def _get_obs_size(self, n_players: int = 4) -> int:
-        cards_played_space = len(game.ALL_CARDS) # cards played in current round
-        hand_space = len(game.ALL_CARDS) # cards in our hand
-        trick_space = len(game.ALL_CARDS) # cards played in current trick
-
-        is_starting_player_space = 1
+    def set_learning_rates(self, lr: float, bid_lr: float) -> None:
+        """Change the play and bid optimizers' learning rates, keeping their other state."""
+        for group in self.play_optimizer.param_groups:
+            group['lr'] = lr
+        for group in self.bid_optimizer.param_groups:
+            group['lr'] = bid_lr
 
-        # per-player state
-        bid_space = 11 # [0-10]
-        score_space = 1 # raw score value
-        tricks_taken_space = 10 # [0-9] (can't take the 10th unless the game is over, in which case it doesn't matter)
+    def _get_obs_size(self, n_players: int = 4) -> int:
+        return obs_size(n_players, self.max_seats)
 
-        player_id_space = 4 # num players
-        return cards_played_space + hand_space + trick_space + is_starting_player_space \
-            + n_players * (bid_space + score_space + tricks_taken_space) \
-            + player_id_space
+    @property
+    def network_kind(self) -> str:
+        """The network family, as named by skull_king.agents.set_networks.build_networks."""
+        return "set" if self.card_sets else "dense"
 
     def save(self, filepath: str) -> None:
         torch.save({
@@ -146,39 +169,94 @@ class RLAgent(BaseAgent):
             'play_network': self.play_network.state_dict(),
             'target_network': self.target_network.state_dict(),
             'play_optimizer': self.play_optimizer.state_dict(),
-            'bid_optimizer': self.bid_optimizer.state_dict()
+            'bid_optimizer': self.bid_optimizer.state_dict(),
+            'max_seats': self.max_seats,
+            'network': self.network_kind
         }, filepath)
 
+    @staticmethod
+    def checkpoint_kwargs(filepath: str) -> dict:
+        """Constructor arguments for an agent whose networks fit the checkpoint saved at `filepath`."""
+        from skull_king.agents.set_networks import build_networks
+
+        checkpoint = torch.load(filepath)
+        # Checkpoints from before these were recorded are dense, 4 player ones
+        max_seats = checkpoint.get('max_seats')
+        return {"max_seats": max_seats, **build_networks(checkpoint.get('network', "dense"), obs_size(max_seats=max_seats))}
+
+    def save_numpy(self, filepath: str) -> None:
+        """Export the bid and play network weights as numpy arrays for NumpyRLAgent, which runs without torch."""
+        if self.card_sets:
+            raise ValueError("NumpyRLAgent only runs dense networks")
+        arrays = {}
+        if self.max_seats is not None:
+            arrays["max_seats"] = np.array(self.max_seats)
+        for name, network in [("bid_network", self.bid_network), ("play_network", self.play_network)]:
+            for key, value in network.state_dict().items():
+                arrays[f"{name}.{key}"] = value.detach().cpu().numpy()
+        np.savez(filepath, **arrays)
+
     def load(self, filepath: str) -> None:
         checkpoint = torch.load(filepath)
+        saved = (checkpoint.get('max_seats'), checkpoint.get('network', "dense"))
+        if saved != (self.max_seats, self.network_kind):
+            raise ValueError(f"{filepath} was trained with max_seats={saved[0]} and {saved[1]} networks, "
+                             f"not max_seats={self.max_seats} and {self.network_kind} networks")
         self.bid_network.load_state_dict(checkpoint['bid_network'])
         self.play_network.load_state_dict(checkpoint['play_network'])
         self.target_network.load_state_dict(checkpoint['target_network'])
         self.play_optimizer.load_state_dict(checkpoint['play_optimizer'])
         self.bid_optimizer.load_state_dict(checkpoint['bid_optimizer'])
 
+    def training_state(self) -> dict:
+        """
+        Snapshot of everything needed to resume training this agent, except the replay memories
+        (which may be shared between agents). Tensors are copied, so training can continue while
+        the snapshot is written out.
+        """
+        def copy_tensors(state_dict: dict) -> dict:
+            return {k: v.detach().clone() for k, v in state_dict.items()}
+
+        return {
+            'bid_network': copy_tensors(self.bid_network.state_dict()),
+            'play_network': copy_tensors(self.play_network.state_dict()),
+            'target_network': copy_tensors(self.target_network.state_dict()),
+            'play_optimizer': copy.deepcopy(self.play_optimizer.state_dict()),
+            'bid_optimizer': copy.deepcopy(self.bid_optimizer.state_dict()),
+            'games_played': self.games_played,
+        }
+
+    def load_training_state(self, state: dict) -> None:
+        self.bid_network.load_state_dict(state['bid_network'])
+        self.play_network.load_state_dict(state['play_network'])
+        self.target_network.load_state_dict(state['target_network'])
+        self.play_optimizer.load_state_dict(state['play_optimizer'])
+        self.bid_optimizer.load_state_dict(state['bid_optimizer'])
+        self.games_played = state['games_played']
+
+    def load_inference(self, filepath: str) -> None:
+        """
+        Act with a policy exported by `skull_king.agents.inference.export_checkpoint`.
+        The exported networks are compiled and possibly quantized, so the agent can no longer be trained.
+        """
+        policy = torch.jit.load(filepath)
+        self.bid_network = policy.bid
+        self.play_network = policy
+        self.inference_only = True
+
     def round_cleanup(self):
         super().round_cleanup()
         self.round_traj = []
         self.current_round_rewards = []
         self.current_bid = None
+        self.resumed = False
 
     def lose_trick(self) -> None:
         pass
 
     def win_trick(self, trick: game.Trick) -> None:
         super().win_trick(trick)
-        # base reward for winning a trick
-        # negative reward if we've received too many tricks
-        if self.current_bid == 0:
-            reward = -10
-        elif len(self.tricks) > self.current_bid:
-            reward = -2
-        else:
-            reward = 2
-
-        # only get extra reward if we're working towards our bid
-        if (reward > 0): reward += trick.bonus_points
+        reward = trick_reward(self.current_bid, len(self.tricks), trick.bonus_points)
 
         # Update this tricks state-action pair with a new reward to save in memory at round end
         if self.round_traj:
@@ -188,98 +266,84 @@ class RLAgent(BaseAgent):
     def compute_score(self, round_number, bet) -> int:
         score = super().compute_score(round_number, bet)
 
+        # A round resumed after this agent's last play has nothing to store
+        if not self.round_traj:
+            return score
+
         # Store round info in replay memory
         final_reward = score / len(self.round_traj) / 10
 
-        for i in range(len(self.round_traj)):
-            state, action, reward = self.round_traj[i]
-            total_reward = reward + final_reward
-            next_state = self.round_traj[i + 1][0] if i < len(self.round_traj) -1 else None
-            self.memory.push((state, action, next_state, total_reward))
+        with self.memory_lock:
+            for i in range(len(self.round_traj)):
+                state, action, reward = self.round_traj[i]
+                total_reward = reward + final_reward
+                next_state = self.round_traj[i + 1][0] if i < len(self.round_traj) -1 else None
+                self.memory.push((state, action, next_state, total_reward))
 
-        starting_state = self.round_traj[0][0]
-        self.bid_memory.push((starting_state, len(self.tricks)))
+            # In a resumed round the first stored state is mid-round, not the one the bid was made from
+            if not self.resumed:
+                starting_state = self.round_traj[0][0]
+                self.bid_memory.push((starting_state, len(self.tricks)))
 
         return score
 
     def get_epsilon(self) -> float:
         """Calculate current epsilon value for epsilon-greedy policy."""
+        if self.greedy:
+            return 0.0
         eps_threshold = max(self.eps_end + (self.eps_start - self.eps_end) * math.exp(-1. * self.games_played / self.eps_decay), self.eps_end)
         return eps_threshold
 
-    def get_obs(self, game_state: dict) -> torch.Tensor:
+    def get_obs(self, game_state: dict):
         """
-        Convert a global game_state from the environment to an observation including internal state.
+        Convert a global game_state from the environment to an observation including internal state:
+        a dense tensor, or a CardSetObs for set networks.
         """
-        obs_parts = []
-
-        # 1. Encode cards in hand (one-hot)
-        hand_encoding = torch.zeros(len(game.ALL_CARDS))
-        for card in self.hand.cards:
-            hand_encoding[card.id] = 1
-        obs_parts.append(hand_encoding)
-
-        # 2. Encode cards played in round (one-hot)
-        round_cards_encoding = torch.zeros(len(game.ALL_CARDS))
-        cards_played = game_state['cards_played']
-        round_cards_encoding[cards_played == 1] = 1
-        obs_parts.append(round_cards_encoding)
-
-        # 3. Encode cards played in current trick (one-hot)
-        trick_encoding = torch.zeros(len(game.ALL_CARDS))
-        current_trick = game_state['current_trick']
-        for _, card in current_trick.cards:
-            trick_encoding[card.id] = 1
-        obs_parts.append(trick_encoding)
-
-        # 4. Encode starting player flag
-        if game_state["starting_player"] == self.id:
-            obs_parts.append(torch.Tensor([1.0]))
-        else:
-            obs_parts.append(torch.Tensor([0.0]))
-
-        # 5. Encode player states
-        for i in range(4):  # For each possible player
-            # Encode bid (one-hot)
-            bid_encoding = torch.zeros(11)
-            if i < len(game_state['player_bets']):
-                bid = int(game_state['player_bets'][i])
-                if 0 <= bid <= 10:
-                    bid_encoding[bid] = 1
-            obs_parts.append(bid_encoding)
-
-            # Raw score (continuous value)
-            if i < len(game_state['player_scores']):
-                score = torch.tensor([game_state['player_scores'][i]], dtype=torch.float32)
-            else:
-                score = torch.tensor([0.0])
-            obs_parts.append(score)
-
-            # Encode tricks taken (one-hot)
-            tricks_encoding = torch.zeros(10)
-            if i < len(game_state['tricks_taken']):
-                tricks = int(game_state['tricks_taken'][i])
-                if 0 <= tricks <= 9:
-                    tricks_encoding[tricks] = 1
-            obs_parts.append(tricks_encoding)
+        if self.card_sets:
+            return encode_card_sets(self.hand, game_state, self.id, max_seats=self.max_seats)
+        return torch.from_numpy(encode_obs(self.hand, game_state, self.id, max_seats=self.max_seats))
 
-        # 6. Encode player id
-        id_encoding = torch.zeros(4)
-        id_encoding[self.id] = 1
-        obs_parts.append(id_encoding)
-
-        return torch.cat(obs_parts)
+    def _batch(self, observations: list):
+        """The network input for a list of observations from get_obs (or the replay memories)."""
+        if self.card_sets:
+            from skull_king.agents.set_networks import collate
+            return collate(observations)
+        return torch.stack([torch.as_tensor(s).float() for s in observations])
 
     @torch.no_grad()
     def bid(self, game_state: dict) -> int:
         """Make a bid prediction based on the current player's hand."""
         obs = self.get_obs(game_state)
-        bid_logits = self.bid_network(obs.unsqueeze(0))
-        bid_mask = torch.cat((torch.ones(game_state["current_round"] + 1), torch.zeros(10 - game_state["current_round"])))
-        masked_logits = bid_logits.masked_fill(bid_mask == 0, float('-inf'))
-        self.current_bid = masked_logits.argmax().item()
+        mask = bid_mask(game_state["current_round"])
+
+        def masked_logits() -> torch.Tensor:
+            bid_logits = self.bid_network(self._batch([obs]))
+            return bid_logits.masked_fill(torch.from_numpy(~mask), float('-inf'))
+
+        if self.bid_cache is not None:
+            logits = self.bid_cache.get(self.bid_network, obs, mask, masked_logits)
+        else:
+            logits = masked_logits()
+        self.current_bid = logits.argmax().item()
         return self.current_bid
 
+    def _action_probs(self, obs: torch.Tensor, legal_actions: torch.Tensor) -> torch.Tensor:
+        # Get action probabilities and mask invalid actions
+        logits: torch.Tensor = self.play_network(self._batch([obs]))
+
+        masked_logits = logits.masked_fill(legal_actions == 0, float('-inf'))
+        action_probs = torch.softmax(masked_logits, dim=-1)
+
+        if (action_probs.sum() > 0):
+            action_probs /= action_probs.sum()
+        else:
+            logger.error(f"Current hand: {self.hand}")
+            logger.error(f"Legal actions {legal_actions}")
+            logger.error(f"logits: {logits}")
+            logger.error(f"action_probs: {action_probs}")
+            raise ValueError("Invalid card chosen! See logs above for more information.")
+        return action_probs
+
     @torch.no_grad()
     def play(self, game_state: dict) -> int:
         """Play a card from the agent's hand, given the current global state and the agent's internal state."""
@@ -294,22 +358,16 @@ class RLAgent(BaseAgent):
 
         # Epsilon-greedy action selection
         if random.random() > self.get_epsilon():
-            # Get action probabilities and mask invalid actions
-            logits: torch.Tensor = self.play_network(obs.unsqueeze(0))
-
-            masked_logits = logits.masked_fill(legal_actions == 0, float('-inf'))
-            action_probs = torch.softmax(masked_logits, dim=-1)
-
-            if (action_probs.sum() > 0):
-                action_probs /= action_probs.sum()
+            if self.play_cache is not None:
+                action_probs = self.play_cache.get(self.play_network, obs, legal_actions.numpy(),
+                                                   lambda: self._action_probs(obs, legal_actions))
             else:
-                print(f"Current hand: {self.hand}")
-                print(f"Legal actions {legal_actions}")
-                print(f"logits: {logits}")
-                print(f"action_probs: {action_probs}")
-                raise ValueError("Invalid card chosen! See logs above for more information.")
+                action_probs = self._action_probs(obs, legal_actions)
 
-            action_id = torch.multinomial(action_probs, 1).item()
+            if self.greedy:
+                action_id = action_probs.argmax().item()
+            else:
+                action_id = torch.multinomial(action_probs, 1).item()
         else:
             # Random choice from legal actions
             choices = torch.nonzero(legal_actions).flatten()
@@ -326,6 +384,8 @@ class RLAgent(BaseAgent):
 
     def optimize(self, batch_size: int = None):
         """Perform one step of optimization on the Q-network."""
+        if self.inference_only:
+            raise RuntimeError("Cannot optimize an agent loaded from an inference-only export")
         if batch_size is None:
             batch_size = self.batch_size
 
@@ -333,30 +393,63 @@ class RLAgent(BaseAgent):
             return
 
         self.games_played += 1
-
-        transitions = self.memory.sample(batch_size)
-        batch = list(zip(*transitions))
-
-        state_batch = torch.stack([s.float() for s in batch[0]])
-        action_batch = torch.tensor([a for a in batch[1]], dtype=torch.long)
-        next_state_batch = torch.stack([s.float() for s in batch[2] if s is not None])
-        reward_batch = torch.tensor([r for r in batch[3]], dtype=torch.float32)
+        if METRICS.enabled:
+            optimize_start = time.perf_counter()
+
+        indices, weights = None, None
+        with self.memory_lock, METRICS.timer("replay_sample"):
+            if isinstance(self.memory, PackedReplayMemory):
+                # Packed memories unpack the whole batch into arrays at once
+                packed = self.memory.sample_batch(batch_size)
+            elif isinstance(self.memory, PrioritizedReplayMemory):
+                transitions, indices, weights = self.memory.sample_weighted(batch_size)
+                weights = torch.from_numpy(weights)
+            else:
+                transitions = self.memory.sample(batch_size)
+            if isinstance(self.bid_memory, PackedReplayMemory):
+                bid_packed = self.bid_memory.sample_batch(batch_size)
+            else:
+                bid_transitions = self.bid_memory.sample(batch_size)
+
+        if isinstance(self.memory, PackedReplayMemory):
+            state_batch = torch.from_numpy(packed["state"])
+            action_batch = torch.from_numpy(packed["action"])
+            non_terminal_mask = torch.from_numpy(packed["non_terminal"])
+            next_state_batch = torch.from_numpy(packed["next_state"])[non_terminal_mask]
+            reward_batch = torch.from_numpy(packed["reward"])
+        else:
+            batch = list(zip(*transitions))
+            state_batch = self._batch(batch[0])
+            action_batch = torch.tensor([a for a in batch[1]], dtype=torch.long)
+            next_states = [s for s in batch[2] if s is not None]
+            next_state_batch = self._batch(next_states) if next_states else []
+            reward_batch = torch.tensor([r for r in batch[3]], dtype=torch.float32)
+            non_terminal_mask = torch.tensor([s is not None for s in batch[2]], dtype=torch.bool)
 
         # Compute Q(s_t, a)
         state_action_values = self.play_network(state_batch).gather(1, action_batch.unsqueeze(1))
 
         # Compute V(s_{t+1}) for all next states
         next_state_values = torch.zeros(batch_size)
-        non_terminal_mask = torch.tensor([s is not None for s in batch[2]], dtype=torch.bool)
-        if len(next_state_batch) > 0:
+        if non_terminal_mask.any():
             next_state_values[non_terminal_mask] = self.target_network(next_state_batch).max(1)[0]
 
         # Compute the expected Q values
         expected_state_action_values = (next_state_values * self.gamma) + reward_batch
 
         # Compute loss
-        criterion = nn.SmoothL1Loss()
-        loss = criterion(state_action_values, expected_state_action_values.unsqueeze(1))
+        if weights is None:
+            criterion = nn.SmoothL1Loss()
+            loss = criterion(state_action_values, expected_state_action_values.unsqueeze(1))
+        else:
+            # Importance-sampling weighted loss, then refresh priorities from the new TD errors
+            criterion = nn.SmoothL1Loss(reduction='none')
+            elementwise_loss = criterion(state_action_values.squeeze(1), expected_state_action_values)
+            loss = (weights * elementwise_loss).mean()
+
+            td_errors = (state_action_values.squeeze(1) - expected_state_action_values).detach().abs()
+            with self.memory_lock:
+                self.memory.update_priorities(indices, td_errors.numpy())
 
         # Optimize the play network
         self.play_optimizer.zero_grad()
@@ -370,20 +463,21 @@ class RLAgent(BaseAgent):
             self.target_network.load_state_dict(self.play_network.state_dict())
 
         # Optimize bid network
-        bid_transitions = self.bid_memory.sample(batch_size)
-        bid_batch = list(zip(*bid_transitions))
-
-        bid_state_batch = torch.stack([s for s in bid_batch[0]])
-        bid_target_batch = torch.tensor([t for t in bid_batch[1]], dtype=torch.long)
+        if isinstance(self.bid_memory, PackedReplayMemory):
+            bid_state_batch = torch.from_numpy(bid_packed["state"])
+            bid_target_batch = torch.from_numpy(bid_packed["action"])
+        else:
+            bid_batch = list(zip(*bid_transitions))
+            bid_state_batch = self._batch(bid_batch[0])
+            bid_target_batch = torch.tensor([t for t in bid_batch[1]], dtype=torch.long)
 
         # Compute loss for bid network
         try:
             bid_output = self.bid_network(bid_state_batch)
             bid_loss = nn.CrossEntropyLoss()(bid_output, bid_target_batch)
-        except Exception as e:
-            print(str(e))
-            print(bid_state_batch)
-            print(bid_target_batch)
+        except Exception:
+            logger.exception(f"Bid network update failed on states {bid_state_batch} with targets {bid_target_batch}")
+            raise
 
         # Optimize the bid network
         self.bid_optimizer.zero_grad()
@@ -391,10 +485,13 @@ class RLAgent(BaseAgent):
         torch.nn.utils.clip_grad_norm_(self.bid_network.parameters(), max_norm=1.0)
         self.bid_optimizer.step()
 
-        if self.id == 3:
-            # with torch.no_grad():
-            #     print(f"[Agent {self.id}] Debug info:")
-            #     print(f"  Reward range: [{reward_batch.min():.2f}, {reward_batch.max():.2f}]")
-            #     print(f"  Q-value range: [{state_action_values.min():.2f}, {state_action_values.max():.2f}]")
-            #     print(f"  Target range: [{expected_state_action_values.min():.2f}, {expected_state_action_values.max():.2f}]")
-            print(f"  Losses: play loss = {loss}\tbid loss = {bid_loss}\t eps = {self.get_epsilon():.4f}")
+        if METRICS.enabled:
+            METRICS.observe(f"optimize/{type(self).__name__}", time.perf_counter() - optimize_start)
+            METRICS.count("learner_updates")
+            METRICS.gauge("replay_size", len(self.memory))
+            if getattr(self.memory, "capacity", None):
+                METRICS.gauge("replay_fill", len(self.memory) / self.memory.capacity)
+            METRICS.gauge("bid_replay_size", len(self.bid_memory))
+            METRICS.gauge(f"play_loss/{self.id}", loss.item())
+            METRICS.gauge(f"bid_loss/{self.id}", bid_loss.item())
+            METRICS.gauge(f"epsilon/{self.id}", self.get_epsilon())
@@ -0,0 +1,232 @@
+"""
+Bid and play networks that read an observation's card sections as sets of card ids.
+
+The first three sections of an observation (hand, cards played this round, current trick) are
+one-hot over every card. These networks take observations encoded by
+`skull_king.obs.encode_card_sets` instead: the card sections arrive as the ids that are present,
+and go through an nn.EmbeddingBag, which computes exactly what a Linear layer over the one-hot
+sections would. The remaining features keep a small Linear layer. `collate` batches CardSetObs
+into the flat ids and bag offsets EmbeddingBag consumes.
+
+This is a modelling option, not a speedup. The card sections are only 3 x 73 inputs and the
+first layer is a small share of each network's cost, so on CPU the id bookkeeping (encoding,
+collating, the EmbeddingBag call) costs more than the skipped zeros save: running this module
+benchmarks both families, and the set networks come out slower at batch 1 and 128. What they
+offer is a per-card embedding that other card-level models can build on.
+
+RLAgent encodes its observations this way whenever its networks are set networks (see
+`build_networks`). `from_dense` converts trained dense networks into identical set networks.
+"""
+import time
+from typing import Callable, NamedTuple, Sequence, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from skull_king.obs import N_CARDS, CardSetObs, encode_card_sets, encode_obs
+
+N_CARD_SECTIONS = 3  # hand, cards played, current trick
+
+
+class CardSets(NamedTuple):
+    """A batch of CardSetObs: every row's ids concatenated, where each row's ids start, and the features."""
+    ids: torch.Tensor
+    offsets: torch.Tensor
+    features: torch.Tensor
+
+
+def collate(observations: Sequence[CardSetObs]) -> CardSets:
+    counts = np.array([len(obs.ids) for obs in observations], dtype=np.int64)
+    return CardSets(torch.from_numpy(np.concatenate([obs.ids for obs in observations])),
+                    torch.from_numpy(np.cumsum(counts) - counts),
+                    torch.from_numpy(np.stack([obs.features for obs in observations])))
+
+
+def card_sets_from_dense(x: torch.Tensor) -> CardSets:
+    """The CardSets of a batch of dense observations, e.g. to compare against dense networks."""
+    rows, ids = x[:, :N_CARD_SECTIONS * N_CARDS].nonzero(as_tuple=True)  # row-major, so each row's ids are contiguous
+    counts = torch.bincount(rows, minlength=x.shape[0])
+    return CardSets(ids, torch.cumsum(counts, 0) - counts, x[:, N_CARD_SECTIONS * N_CARDS:].contiguous())
+
+
+class CardSetEncoder(nn.Module):
+    """Equivalent of nn.Linear(n_obs, out_features) over dense observations, for CardSets batches."""
+    def __init__(self, n_obs: int, out_features: int) -> None:
+        super().__init__()
+        self.n_card_features = N_CARD_SECTIONS * N_CARDS
+        self.cards = nn.EmbeddingBag(self.n_card_features, out_features, mode="sum")
+        self.dense = nn.Linear(n_obs - self.n_card_features, out_features)
+
+    def forward(self, x: CardSets):
+        # The card sections are exactly 0/1, so summing the embeddings of the ids present
+        # is the same as multiplying them by the one-hot sections
+        return self.dense(x.features) + self.cards(x.ids, x.offsets)
+
+    def load_dense(self, linear: nn.Linear) -> None:
+        """Take over the weights of a dense first layer."""
+        with torch.no_grad():
+            self.cards.weight.copy_(linear.weight[:, :self.n_card_features].T)
+            self.dense.weight.copy_(linear.weight[:, self.n_card_features:])
+            self.dense.bias.copy_(linear.bias)
+
+
+class _SetNetwork(nn.Module):
+    # RLAgent checks this to encode its observations with encode_card_sets
+    takes_card_sets = True
+
+    def forward(self, x: CardSets):
+        return self.main(self.encoder(x))
+
+    @classmethod
+    def from_dense(cls, network: nn.Module, *args) -> "_SetNetwork":
+        """Build the set network computing the same function as a BidNetwork or PlayNetwork."""
+        first = network.main[0]
+        set_network = cls(first.in_features, *args)
+        set_network.encoder.load_dense(first)
+        set_network.main.load_state_dict(nn.Sequential(*list(network.main)[1:]).state_dict())
+        return set_network
+
+
+class SetBidNetwork(_SetNetwork):
+    def __init__(self, n_obs: int) -> None:
+        super().__init__()
+
+        self.encoder = CardSetEncoder(n_obs, 128)
+        self.main = nn.Sequential(
+            nn.ReLU(),
+            nn.Linear(128, 128),
+            nn.ReLU(),
+            nn.Linear(128, 11),
+            nn.Softmax(dim=-1)
+        )
+
+
+class SetPlayNetwork(_SetNetwork):
+    def __init__(self, n_obs: int, n_actions: int) -> None:
+        super().__init__()
+
+        self.encoder = CardSetEncoder(n_obs, 512)
+        self.main = nn.Sequential(
+            nn.ReLU(),
+            nn.Linear(512, 512),
+            nn.ReLU(),
+            nn.Linear(512, 512),
+            nn.ReLU(),
+            nn.Linear(512, n_actions)
+        )
+
+
+def build_networks(kind: str, n_obs: int, n_actions: int = N_CARDS) -> dict:
+    """RLAgent keyword arguments for a fresh set of `kind` ("dense" or "set") networks."""
+    if kind == "dense":
+        return {}  # RLAgent's defaults
+    if kind != "set":
+        raise ValueError(f"Unknown network kind {kind!r}, expected 'dense' or 'set'")
+
+    play_network = SetPlayNetwork(n_obs, n_actions)
+    target_network = SetPlayNetwork(n_obs, n_actions)
+    target_network.load_state_dict(play_network.state_dict())
+    return {
+        "bid_network": SetBidNetwork(n_obs),
+        "play_network": play_network,
+        "target_network": target_network,
+    }
+
+
+def count_parameters(network: nn.Module) -> int:
+    return sum(p.numel() for p in network.parameters())
+
+
+def time_forward_backward(network: nn.Module, rows: list, batch: Callable[[list], object], iters: int = 100):
+    """Median forward-only and forward+backward milliseconds for `rows`, including batching them with `batch`."""
+    forward, backward = [], []
+    for _ in range(iters):
+        start = time.perf_counter()
+        with torch.no_grad():
+            network(batch(rows))
+        forward.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        network(batch(rows)).sum().backward()
+        backward.append(time.perf_counter() - start)
+    network.zero_grad()
+    forward.sort()
+    backward.sort()
+    return forward[len(forward) // 2] * 1000, backward[len(backward) // 2] * 1000
+
+
+def time_encoding(n_games: int = 5, seed: int = 0) -> Tuple[float, float]:
+    """Mean microseconds per play decision of encode_obs and encode_card_sets, over random games."""
+    import random
+
+    from skull_king.env import SkullKingGame
+
+    random.seed(seed)
+    np.random.seed(seed)
+    seconds = [0.0, 0.0]
+    decisions = 0
+
+    class Recorder:
+        def before_play(self, player_id, player, state):
+            nonlocal decisions
+            for i, encode in enumerate((encode_obs, encode_card_sets)):
+                start = time.perf_counter()
+                encode(player.hand, state, player_id)
+                seconds[i] += time.perf_counter() - start
+            decisions += 1
+
+        def __getattr__(self, name):
+            return lambda *args: None
+
+    env = SkullKingGame(n_manual=0, n_random=4)
+    env.recorder = Recorder()
+    for _ in range(n_games):
+        env.play_game()
+        env.reset_game()
+    return seconds[0] / decisions * 1e6, seconds[1] / decisions * 1e6
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    from skull_king.agents.inference import collect_states
+    from skull_king.agents.rl_agent import RLAgent
+
+    parser = ArgumentParser(description="Compare the cost of set-encoder networks with the dense networks")
+    parser.add_argument("-f", "--checkpoint-filepath", type=str, default=None,
+                        help="RLAgent checkpoint to convert (default: freshly initialized networks)")
+    parser.add_argument("--games", type=int, default=20, help="Games to collect observations from")
+    parser.add_argument("--iters", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=None)
+
+    args = parser.parse_args()
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    dense_us, set_us = time_encoding()
+    print(f"encoding per decision: encode_obs {dense_us:.1f} us, encode_card_sets {set_us:.1f} us")
+
+    agent = RLAgent(0)
+    if args.checkpoint_filepath is not None:
+        agent.load(args.checkpoint_filepath)
+    play_states = collect_states(args.games)["play_states"]
+    # Each decision as RLAgent stores it for either kind of network
+    dense_rows = list(play_states)
+    set_rows = [CardSetObs(np.flatnonzero(row[:N_CARD_SECTIONS * N_CARDS].numpy()),
+                           row[N_CARD_SECTIONS * N_CARDS:].numpy()) for row in play_states]
+
+    pairs = [
+        ("bid", agent.bid_network, SetBidNetwork.from_dense(agent.bid_network)),
+        ("play", agent.play_network, SetPlayNetwork.from_dense(agent.play_network, N_CARDS)),
+    ]
+    for name, dense, sparse in pairs:
+        with torch.no_grad():
+            max_diff = (dense(play_states) - sparse(collate(set_rows))).abs().max().item()
+        print(f"{name} network: {count_parameters(dense)} dense vs {count_parameters(sparse)} set parameters, "
+              f"max output difference {max_diff:.2e}")
+        for batch_size in (1, 128):
+            dense_ms = time_forward_backward(dense, dense_rows[:batch_size], torch.stack, args.iters)
+            set_ms = time_forward_backward(sparse, set_rows[:batch_size], collate, args.iters)
+            print(f"  batch {batch_size:>3}: forward {dense_ms[0]:.3f} -> {set_ms[0]:.3f} ms, "
+                  f"forward+backward {dense_ms[1]:.3f} -> {set_ms[1]:.3f} ms")
@@ -0,0 +1,81 @@
+"""
+Batched serving of network calls made by games running on threads.
+
+Agents call their networks one observation at a time, from inside the environment's loop. When
+several games run at once on threads, a `BatchingServer` collects those calls and serves them
+together, so each forward pass covers one decision from every waiting game instead of one.
+"""
+import threading
+import time
+from typing import Dict, Hashable, List
+
+
+class _Request:
+    __slots__ = ("group", "payload", "output")
+
+    def __init__(self, group, payload) -> None:
+        self.group = group
+        self.payload = payload
+        self.output = None
+
+
+class BatchingServer:
+    """
+    Serves requests from `n_clients` threads in batches.
+
+    A request blocks until every client still running is blocked on the server too (or
+    `max_wait` seconds pass, so a client busy with something else doesn't stall the others);
+    then the pending requests are split by group and each group is served by one `_serve` call.
+    Clients call `leave` when they are done.
+    """
+    def __init__(self, n_clients: int, max_wait: float = 0.002) -> None:
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._pending: List[_Request] = []
+        self._active = n_clients
+
+        self.started = time.perf_counter()
+        self.decisions = 0
+        self.batches = 0
+        self.compute_seconds = 0.0
+
+    def _serve(self, group: Hashable, payloads: list) -> list:
+        """One output per payload, all from the same group."""
+        raise NotImplementedError
+
+    def leave(self) -> None:
+        with self._cond:
+            self._active -= 1
+            if self._pending and len(self._pending) >= self._active:
+                self._flush()
+
+    def submit(self, group: Hashable, payload):
+        request = _Request(group, payload)
+        with self._cond:
+            self._pending.append(request)
+            if len(self._pending) >= self._active:
+                self._flush()
+            while request.output is None:
+                if not self._cond.wait(timeout=self.max_wait) and request.output is None:
+                    self._flush()
+        return request.output
+
+    def _flush(self) -> None:
+        # Called with the condition held
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        start = time.perf_counter()
+        groups: Dict[Hashable, List[_Request]] = {}
+        for request in pending:
+            groups.setdefault(request.group, []).append(request)
+        try:
+            for group, requests in groups.items():
+                outputs = self._serve(group, [request.payload for request in requests])
+                for request, output in zip(requests, outputs):
+                    request.output = output
+                self.batches += 1
+        finally:
+            self.decisions += len(pending)
+            self.compute_seconds += time.perf_counter() - start
+            self._cond.notify_all()
@@ -0,0 +1,127 @@
+"""
+Background checkpointing of a full, resumable training state.
+
+A checkpoint holds every RL agent's networks, optimizers and games_played (which drives epsilon),
+the contents of the shared replay memories (or, for on-disk memories, where to find them), the
+RNG states and the trainer's progress. The state is snapshotted on the training thread, which
+only copies tensors, and written out by a background thread to a temporary file that is then
+atomically renamed, so an interrupted save never leaves a corrupt checkpoint behind.
+"""
+import glob
+import logging
+import os
+import random
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+
+def training_state(game, progress: dict = None) -> dict:
+    """Snapshot the resumable training state of every RLAgent seat in `game`."""
+    from skull_king.agents import RLAgent
+
+    agents = {}
+    memories = {}
+    for player in game.players:
+        if isinstance(player, RLAgent):
+            agents[player.id] = player.training_state()
+            # Replay memories are usually shared between seats, so only store each one once
+            for memory in (player.memory, player.bid_memory):
+                if id(memory) not in memories:
+                    memories[id(memory)] = memory.state_dict()
+            agents[player.id]['memory'] = id(player.memory)
+            agents[player.id]['bid_memory'] = id(player.bid_memory)
+
+    return {
+        "agents": agents,
+        "memories": memories,
+        "rng": {
+            "random": random.getstate(),
+            "numpy": np.random.get_state(),
+            "torch": torch.get_rng_state(),
+        },
+        "player_scores": game.player_scores.copy(),
+        "progress": progress or {},
+    }
+
+
+def restore_training_state(game, state: dict) -> dict:
+    """Restore a snapshot taken by `training_state` into `game`'s RLAgent seats and return its progress."""
+    restored = set()
+    for player in game.players:
+        if player.id not in state["agents"]:
+            continue
+        agent_state = state["agents"][player.id]
+        player.load_training_state(agent_state)
+        for memory, key in ((player.memory, agent_state['memory']), (player.bid_memory, agent_state['bid_memory'])):
+            if id(memory) not in restored:
+                memory.load_state_dict(state["memories"][key])
+                restored.add(id(memory))
+
+    random.setstate(state["rng"]["random"])
+    np.random.set_state(state["rng"]["numpy"])
+    torch.set_rng_state(state["rng"]["torch"])
+    game.player_scores = state["player_scores"].copy()
+    return state["progress"]
+
+
+class CheckpointManager:
+    """
+    Writes checkpoints named `checkpoint_{step}.pt` into `directory` from a background thread,
+    keeping only the `keep_last` most recent ones.
+    """
+    def __init__(self, directory: str, keep_last: int = 3) -> None:
+        if keep_last < 1:
+            # Keeping none would delete each checkpoint as soon as it is written
+            raise ValueError(f"keep_last must be at least 1, got {keep_last}")
+        self.directory = directory
+        self.keep_last = keep_last
+        os.makedirs(directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self._pending: Future = None
+
+    def _path(self, step: int) -> str:
+        return os.path.join(self.directory, f"checkpoint_{step:08d}.pt")
+
+    def checkpoints(self):
+        """Completed checkpoints, oldest first."""
+        paths = glob.glob(os.path.join(self.directory, "checkpoint_*.pt"))
+        return sorted(p for p in paths if re.fullmatch(r"checkpoint_\d+\.pt", os.path.basename(p)))
+
+    def _write(self, state: dict, step: int) -> str:
+        path = self._path(step)
+        tmp_path = path + ".tmp"
+        torch.save(state, tmp_path)
+        os.replace(tmp_path, path)
+
+        for old_path in self.checkpoints()[:-self.keep_last]:
+            os.remove(old_path)
+        return path
+
+    def save_async(self, state: dict, step: int) -> bool:
+        """
+        Queue `state` (which must already be a snapshot, e.g. from `training_state`) to be written.
+        Training never waits on the disk: if the previous checkpoint is still being written, this
+        one is skipped and False is returned.
+        """
+        if self._pending is not None and not self._pending.done():
+            logging.warning(f"Previous checkpoint still being written, skipping checkpoint at step {step}")
+            return False
+        if self._pending is not None:
+            self._pending.result()  # surface errors from the previous save
+        self._pending = self._executor.submit(self._write, state, step)
+        return True
+
+    def wait(self) -> None:
+        """Block until the checkpoint being written, if any, is on disk."""
+        if self._pending is not None:
+            self._pending.result()
+
+    def load_latest(self) -> dict:
+        paths = self.checkpoints()
+        if not paths:
+            return None
+        logging.info(f"Resuming from {paths[-1]}")
+        return torch.load(paths[-1], weights_only=False)
@@ -0,0 +1,344 @@
+"""
+Offline self-play datasets.
+
+`generate_dataset` plays self-play games with any mix of registered agents across a process pool
+and writes every decision to sharded .npz files described by a manifest.json:
+
+    play transitions: obs, legal (action mask), action (card id), reward, done
+    bid samples:      bid_obs, bid (what was bid), bid_label (tricks then taken), bid_round
+
+Rewards follow RLAgent's shaping (per-trick rewards plus the round score spread over the round's
+decisions), so the corpus can be trained on exactly like RLAgent's own replay. A player's
+transitions within a round are stored contiguously and never split across shards, so the next
+state of a transition that isn't `done` is simply the next row.
+
+`DatasetStream` reads a dataset back a few shards at a time, shuffled, and has the `sample`/`len`
+interface of the replay memories, so `RLAgent.optimize` can train from it directly (see `pretrain`).
+"""
+import glob
+import json
+import multiprocessing
+import os
+import random
+import sys
+from typing import List
+
+import numpy as np
+
+from skull_king import game
+from skull_king.agents import BaseAgent, build_agents
+from skull_king.obs import MAX_SEATS, encode_obs, trick_reward
+
+MANIFEST = "manifest.json"
+
+
+class TransitionRecorder:
+    """
+    Records every player's decisions from a SkullKingGame (set as `game.recorder`). Finished rounds
+    accumulate in `play_rows` and `bid_rows` until collected with `take`.
+    """
+    def __init__(self, n_players: int, max_seats: int = None) -> None:
+        """Observations are encoded like those of RLAgents with `max_seats` (see encode_obs)."""
+        self.n_players = n_players
+        self.max_seats = max_seats
+        self.play_rows = []  # (obs, legal, action, reward, done)
+        self.bid_rows = []  # (obs, bid, tricks taken, round)
+        self._start_round()
+
+    def _start_round(self) -> None:
+        self._trajectories = [[] for _ in range(self.n_players)]  # [obs, legal, action, reward]
+        self._bids = [None] * self.n_players
+        self._tricks = np.zeros(self.n_players, dtype=int)
+
+    def on_bid(self, player_id: int, player: BaseAgent, state: dict, bid: int) -> None:
+        obs = encode_obs(player.hand, state, player_id, self.n_players, self.max_seats)
+        self._bids[player_id] = (obs, int(bid), state["current_round"])
+
+    def before_play(self, player_id: int, player: BaseAgent, state: dict) -> None:
+        obs = encode_obs(player.hand, state, player_id, self.n_players, self.max_seats)
+        legal = player._get_legal_actions(state).astype(bool)
+        self._trajectories[player_id].append([obs, legal, -1, 0.0])
+
+    def after_play(self, player_id: int, card: game.Card) -> None:
+        self._trajectories[player_id][-1][2] = card.id
+
+    def on_trick(self, winner_id: int, trick: game.Trick) -> None:
+        if winner_id is None:
+            return  # Kraken: nobody wins the trick
+        self._tricks[winner_id] += 1
+        bid = self._bids[winner_id][1]
+        self._trajectories[winner_id][-1][3] = trick_reward(bid, self._tricks[winner_id], trick.bonus_points)
+
+    def on_round_scored(self, round_scores: np.ndarray) -> None:
+        for player_id, trajectory in enumerate(self._trajectories):
+            final_reward = round_scores[player_id] / len(trajectory) / 10
+            for i, (obs, legal, action, reward) in enumerate(trajectory):
+                self.play_rows.append((obs, legal, action, reward + final_reward, i == len(trajectory) - 1))
+
+            obs, bid, round_number = self._bids[player_id]
+            self.bid_rows.append((obs, bid, self._tricks[player_id], round_number))
+        self._start_round()
+
+    def take(self):
+        rows = self.play_rows, self.bid_rows
+        self.play_rows, self.bid_rows = [], []
+        return rows
+
+
+class ShardWriter:
+    """Writes whole rounds of rows into shards of at most `shard_size` play transitions."""
+    def __init__(self, directory: str, prefix: str, shard_size: int) -> None:
+        self.directory = directory
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.shards = []
+        self._play_rows = []
+        self._bid_rows = []
+
+    def add(self, play_rows: list, bid_rows: list) -> None:
+        if self._play_rows and len(self._play_rows) + len(play_rows) > self.shard_size:
+            self.flush()
+        self._play_rows.extend(play_rows)
+        self._bid_rows.extend(bid_rows)
+
+    def flush(self) -> None:
+        if not self._play_rows:
+            return
+        filename = f"{self.prefix}_{len(self.shards):05d}.npz"
+        play = list(zip(*self._play_rows))
+        bids = list(zip(*self._bid_rows))
+        np.savez(os.path.join(self.directory, filename),
+                 obs=np.stack(play[0]).astype(np.float32),
+                 legal=np.stack(play[1]),
+                 action=np.array(play[2], dtype=np.int8),
+                 reward=np.array(play[3], dtype=np.float32),
+                 done=np.array(play[4], dtype=bool),
+                 bid_obs=np.stack(bids[0]).astype(np.float32),
+                 bid=np.array(bids[1], dtype=np.int8),
+                 bid_label=np.array(bids[2], dtype=np.int8),
+                 bid_round=np.array(bids[3], dtype=np.int8))
+        self.shards.append({"file": filename, "n_play": len(self._play_rows), "n_bid": len(self._bid_rows),
+                            "obs_size": len(self._play_rows[0][0])})
+        self._play_rows, self._bid_rows = [], []
+
+
+def _generate_worker(directory: str, worker_id: int, agent_specs: List[str], n_games: int,
+                     shard_size: int, seed: int, max_seats: int) -> List[dict]:
+    from skull_king.env import SkullKingGame
+
+    env = SkullKingGame(n_manual=0, n_random=len(agent_specs), n_rl=0)
+    env.players = build_agents(agent_specs)
+    env.recorder = recorder = TransitionRecorder(env.n_players, max_seats)
+
+    random.seed(seed)
+    np.random.seed(seed)
+    if "torch" in sys.modules:
+        sys.modules["torch"].manual_seed(seed)
+
+    writer = ShardWriter(directory, f"shard_{worker_id:03d}", shard_size)
+    for _ in range(n_games):
+        for i in range(1, env.n_rounds + 1):
+            env.round = i
+            env.play_round()
+            env.player_scores += env.score_round()
+            env.cleanup_round()
+            writer.add(*recorder.take())
+        env.reset_game()
+    writer.flush()
+    return writer.shards
+
+
+def generate_dataset(directory: str,
+                     agent_specs: List[str],
+                     n_games: int,
+                     n_workers: int = None,
+                     shard_size: int = 50000,
+                     seed: int = 0,
+                     max_seats: int = None) -> dict:
+    """
+    Play `n_games` games between `agent_specs` (see `skull_king.agents.build_agents`), split
+    across `n_workers` processes (default: one per core), and write the transitions into
+    `directory`. Observations are those of RLAgents with `max_seats`, which defaults to MAX_SEATS
+    for tables other than 4 players, as in train.py. Returns the manifest.
+    """
+    if max_seats is None and len(agent_specs) != 4:
+        max_seats = MAX_SEATS
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "shard_*.npz")):
+        os.remove(path)
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    n_workers = max(1, min(n_workers, n_games))
+    games_per_worker = [n_games // n_workers + (i < n_games % n_workers) for i in range(n_workers)]
+    tasks = [(directory, i, agent_specs, games_per_worker[i], shard_size, seed + i, max_seats)
+             for i in range(n_workers)]
+
+    if n_workers == 1:
+        results = [_generate_worker(*tasks[0])]
+    else:
+        with multiprocessing.get_context("spawn").Pool(n_workers) as pool:
+            results = pool.starmap(_generate_worker, tasks)
+
+    shards = [shard for worker_shards in results for shard in worker_shards]
+    manifest = {
+        "agents": list(agent_specs),
+        "n_games": n_games,
+        "seed": seed,
+        # The size of the observations actually recorded (see TransitionRecorder)
+        "obs_size": shards[0]["obs_size"] if shards else None,
+        "max_seats": max_seats,
+        "shard_size": shard_size,
+        "n_play": sum(s["n_play"] for s in shards),
+        "n_bid": sum(s["n_bid"] for s in shards),
+        "shards": shards,
+    }
+    with open(os.path.join(directory, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(directory: str) -> dict:
+    with open(os.path.join(directory, MANIFEST)) as f:
+        return json.load(f)
+
+
+class DatasetStream:
+    """
+    Shuffled, endless stream of play transitions (`kind="play"`) or bid samples (`kind="bid"`) from
+    a dataset. Only `shuffle_shards` shards are loaded at a time: each pass visits the shards in a
+    new random order, and rows are shuffled across the shards loaded together.
+    """
+    def __init__(self, directory: str, kind: str = "play", shuffle_shards: int = 4, seed: int = None) -> None:
+        if kind not in ("play", "bid"):
+            raise ValueError(f"Unknown kind {kind!r}, expected 'play' or 'bid'")
+        self.directory = directory
+        self.kind = kind
+        self.shuffle_shards = shuffle_shards
+        self.manifest = load_manifest(directory)
+        self.shards = [s for s in self.manifest["shards"] if s[f"n_{kind}"] > 0]
+        self.rng = np.random.default_rng(seed)
+        self.epoch = 0
+
+        self._order = []
+        self._arrays = None
+        self._perm = np.zeros(0, dtype=int)
+        self._cursor = 0
+
+    def __len__(self) -> int:
+        return self.manifest[f"n_{self.kind}"]
+
+    def _load_shard(self, shard: dict) -> dict:
+        with np.load(os.path.join(self.directory, shard["file"])) as data:
+            if self.kind == "bid":
+                return {k: data[k] for k in ("bid_obs", "bid", "bid_label", "bid_round")}
+            arrays = {k: data[k] for k in ("obs", "legal", "action", "reward", "done")}
+        # Rows of a trajectory are contiguous, so the next state is the next row unless done
+        arrays["next_index"] = np.where(arrays["done"], -1, np.arange(len(arrays["done"])) + 1)
+        return arrays
+
+    def _load_group(self) -> None:
+        if not self._order:
+            self._order = list(self.rng.permutation(len(self.shards)))
+            self.epoch += 1
+        group, self._order = self._order[:self.shuffle_shards], self._order[self.shuffle_shards:]
+
+        parts = [self._load_shard(self.shards[i]) for i in group]
+        if self.kind == "play":
+            offset = 0
+            for part in parts:
+                part["next_index"][part["next_index"] >= 0] += offset
+                offset += len(part["done"])
+        self._arrays = {k: np.concatenate([part[k] for part in parts]) for k in parts[0]}
+        self._perm = self.rng.permutation(len(next(iter(self._arrays.values()))))
+        self._cursor = 0
+
+    def sample_arrays(self, batch_size: int) -> dict:
+        """The next `batch_size` rows, as a dict of arrays (plus `next_obs` for play transitions)."""
+        if len(self) == 0:
+            raise ValueError(f"Dataset {self.directory} has no {self.kind} rows")
+        chunks = []
+        n = 0
+        while n < batch_size:
+            if self._cursor >= len(self._perm):
+                self._load_group()
+            take = self._perm[self._cursor:self._cursor + batch_size - n]
+            self._cursor += len(take)
+            n += len(take)
+            chunk = {k: v[take] for k, v in self._arrays.items() if k != "next_index"}
+            if self.kind == "play":
+                next_index = self._arrays["next_index"][take]
+                chunk["next_obs"] = self._arrays["obs"][np.maximum(next_index, 0)]
+            chunks.append(chunk)
+        return {k: np.concatenate([c[k] for c in chunks]) for k in chunks[0]}
+
+    def sample(self, batch_size: int) -> list:
+        """The next `batch_size` rows in replay memory form, as consumed by RLAgent.optimize."""
+        batch = self.sample_arrays(batch_size)
+        if self.kind == "bid":
+            return list(zip(batch["bid_obs"], batch["bid_label"].astype(int)))
+        return [(obs, int(action), None if done else next_obs, float(reward))
+                for obs, action, next_obs, reward, done
+                in zip(batch["obs"], batch["action"], batch["next_obs"], batch["reward"], batch["done"])]
+
+
+def pretrain(agent, directory: str, n_updates: int, shuffle_shards: int = 4, seed: int = None) -> None:
+    """
+    Run `n_updates` of `agent.optimize()` on a dataset instead of the agent's own replay memories.
+    The agent must read the dataset's observation layout: dense networks with its `max_seats`.
+    """
+    max_seats = load_manifest(directory).get("max_seats")
+    if agent.max_seats != max_seats or agent.card_sets:
+        raise ValueError(f"{directory} holds dense observations for max_seats={max_seats}, which this agent "
+                         f"(max_seats={agent.max_seats}, {agent.network_kind} networks) can't train on")
+    memories = agent.memory, agent.bid_memory
+    agent.memory = DatasetStream(directory, "play", shuffle_shards, seed)
+    agent.bid_memory = DatasetStream(directory, "bid", shuffle_shards, None if seed is None else seed + 1)
+    try:
+        for _ in range(n_updates):
+            agent.optimize()
+    finally:
+        agent.memory, agent.bid_memory = memories
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Generate offline self-play datasets and pretrain agents on them")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate")
+    generate_parser.add_argument("directory", type=str)
+    generate_parser.add_argument("--agents", nargs="+", default=["random"] * 4,
+                                 help='One spec per seat, e.g. random rl:local/player_3.torch numpy_rl:policy.npz')
+    generate_parser.add_argument("--games", type=int, default=1000)
+    generate_parser.add_argument("--workers", type=int, default=None)
+    generate_parser.add_argument("--shard-size", type=int, default=50000, help="Play transitions per shard")
+    generate_parser.add_argument("--seed", type=int, default=0)
+    generate_parser.add_argument("--max-seats", type=int, default=None,
+                                 help="Record seat-relative observations padded to this many seats "
+                                      "(default: 8 for tables other than 4 players)")
+
+    pretrain_parser = subparsers.add_parser("pretrain")
+    pretrain_parser.add_argument("directory", type=str)
+    pretrain_parser.add_argument("output", type=str, help="Where to save the trained RLAgent checkpoint")
+    pretrain_parser.add_argument("--updates", type=int, default=10000)
+    pretrain_parser.add_argument("--checkpoint", type=str, default=None, help="RLAgent checkpoint to start from")
+    pretrain_parser.add_argument("--shuffle-shards", type=int, default=4)
+    pretrain_parser.add_argument("--seed", type=int, default=None)
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        manifest = generate_dataset(args.directory, args.agents, args.games, args.workers, args.shard_size, args.seed,
+                                    args.max_seats)
+        print(f"Wrote {manifest['n_play']} play transitions and {manifest['n_bid']} bids "
+              f"in {len(manifest['shards'])} shards to {args.directory}")
+    else:
+        from skull_king.agents import RLAgent
+
+        # Pretrain on the observation layout the dataset was recorded with
+        agent = RLAgent(0, max_seats=load_manifest(args.directory).get("max_seats"))
+        if args.checkpoint is not None:
+            agent.load(args.checkpoint)
+        pretrain(agent, args.directory, args.updates, args.shuffle_shards, args.seed)
+        agent.save(args.output)
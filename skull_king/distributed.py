@@ -0,0 +1,201 @@
+"""
+Actor-learner training across processes.
+
+Actor processes play full games with a CPU copy of the policy, which may lag behind the learner,
+and send each finished round's transitions to the learner over a queue. The learner process
+trains continuously on everything it has received. Every `publish_interval` updates it copies its
+weights into networks held in shared memory and bumps a version counter, and actors reload at the
+next round boundary when they see a new version.
+"""
+import logging
+import os
+import queue
+import time
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from skull_king import game
+from skull_king.agents import RLAgent
+from skull_king.agents.rl_agent import BidNetwork, PlayNetwork
+
+
+class _OutboxMemory:
+    """Stands in for an actor's replay memories and collects transitions until the round ends."""
+    def __init__(self) -> None:
+        self.items = []
+
+    def push(self, x):
+        # Tensors are sent as numpy arrays, which pickle far more cheaply through a queue
+        self.items.append(tuple(v.numpy() if isinstance(v, torch.Tensor) else v for v in x))
+
+    def drain(self):
+        items, self.items = self.items, []
+        return items
+
+    def __len__(self):
+        return len(self.items)
+
+
+class SharedPolicy:
+    """A play/bid network pair in shared memory, plus the version and learner state actors need."""
+    def __init__(self, n_obs: int, ctx=mp) -> None:
+        self.play_network = PlayNetwork(n_obs, len(game.ALL_CARDS)).share_memory()
+        self.bid_network = BidNetwork(n_obs).share_memory()
+        self.version = ctx.Value("q", 0)
+        self.games_played = ctx.Value("q", 0)  # drives epsilon in the actors
+        self.lock = ctx.Lock()
+
+    def publish(self, agent: RLAgent) -> None:
+        with self.lock:
+            self.play_network.load_state_dict(agent.play_network.state_dict())
+            self.bid_network.load_state_dict(agent.bid_network.state_dict())
+            self.games_played.value = agent.games_played
+            self.version.value += 1
+
+    def pull(self, agent: RLAgent) -> int:
+        """Copy the published weights into `agent`'s networks and return their version."""
+        with self.lock:
+            agent.play_network.load_state_dict(self.play_network.state_dict())
+            agent.bid_network.load_state_dict(self.bid_network.state_dict())
+            agent.games_played = self.games_played.value
+            return self.version.value
+
+
+def _actor_main(actor_id: int, policy: SharedPolicy, transitions: mp.Queue, stop, n_rl: int, n_players: int,
+                max_seats: int, seed: int) -> None:
+    # Imported here so the spawned process doesn't need the caller's globals
+    from skull_king.env import SkullKingGame
+
+    torch.set_num_threads(1)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    env = SkullKingGame(n_manual=0, n_random=n_players - n_rl, n_rl=n_rl, max_seats=max_seats)
+    play_memory, bid_memory = _OutboxMemory(), _OutboxMemory()
+
+    # All RL seats in an actor share one local policy copy
+    rl_agents = [player for player in env.players if isinstance(player, RLAgent)]
+    policy_agent = rl_agents[0]
+    for agent in rl_agents:
+        agent.memory = play_memory
+        agent.bid_memory = bid_memory
+        agent.play_network = policy_agent.play_network
+        agent.bid_network = policy_agent.bid_network
+
+    def sync() -> int:
+        version = policy.pull(policy_agent)
+        for agent in rl_agents:
+            agent.games_played = policy_agent.games_played
+        return version
+
+    version = sync()
+    while not stop.is_set():
+        for i in range(1, env.n_rounds + 1):
+            env.round = i
+            env.play_round()
+            env.player_scores += env.score_round()
+            env.cleanup_round()
+
+            message = (actor_id, version, play_memory.drain(), bid_memory.drain())
+            while not stop.is_set():
+                try:
+                    transitions.put(message, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+            if policy.version.value != version:
+                version = sync()
+            if stop.is_set():
+                break
+        env.reset_game()
+
+
+def train_actor_learner(learner: RLAgent,
+                        n_actors: int = None,
+                        n_rl: int = 4,
+                        n_players: int = 4,
+                        max_updates: int = 10000,
+                        publish_interval: int = 10,
+                        report_interval: float = 10.0,
+                        seed: int = 0) -> dict:
+    """
+    Train `learner` with `n_actors` actor processes (default: one per spare core) until it has made
+    `max_updates` optimization steps. Actors play `n_players` seat games, `n_rl` of them with the
+    learner's policy and observation layout. Returns the final throughput statistics.
+    """
+    if not 0 < n_rl <= n_players:
+        raise ValueError(f"Can't seat {n_rl} RL agents at a {n_players} player table")
+    if learner.card_sets:
+        raise ValueError("Actors share dense networks with the learner, so set networks can't be trained this way")
+    n_cores = os.cpu_count() or 1
+    if n_actors is None:
+        n_actors = max(1, n_cores - 1)
+    torch.set_num_threads(max(1, n_cores - n_actors))
+
+    ctx = mp.get_context("spawn")
+    policy = SharedPolicy(learner._get_obs_size(), ctx)
+    policy.publish(learner)
+    transitions = ctx.Queue(maxsize=64 * n_actors)
+    stop = ctx.Event()
+
+    actors = [ctx.Process(target=_actor_main, args=(i, policy, transitions, stop, n_rl, n_players, learner.max_seats, seed + i), daemon=True)
+              for i in range(n_actors)]
+    for actor in actors:
+        actor.start()
+
+    stats = {}
+    updates = 0
+    window_start = time.perf_counter()
+    window_steps, window_updates, window_lags = 0, 0, []
+    try:
+        while updates < max_updates:
+            # Take in everything the actors have produced so far, waiting only if there is nothing to train on
+            while True:
+                try:
+                    block = len(learner.memory) < learner.batch_size or len(learner.bid_memory) < learner.batch_size
+                    _, version, play_items, bid_items = transitions.get(block=block, timeout=1.0)
+                except queue.Empty:
+                    break
+                for item in play_items:
+                    learner.memory.push(item)
+                for item in bid_items:
+                    learner.bid_memory.push(item)
+                window_steps += len(play_items)
+                window_lags.append(policy.version.value - version)
+
+            before = learner.games_played
+            learner.optimize()
+            if learner.games_played > before:
+                updates += 1
+                window_updates += 1
+                if updates % publish_interval == 0:
+                    policy.publish(learner)
+
+            elapsed = time.perf_counter() - window_start
+            if elapsed >= report_interval or updates >= max_updates:
+                stats = {
+                    "actor_steps_per_sec": window_steps / elapsed,
+                    "learner_updates_per_sec": window_updates / elapsed,
+                    "mean_policy_lag": float(np.mean(window_lags)) if window_lags else 0.0,
+                    "policy_version": policy.version.value,
+                    "updates": updates,
+                }
+                logging.info("actor steps/s: {actor_steps_per_sec:.1f}  learner updates/s: {learner_updates_per_sec:.2f}  "
+                             "policy lag: {mean_policy_lag:.2f} versions".format(**stats))
+                window_start = time.perf_counter()
+                window_steps, window_updates, window_lags = 0, 0, []
+    finally:
+        stop.set()
+        # Drain so actors blocked on a full queue can exit
+        while any(actor.is_alive() for actor in actors):
+            try:
+                transitions.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for actor in actors:
+            actor.join()
+
+    return stats
@@ -1,19 +1,30 @@
 import logging
+import os
+import time
 from typing import List
 import numpy as np
-from skull_king.agents import ManualAgent, RandomAgent, RLAgent, BaseAgent
-from skull_king.agents.rl_agent import ReplayMemory
-from skull_king.game import Deck, Trick, Hand, Loot
+from skull_king.agents import BaseAgent, make_agent
+from skull_king.replay import MemmapReplayMemory, PackedReplayMemory, PrioritizedReplayMemory, ReplayMemory
+from skull_king.game import ALL_CARDS, Deck, Trick, Hand, Loot
+from skull_king.metrics import METRICS
+from skull_king.obs import obs_size
+from skull_king.tracker import PublicState
+from skull_king.zobrist import ZobristHasher
 
 
 class SkullKingGame:
-    def __init__(self, n_manual: int = 1, n_random: int = 3, n_irl: int = 0, n_rl: int = 0, checkpoint_filepath: str = None) -> None:
+    def __init__(self, n_manual: int = 1, n_random: int = 3, n_irl: int = 0, n_rl: int = 0, checkpoint_filepath: str = None,
+                 prioritized_replay: bool = False, replay_dir: str = None,
+                 inference_filepath: str = None, packed_replay: bool = False, network: str = "dense",
+                 max_seats: int = None) -> None:
         super().__init__()
         self.deck = Deck()
         self.deck.reset()
         self.deck.shuffle()
 
         self.n_players = n_manual + n_random + n_rl
+        # Ten rounds, unless the table is too big for the deck to deal them all
+        self.n_rounds = min(10, len(ALL_CARDS) // self.n_players)
         self.round = 0
         self.starting_player = np.random.randint(0, self.n_players)  # Start with a random player
 
@@ -21,24 +32,63 @@ class SkullKingGame:
         self.players: List[BaseAgent] = []
         pid = 0
         for _ in range(n_manual):
-            self.players.append(ManualAgent(pid))
+            self.players.append(make_agent("manual", pid))
             pid += 1
 
         for _ in range(n_random):
-            self.players.append(RandomAgent(pid))
+            self.players.append(make_agent("random", pid))
             pid += 1
 
         # TODO: Add IRL support
 
-        # Shared memory
-        play_memory = ReplayMemory(100000)
-        bid_memory = ReplayMemory(100000)
-        for _ in range(n_rl):
-            agent = RLAgent(pid, play_memory=play_memory, bid_memory=bid_memory)
-            if (checkpoint_filepath is not None):
+        if n_rl > 0 and checkpoint_filepath is not None and checkpoint_filepath.endswith(".npz"):
+            # Weights exported with RLAgent.save_numpy run on the torch-free runtime
+            for _ in range(n_rl):
+                self.players.append(make_agent("numpy_rl", pid, weights_filepath=checkpoint_filepath,
+                                               max_seats=max_seats))
+                pid += 1
+        elif n_rl > 0 and checkpoint_filepath is not None and checkpoint_filepath.endswith(".ppo"):
+            # Policies trained with skull_king.ppo
+            for _ in range(n_rl):
+                agent = make_agent("ppo", pid, max_seats=max_seats)
                 agent.load(checkpoint_filepath)
-            self.players.append(agent)
-            pid += 1
+                self.players.append(agent)
+                pid += 1
+        elif n_rl > 0:
+            # Shared memory
+            if prioritized_replay and packed_replay:
+                raise ValueError("Prioritized replay is not supported for packed replay memories")
+            if network != "dense" and (packed_replay or replay_dir is not None):
+                raise ValueError("Packed and on-disk replay memories store dense observations, which set networks don't read")
+            if replay_dir is not None:
+                if prioritized_replay or packed_replay:
+                    raise ValueError("Only plain replay is supported for on-disk replay memories")
+                # On-disk memories are reopened as-is, so a resumed run keeps its experience
+                play_memory = MemmapReplayMemory(os.path.join(replay_dir, "play"), 100000)
+                bid_memory = MemmapReplayMemory(os.path.join(replay_dir, "bid"), 100000)
+            elif packed_replay:
+                # Packed transitions are ~50x smaller, so keep 10x as many
+                play_memory = PackedReplayMemory(1000000, max_seats=max_seats)
+                bid_memory = PackedReplayMemory(1000000, max_seats=max_seats)
+            else:
+                if prioritized_replay:
+                    play_memory = PrioritizedReplayMemory(100000)
+                else:
+                    play_memory = ReplayMemory(100000)
+                bid_memory = ReplayMemory(100000)
+            for _ in range(n_rl):
+                networks = {}
+                if network != "dense":
+                    from skull_king.agents.set_networks import build_networks
+                    networks = build_networks(network, obs_size(max_seats=max_seats))
+                agent = make_agent("rl", pid, play_memory=play_memory, bid_memory=bid_memory, max_seats=max_seats,
+                                   **networks)
+                if (checkpoint_filepath is not None):
+                    agent.load(checkpoint_filepath)
+                if (inference_filepath is not None):
+                    agent.load_inference(inference_filepath)
+                self.players.append(agent)
+                pid += 1
 
         # History tracking
         # [[player bids, tricks taken], [player bids, tricks taken]]
@@ -59,6 +109,7 @@ class SkullKingGame:
         # - player_scores: List[int]
         # - tricks_taken: List[int]
         # - cards_played: List[int]
+        # - public: PublicState
 
         # Bet for each player in the current round.
         self.player_bets = np.zeros(self.n_players)
@@ -69,15 +120,28 @@ class SkullKingGame:
         # Scores for each player
         self.player_scores = np.zeros(self.n_players)
 
+        # Public information about the round, updated as cards are played
+        self.public = PublicState(self.n_players)
+
         # Number of tricks taken for each player
-        self.tricks_taken = np.zeros(self.n_players)
+        self.tricks_taken = self.public.tricks_taken
 
         # Cards played in the current round
-        self.cards_played = np.zeros(len(self.deck))
+        self.cards_played = self.public.cards_played
 
         self.loot13 = [-1, -1]  # Tracks which players are connected with loot id 13
         self.loot14 = [-1, -1]  # Tracks which players are connected with loot id 14
 
+        # Tricks completed and bids collected so far this round
+        self.round_tricks: List[Trick] = []
+        self.n_bids = 0
+
+        # Zobrist hashes of the position, maintained once enable_hashing is called
+        self.zobrist: ZobristHasher = None
+
+        # Optional observer of every decision and outcome, e.g. skull_king.dataset.TransitionRecorder
+        self.recorder = None
+
     def reset_game(self):
         """
             Resets the game to play again from scratch
@@ -90,10 +154,15 @@ class SkullKingGame:
         self.player_bets = np.zeros(self.n_players)
         self.current_trick = Trick()
         self.player_scores = np.zeros(self.n_players)
-        self.tricks_taken = np.zeros(self.n_players)
-        self.cards_played = np.zeros(len(self.deck))
+        self.public.reset_round()
+        self.tricks_taken = self.public.tricks_taken
+        self.cards_played = self.public.cards_played
         self.loot13 = [-1, -1]
         self.loot14 = [-1, -1]
+        self.round_tricks = []
+        self.n_bids = 0
+        if self.zobrist is not None:
+            self.zobrist.reset_round()
 
     @property
     def state(self):
@@ -104,72 +173,207 @@ class SkullKingGame:
             "player_scores": self.player_scores,
             "tricks_taken": self.tricks_taken,
             "cards_played": self.cards_played,
-            "starting_player": self.starting_player
+            "starting_player": self.starting_player,
+            "public": self.public
         }
 
     def play_trick(self):
         """
         Starting with the starting player, prompt each player to play a card for the current trick.
+        A trick already partly played (e.g. restored with `set_position`) continues where it stopped.
         """
-        i = self.starting_player
-        while True:
+        i = (self.starting_player + len(self.current_trick)) % self.n_players
+        while len(self.current_trick) < self.n_players:
             cur_player: BaseAgent = self.players[i]
-            self.current_trick.add_card(i, cur_player.play(self.state))
+            if self.recorder is not None:
+                self.recorder.before_play(i, cur_player, self.state)
+            if METRICS.enabled:
+                start = time.perf_counter()
+                card = cur_player.play(self.state)
+                METRICS.observe(f"play/{type(cur_player).__name__}", time.perf_counter() - start)
+                METRICS.count("decisions")
+            else:
+                card = cur_player.play(self.state)
+            if self.recorder is not None:
+                self.recorder.after_play(i, card)
+            self.current_trick.add_card(i, card)
+            self.public.on_card(i, card, self.current_trick)
+            if self.zobrist is not None:
+                self.zobrist.on_card(i, card.id)
 
             i = (i + 1) % self.n_players
-            if i == self.starting_player: break
 
-    def play_round(self):
-        """
-        Starting with the current player, prompt each agent to play a card in order, updating
-        the game state as we go.
-        """
-        # Deal hands
+    def deal(self):
+        """Deal each player a hand of `round` cards."""
         for i, player in enumerate(self.players):
             hand = Hand()
             hand.add_cards(self.deck.draw(self.round))
             player.assign_hand(hand)
+            if self.zobrist is not None:
+                self.zobrist.on_deal(i, [card.id for card in hand.cards])
 
-        logging.info(f"Player {self.starting_player} will start the round.")
-
-        # Collect player bids
+    def collect_bids(self):
+        """Prompt each player for their bid."""
         for i, player in enumerate(self.players):
-            self.player_bets[i] = player.bid(self.state)
+            if METRICS.enabled:
+                start = time.perf_counter()
+                bid = player.bid(self.state)
+                METRICS.observe(f"bid/{type(player).__name__}", time.perf_counter() - start)
+                METRICS.count("decisions")
+            else:
+                bid = player.bid(self.state)
+            if self.recorder is not None:
+                # Before the bid is recorded in the state, so it sees what the bidder saw
+                self.recorder.on_bid(i, player, self.state, bid)
+            self.player_bets[i] = bid
+            self.n_bids += 1
+            if self.zobrist is not None:
+                self.zobrist.on_bid(i, bid)
+
+    def finish_trick(self):
+        """Award the completed current trick, record its loot and start the next trick."""
+        winner_id = self.current_trick.get_winner()
+        if self.recorder is not None:
+            self.recorder.on_trick(None if self.current_trick.kraken_played else winner_id, self.current_trick)
+        if self.zobrist is not None:
+            self.zobrist.on_trick_end([(player_id, card.id) for player_id, card in self.current_trick.cards],
+                                      None if self.current_trick.kraken_played else winner_id)
+
+        if not self.current_trick.kraken_played:
+            logging.info(f"Player {winner_id} won the trick.")
+            for i, player in enumerate(self.players):
+                if i == winner_id: player.win_trick(self.current_trick)
+                else: player.lose_trick()
+            self.public.on_trick_end(winner_id)  # current_player is now the winner of the current trick
+        else:
+            logging.info(f"Kraken played! No one wins the trick. Player {winner_id} will start next.")
+            # Everyone loses the trick when the kraken gets played
+            for i, player in enumerate(self.players):
+                player.lose_trick()
+            self.public.on_trick_end(None)
+
+        # Check for loot and update assignments for the round
+        for player_id, card in self.current_trick.cards:
+            if isinstance(card, Loot):
+                if card.id == 13:
+                    self.loot13[0] = player_id
+                    self.loot13[1] = self.starting_player
+                elif card.id == 14:
+                    self.loot14[0] = player_id
+                    self.loot14[1] = self.starting_player
+
+        # Reset trick
+        self.round_tricks.append(self.current_trick)
+        self.current_trick = Trick()
+
+        # Winner starts the next trick
+        self.starting_player = winner_id
 
-        # Play each trick in the round
-        for _ in range(self.round):
+    def play_tricks(self):
+        """Play the round's remaining tricks."""
+        while len(self.round_tricks) < self.round:
             self.play_trick()
             logging.info(f"Final trick state: {self.current_trick}")
+            self.finish_trick()
 
-            winner_id = self.current_trick.get_winner()
+    def play_round(self):
+        """
+        Starting with the current player, prompt each agent to play a card in order, updating
+        the game state as we go.
+        """
+        self.deal()
+        logging.info(f"Player {self.starting_player} will start the round.")
+        self.collect_bids()
+        self.play_tricks()
 
-            if not self.current_trick.kraken_played:
-                logging.info(f"Player {winner_id} won the trick.")
-                for i, player in enumerate(self.players):
-                    if i == winner_id: player.win_trick(self.current_trick)
-                    else: player.lose_trick()
-                self.tricks_taken[winner_id] += 1  # current_player is now the winner of the current trick
-            else:
-                logging.info(f"Kraken played! No one wins the trick. Player {winner_id} will start next.")
-                # Everyone loses the trick when the kraken gets played
-                for i, player in enumerate(self.players):
-                    player.lose_trick()
-
-            # Check for loot and update assignments for the round
-            for player_id, card in self.current_trick.cards:
-                if isinstance(card, Loot):
-                    if card.id == 13:
-                        self.loot13[0] = player_id
-                        self.loot13[1] = self.starting_player
-                    elif card.id == 14:
-                        self.loot14[0] = player_id
-                        self.loot14[1] = self.starting_player
-
-            # Reset trick
-            self.current_trick = Trick()
-
-            # Winner starts the next trick
-            self.starting_player = winner_id
+    def start_round(self, round_number: int, scores: np.ndarray = None):
+        """
+        Start a new game directly at `round_number`, with cumulative `scores` from the rounds
+        before it (all zeros if None). Then `play_round` plays it as usual.
+        """
+        self.reset_game()
+        self.round = round_number
+        if scores is not None:
+            self.player_scores[:] = scores
+
+    def get_position(self) -> dict:
+        """
+        The game as of now, during the play of a round (after the bids), as plain lists and
+        ints that serialize to JSON. Cards are given by id, tricks as [player, card id] pairs.
+        """
+        return {
+            "round": self.round,
+            "scores": self.player_scores.tolist(),
+            "bets": [int(bet) for bet in self.player_bets],
+            "hands": [[card.id for card in player.hand.cards] for player in self.players],
+            "tricks": [[[player_id, card.id] for player_id, card in trick.cards] for trick in self.round_tricks],
+            "trick": [[player_id, card.id] for player_id, card in self.current_trick.cards],
+            "starting_player": self.starting_player,
+        }
+
+    def set_position(self, position: dict):
+        """
+        Restore a position from `get_position`, so `resume_round` plays the rest of its round.
+        Each player is dealt its hand plus the cards it has already played, and the round's
+        tricks so far are replayed: the public state, the tricks each player holds and the loot
+        end up as if the round had been played here. The players' decisions before the position
+        are not replayed, so learning agents only see the rest of the round, and are marked
+        `resumed` so they don't learn their bid from it.
+        """
+        self.reset_game()
+        self.round = position["round"]
+        self.player_scores[:] = position["scores"]
+        self.player_bets[:] = position["bets"]
+        self.n_bids = self.n_players
+
+        played = [[] for _ in self.players]
+        for trick in position["tricks"] + [position["trick"]]:
+            for player_id, card_id in trick:
+                played[player_id].append(card_id)
+        cards = {card.id: card for card in self.deck.cards}
+        for i, player in enumerate(self.players):
+            hand = Hand()
+            hand.add_cards([cards[card_id] for card_id in position["hands"][i] + played[i]])
+            player.assign_hand(hand)
+            if hasattr(player, "current_bid"):
+                player.current_bid = position["bets"][i]
+            if hasattr(player, "resumed"):
+                player.resumed = True
+        dealt = {card_id for hand in position["hands"] for card_id in hand} | {c for cs in played for c in cs}
+        self.deck.cards = [card for card in self.deck.cards if card.id not in dealt]
+
+        recorder, self.recorder = self.recorder, None
+        try:
+            for trick in position["tricks"] + [position["trick"]]:
+                if trick:
+                    self.starting_player = trick[0][0]
+                for player_id, card_id in trick:
+                    card = self.players[player_id].hand.pick_card(card_id)
+                    self.current_trick.add_card(player_id, card)
+                    self.public.on_card(player_id, card, self.current_trick)
+                if len(self.current_trick) == self.n_players:
+                    self.finish_trick()
+        finally:
+            self.recorder = recorder
+        self.starting_player = position["starting_player"]
+        if self.zobrist is not None:
+            self.zobrist = ZobristHasher.from_env(self, self.zobrist.keys.seed)
+
+    def enable_hashing(self, seed: int = 0):
+        """Maintain Zobrist hashes of the position from now on (see skull_king.zobrist)."""
+        self.zobrist = ZobristHasher.from_env(self, seed)
+
+    def state_hash(self) -> int:
+        """64-bit hash of the full position: every hand, the bids, the round's cards and tricks, and the scores."""
+        return self.zobrist.state_hash(self.round, self.starting_player, self.player_scores)
+
+    def info_hash(self, player_id: int) -> int:
+        """64-bit hash of what `player_id` knows: the position without the other players' hands."""
+        return self.zobrist.info_hash(player_id, self.round, self.starting_player, self.player_scores)
+
+    def resume_round(self):
+        """Play the rest of the round from a position restored with `set_position`."""
+        self.play_tricks()
 
     def score_loot(self, loot):
         """
@@ -198,6 +402,8 @@ class SkullKingGame:
         round_scores += self.score_loot(self.loot13)
         round_scores += self.score_loot(self.loot14)
 
+        if self.recorder is not None:
+            self.recorder.on_round_scored(round_scores)
         return round_scores
 
     def cleanup_round(self):
@@ -220,22 +426,26 @@ class SkullKingGame:
         # Reset current trick
         self.current_trick = Trick()
 
-        # Reset played cards
-        self.cards_played = np.zeros(len(self.deck))
-
-        # Reset tricks taken
-        self.tricks_taken = np.zeros(self.n_players)
+        # Reset played cards, tricks taken and the rest of the round's public information
+        self.public.reset_round()
+        self.tricks_taken = self.public.tricks_taken
+        self.cards_played = self.public.cards_played
 
         # Reset loot
         self.loot13 = [-1, -1]
         self.loot14 = [-1, -1]
 
+        self.round_tricks = []
+        self.n_bids = 0
+        if self.zobrist is not None:
+            self.zobrist.reset_round()
+
     def play_game(self):
         """
         Simulate a full game of Skull King.
         """
-        # Game plays for 10 rounds
-        for i in range(1, 11):
+        # Game plays for 10 rounds, fewer at tables too big to deal them
+        for i in range(1, self.n_rounds + 1):
             self.round = i
             logging.debug(f"Starting round {self.round}")
             self.play_round()
@@ -249,3 +459,5 @@ class SkullKingGame:
             self.cleanup_round()
 
         self.done = True
+        if METRICS.enabled:
+            METRICS.count("games")
@@ -0,0 +1,295 @@
+"""
+Duplicate-format evaluation of agents.
+
+Deal luck dominates Skull King scores, so comparing two agents over independent games needs a
+great many games. In duplicate format every deal (the deck order and starting player of all ten
+rounds) is fixed by a seed and replayed once per seat rotation, so each agent in the lineup plays
+every seat of every deal. Per-deal score differences then cancel most of the deal luck.
+
+`evaluate_duplicate` plays a deal set across a process pool and `summarize` reports each agent's
+mean score, the difference between the first two agents with a 95% confidence interval, and how
+many times fewer games the duplicate format needs than independent games for the same confidence.
+`evaluate_sequential` instead stops as soon as the better of the two agents is known.
+"""
+import math
+import multiprocessing
+import os
+import random
+import sys
+from typing import List
+
+import numpy as np
+
+from skull_king.agents import build_agents, get_agent_class
+from skull_king.obs import N_CARDS
+
+N_ROUNDS = 10
+
+
+def make_deal(seed: int, deal_index: int, n_players: int) -> dict:
+    """Deck order (as indices into a fresh deck) and starting player for every round of a deal."""
+    rng = np.random.default_rng([seed, deal_index])
+    return {
+        "orders": np.stack([rng.permutation(N_CARDS) for _ in range(N_ROUNDS)]),
+        "starting_players": rng.integers(0, n_players, N_ROUNDS),
+    }
+
+
+def play_deal(env, deal: dict) -> np.ndarray:
+    """Play a full game of `deal` in `env` with its current players and return the final scores."""
+    env.reset_game()
+    for i in range(1, env.n_rounds + 1):
+        env.round = i
+        env.deck.reset()
+        env.deck.cards = [env.deck.cards[j] for j in deal["orders"][i - 1]]
+        env.starting_player = int(deal["starting_players"][i - 1])
+        env.play_round()
+        env.player_scores += env.score_round()
+        env.cleanup_round()
+    return env.player_scores.copy()
+
+
+def _seed_everything(*keys: int) -> None:
+    seed = int(np.random.SeedSequence(list(keys)).generate_state(1)[0])
+    random.seed(seed)
+    np.random.seed(seed)
+    if "torch" in sys.modules:
+        sys.modules["torch"].manual_seed(seed)
+
+
+def seat_rotations(lineup: List[str]) -> List[int]:
+    """
+    The rotations of `lineup` around the table that seat the agents differently, e.g. two for
+    an alternating A, B, A, B lineup. Together they put every agent in every seat.
+    """
+    n = len(lineup)
+    rotations, seen = [], set()
+    for rotation in range(n):
+        seating = tuple(lineup[(seat + rotation) % n] for seat in range(n))
+        if seating not in seen:
+            seen.add(seating)
+            rotations.append(rotation)
+    return rotations
+
+
+class DuplicateTable:
+    """The agents of a lineup seated at one table, ready to play duplicate deals."""
+    def __init__(self, lineup: List[str], seed: int = 0, greedy: bool = True, cache_size: int = 0) -> None:
+        from skull_king.env import SkullKingGame
+
+        self.lineup = lineup
+        self.seed = seed
+        self.rotations = seat_rotations(lineup)
+
+        # Import the agents' modules (and torch) before seeding, so untrained agents
+        # start from the same weights in every worker
+        for spec in lineup:
+            get_agent_class(spec.partition(":")[0])
+        _seed_everything(seed)
+        self.agents = build_agents(lineup, greedy=greedy, cache_size=cache_size)
+        self.env = SkullKingGame(n_manual=0, n_random=len(lineup), n_rl=0)
+
+    def play(self, deal_index: int) -> np.ndarray:
+        """Scores of deal `deal_index`, indexed by [rotation, lineup position]."""
+        n = len(self.lineup)
+        deal = make_deal(self.seed, deal_index, n)
+        scores = np.zeros((len(self.rotations), n))
+        for r, rotation in enumerate(self.rotations):
+            # Seat s holds lineup position (s + rotation) % n
+            positions = [(seat + rotation) % n for seat in range(n)]
+            self.env.players = [self.agents[p] for p in positions]
+            for seat, player in enumerate(self.env.players):
+                player.id = seat
+
+            _seed_everything(self.seed, deal_index, rotation)
+            scores[r, positions] = play_deal(self.env, deal)
+        return scores
+
+
+def _evaluate_worker(lineup: List[str], deal_indices: List[int], seed: int, greedy: bool,
+                     cache_size: int) -> np.ndarray:
+    """Scores indexed by [deal, rotation, lineup position]."""
+    table = DuplicateTable(lineup, seed, greedy, cache_size)
+    return np.stack([table.play(deal_index) for deal_index in deal_indices])
+
+
+_table: DuplicateTable = None  # one per pool worker, for evaluate_sequential
+
+
+def _init_table(lineup: List[str], seed: int, greedy: bool, cache_size: int) -> None:
+    global _table
+    _table = DuplicateTable(lineup, seed, greedy, cache_size)
+
+
+def _play_deal(deal_index: int):
+    return deal_index, _table.play(deal_index)
+
+
+def evaluate_duplicate(lineup: List[str],
+                       n_deals: int,
+                       n_workers: int = None,
+                       seed: int = 0,
+                       greedy: bool = True,
+                       cache_size: int = 0) -> dict:
+    """
+    Play `n_deals` duplicate deals with the agents in `lineup` (one spec per seat, see
+    `skull_king.agents.build_agents`) rotated through every seat, split across `n_workers`
+    processes (default: one per core). Learned agents act greedily unless `greedy` is False, and
+    memoize their network outputs for up to `cache_size` observations.
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    n_workers = max(1, min(n_workers, n_deals))
+    chunks = [list(chunk) for chunk in np.array_split(np.arange(n_deals), n_workers)]
+    tasks = [(lineup, chunk, seed, greedy, cache_size) for chunk in chunks]
+
+    if n_workers == 1:
+        results = [_evaluate_worker(*tasks[0])]
+    else:
+        with multiprocessing.get_context("spawn").Pool(n_workers) as pool:
+            results = pool.starmap(_evaluate_worker, tasks)
+
+    return {"lineup": list(lineup), "seed": seed, "scores": np.concatenate(results)}
+
+
+def _per_game_scores(lineup: List[str], scores: np.ndarray) -> dict:
+    """Each distinct agent's mean score over its seats, indexed by [deal, rotation]."""
+    return {label: scores[..., [p for p, spec in enumerate(lineup) if spec == label]].mean(axis=-1)
+            for label in dict.fromkeys(lineup)}
+
+
+def summarize(result: dict) -> dict:
+    """Per-agent mean scores and, for the first two distinct agents, duplicate vs independent statistics."""
+    lineup, scores = result["lineup"], result["scores"]
+    n_deals, n_rotations, _ = scores.shape
+    per_game = _per_game_scores(lineup, scores)
+    labels = list(per_game)
+
+    summary = {
+        "n_deals": n_deals,
+        "n_games": n_deals * n_rotations,
+        "mean_scores": {label: float(games.mean()) for label, games in per_game.items()},
+    }
+    if len(labels) < 2 or n_deals < 2:
+        return summary
+
+    a, b = labels[:2]
+    game_diffs = per_game[a] - per_game[b]  # (deal, rotation)
+    deal_diffs = game_diffs.mean(axis=1)
+
+    # Variance of one deal's difference, which costs n_rotations games
+    duplicate_var = deal_diffs.var(ddof=1)
+    # Variance of the difference between A's score and B's score from independent games
+    independent_var = per_game[a].var(ddof=1) + per_game[b].var(ddof=1)
+    # Variance of the difference within one game, i.e. the agents share each (fresh) deal but not seats
+    same_table_var = game_diffs.var(ddof=1)
+
+    def reduction(var: float) -> float:
+        # How many times more games the other design needs for the same confidence
+        return float(var / (n_rotations * duplicate_var)) if duplicate_var > 0 else math.inf
+
+    summary.update({
+        "compared": (a, b),
+        "difference": float(deal_diffs.mean()),
+        "ci95": float(1.96 * math.sqrt(duplicate_var / n_deals)),
+        "independent_ci95": float(1.96 * math.sqrt(independent_var / (n_deals * n_rotations))),
+        "variance_reduction": reduction(independent_var),
+        "same_table_variance_reduction": reduction(same_table_var),
+    })
+    return summary
+
+
+def confidence_radius(n: int, std: float, alpha: float, n_star: int = 100) -> float:
+    """
+    Half-width after `n` samples of an asymptotic confidence sequence for a mean (Waudby-Smith et
+    al., 2021). The intervals mean ± radius hold at every n simultaneously with probability about
+    1 - alpha, so they can be checked after every sample. They are tightest around `n_star`.
+    """
+    rho2 = (-2 * math.log(alpha) + math.log(-2 * math.log(alpha) + 1)) / n_star
+    return std * math.sqrt(2 * (n * rho2 + 1) / (n * n * rho2) * math.log(math.sqrt(n * rho2 + 1) / alpha))
+
+
+def evaluate_sequential(lineup: List[str],
+                        alpha: float = 0.05,
+                        max_deals: int = 1000,
+                        min_deals: int = 20,
+                        n_workers: int = None,
+                        seed: int = 0,
+                        greedy: bool = True,
+                        cache_size: int = 0) -> dict:
+    """
+    Like `evaluate_duplicate`, but stop as soon as a confidence sequence on the per-deal score
+    difference between the first two distinct agents in `lineup` excludes zero, at error rate
+    `alpha`, or after `max_deals` deals. Workers play one deal at a time and results are consumed
+    as they finish; deals still being played when the test stops are dropped.
+    """
+    labels = list(dict.fromkeys(lineup))
+    if len(labels) < 2:
+        raise ValueError("Sequential evaluation needs at least two different agents in the lineup")
+    a, b = labels[:2]
+    positions_a = [p for p, spec in enumerate(lineup) if spec == a]
+    positions_b = [p for p, spec in enumerate(lineup) if spec == b]
+
+    result = {"lineup": list(lineup), "seed": seed, "alpha": alpha, "deal_indices": [], "decision": None}
+    all_scores, diffs = [], []
+
+    def record(deal_index: int, scores: np.ndarray) -> bool:
+        result["deal_indices"].append(deal_index)
+        all_scores.append(scores)
+        diffs.append(scores[:, positions_a].mean() - scores[:, positions_b].mean())
+        if len(diffs) < max(min_deals, 2):
+            return False
+        radius = confidence_radius(len(diffs), np.std(diffs, ddof=1), alpha)
+        result["radius"] = radius
+        if abs(np.mean(diffs)) > radius:
+            result["decision"] = a if np.mean(diffs) > 0 else b
+            return True
+        return False
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if n_workers <= 1:
+        table = DuplicateTable(lineup, seed, greedy, cache_size)
+        for deal_index in range(max_deals):
+            if record(deal_index, table.play(deal_index)):
+                break
+    else:
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(n_workers, initializer=_init_table, initargs=(lineup, seed, greedy, cache_size)) as pool:
+            for deal_index, scores in pool.imap_unordered(_play_deal, range(max_deals)):
+                if record(deal_index, scores):
+                    break
+        # Leaving the pool's context terminates the workers
+
+    result["scores"] = np.stack(all_scores)
+    result["difference"] = float(np.mean(diffs))
+    return result
+
+
+def format_summary(summary: dict) -> str:
+    lines = [f"Duplicate evaluation: {summary['n_deals']} deals, {summary['n_games']} games"]
+    for label, mean in summary["mean_scores"].items():
+        lines.append(f"  {label:<40} mean score {mean:>8.1f}")
+    if "compared" in summary:
+        a, b = summary["compared"]
+        lines.append(f"{a} - {b}: {summary['difference']:.1f} ± {summary['ci95']:.1f} (95% CI)")
+        lines.append(f"Independent games would give ± {summary['independent_ci95']:.1f} from as many games, "
+                     f"and need {summary['variance_reduction']:.1f}x the games for the same confidence "
+                     f"({summary['same_table_variance_reduction']:.1f}x with both agents at every table)")
+    return "\n".join(lines)
+
+
+def format_sequential(result: dict) -> str:
+    a, b = list(dict.fromkeys(result["lineup"]))[:2]
+    n_deals = len(result["deal_indices"])
+    if result["decision"] is None:
+        verdict = f"undecided after the maximum of {n_deals} deals"
+    else:
+        verdict = f"{result['decision']} is stronger, decided after {n_deals} deals"
+    confidence = 1 - result["alpha"]
+    radius = result.get("radius", math.inf)
+    return "\n".join([
+        format_summary(summarize(result)),
+        f"Sequential test: {verdict}",
+        f"{a} - {b}: {result['difference']:.1f} ± {radius:.1f} ({confidence:.0%} confidence sequence)",
+    ])
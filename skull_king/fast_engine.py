@@ -0,0 +1,168 @@
+"""
+Rules of Skull King on card ids, with lookup tables instead of Card objects.
+
+The functions mirror `Trick.get_winner`, `BaseAgent._get_legal_actions`,
+`BaseAgent.compute_score` and `SkullKingGame.score_loot` exactly, including their quirks (e.g.
+the Tigress, always played as a pirate, neither gives a trick its color-free status nor counts
+as a pirate for bonuses). Hands are int bitmasks of card ids. Nothing here allocates Card or
+Trick objects, so it is the base for fast simulators; `skull_king.fuzz` checks it against the
+object engine.
+"""
+from typing import List, Sequence, Tuple
+
+from skull_king import game
+
+N_CARDS = len(game.ALL_CARDS)
+
+ESCAPE, NUMBER, PIRATE, MERMAID, SKULL_KING, KRAKEN, WHITE_WHALE, TIGRESS = range(8)
+
+
+def _kind(card: game.Card) -> int:
+    # Order matters for the subclasses-free hierarchy: check the exact classes
+    for cls, kind in ((game.Number, NUMBER), (game.Pirate, PIRATE), (game.Mermaid, MERMAID),
+                      (game.SkullKing, SKULL_KING), (game.Kraken, KRAKEN), (game.WhiteWhale, WHITE_WHALE),
+                      (game.Tigress, TIGRESS)):
+        if isinstance(card, cls):
+            return kind
+    return ESCAPE  # Escape and Loot behave identically in a trick
+
+
+KIND = [_kind(card) for card in game.ALL_CARDS]
+COLOR = [card.color if isinstance(card, game.Number) else -1 for card in game.ALL_CARDS]
+VALUE = [card.value if isinstance(card, game.Number) else 0 for card in game.ALL_CARDS]
+BONUS = [card.bonus_points for card in game.ALL_CARDS]  # the 14s
+
+NUMBER_BITS = sum(1 << i for i in range(N_CARDS) if KIND[i] == NUMBER)
+COLOR_BITS = [sum(1 << i for i in range(N_CARDS) if COLOR[i] == color) for color in range(4)]
+
+# BEATS[later][earlier]: whether a special card played later beats the current winner of another kind
+_BEATS_KINDS = {
+    ESCAPE: (),
+    NUMBER: (ESCAPE, KRAKEN, WHITE_WHALE),  # numbers against numbers are compared by color and value
+    PIRATE: (ESCAPE, NUMBER, MERMAID, KRAKEN),
+    MERMAID: (ESCAPE, NUMBER, SKULL_KING, KRAKEN),
+    SKULL_KING: (ESCAPE, NUMBER, PIRATE, KRAKEN, TIGRESS),
+    KRAKEN: (),
+    WHITE_WHALE: (),
+    TIGRESS: (ESCAPE, NUMBER, MERMAID, KRAKEN),
+}
+BEATS = [[earlier in _BEATS_KINDS[later] for earlier in range(8)] for later in range(8)]
+
+
+def trick_color(cards: Sequence[int]) -> int:
+    """The color numbers must follow, or -1: the first number's, unless a pirate, mermaid or skull king came first."""
+    for card in cards:
+        kind = KIND[card]
+        if kind == NUMBER:
+            return COLOR[card]
+        if kind == PIRATE or kind == MERMAID or kind == SKULL_KING:
+            return -1
+    return -1
+
+
+def trick_winner(cards: Sequence[int]) -> Tuple[int, int]:
+    """
+    Position in `cards` (in play order) of the card that takes the trick, and the trick's bonus
+    points once the winner's captures are counted. With a Kraken nobody takes the trick, but the
+    returned position still leads the next one.
+    """
+    bonus = sum(BONUS[card] for card in cards)
+    first = cards[0]
+
+    if any(KIND[card] == WHITE_WHALE for card in cards):
+        # Numbers above the first card's value take the lead; the threshold is never raised
+        threshold = VALUE[first]
+        winner = 0
+        for position in range(1, len(cards)):
+            card = cards[position]
+            if KIND[card] == NUMBER and VALUE[card] > threshold:
+                winner = position
+        return winner, bonus
+
+    color = trick_color(cards)
+    winner = 0
+    winning = first
+    pirate = mermaid = skull_king = False
+    for position, card in enumerate(cards):
+        kind = KIND[card]
+        pirate |= kind == PIRATE
+        mermaid |= kind == MERMAID
+        skull_king |= kind == SKULL_KING
+        if position == 0:
+            continue
+        winning_kind = KIND[winning]
+        if kind == NUMBER and winning_kind == NUMBER:
+            if COLOR[card] == game.CARD_COLOR_BLACK and COLOR[winning] != game.CARD_COLOR_BLACK:
+                beats = True
+            elif COLOR[card] != game.CARD_COLOR_BLACK and COLOR[winning] == game.CARD_COLOR_BLACK:
+                beats = False
+            elif COLOR[card] == color and COLOR[winning] != color:
+                beats = True
+            elif COLOR[card] != color and COLOR[winning] == color:
+                beats = False
+            else:
+                beats = VALUE[card] > VALUE[winning]
+        else:
+            beats = BEATS[kind][winning_kind]
+        if beats:
+            winner = position
+            winning = card
+
+    if pirate and mermaid and skull_king:
+        # The last mermaid wins, without capturing the skull king
+        for position, card in enumerate(cards):
+            if KIND[card] == MERMAID:
+                winner = position
+        return winner, bonus
+
+    winning_kind = KIND[winning]
+    if winning_kind == PIRATE:
+        bonus += 20 * sum(KIND[card] == MERMAID for card in cards)
+    elif winning_kind == MERMAID:
+        if skull_king:
+            bonus += 50
+    elif winning_kind == SKULL_KING:
+        bonus += 30 * sum(KIND[card] == PIRATE for card in cards)
+    return winner, bonus
+
+
+def legal_bits(hand_bits: int, cards: Sequence[int]) -> int:
+    """Bitmask of the cards in `hand_bits` that may be played onto the trick `cards`."""
+    if not cards:
+        return hand_bits
+    color = trick_color(cards)
+    if color == -1:
+        return hand_bits
+    follow = hand_bits & COLOR_BITS[color]
+    return (hand_bits & ~NUMBER_BITS) | follow if follow else hand_bits
+
+
+def hand_bits(cards: Sequence[int]) -> int:
+    bits = 0
+    for card in cards:
+        bits |= 1 << card
+    return bits
+
+
+def bit_ids(bits: int) -> List[int]:
+    return [i for i in range(N_CARDS) if bits >> i & 1]
+
+
+def compute_score(round_number: int, bet: int, trick_bonuses: Sequence[int]) -> int:
+    """Round score of a player who bet `bet` and took tricks worth `trick_bonuses` in bonus points."""
+    n_tricks = len(trick_bonuses)
+    if bet == 0:
+        return round_number * 10 if n_tricks == 0 else -round_number * 10
+    if n_tricks == bet:
+        return 20 * bet + sum(trick_bonuses)
+    return -10 * abs(bet - n_tricks)
+
+
+def score_loot(loot: Sequence[int], tricks_taken: Sequence[int], bets: Sequence[int]) -> List[int]:
+    """Loot bonus per player; `loot` is (player who played it, starting player of its trick), or (-1, -1)."""
+    bonus = [0] * len(bets)
+    p1, p2 = loot
+    if p1 != -1 and p1 != p2 and tricks_taken[p1] == bets[p1] and tricks_taken[p2] == bets[p2]:
+        bonus[p1] += 20
+        bonus[p2] += 20
+    return bonus
@@ -0,0 +1,416 @@
+"""
+Differential fuzzing of fast rule engines against the reference object engine.
+
+A backend is any module (or object) with the functions of `skull_king.fast_engine`:
+`trick_winner`, `legal_bits`, `compute_score` and `score_loot`. The harness generates seeded
+random cases of five kinds:
+
+- trick: a (possibly partial) trick, checked against `Trick.get_winner` and `Trick.bonus_points`
+- legal: a hand and a trick in progress, checked against `BaseAgent._get_legal_actions`
+- score: a bid and the bonuses of the tricks taken, checked against `BaseAgent.compute_score`
+- loot: a loot alliance, checked against `SkullKingGame.score_loot`
+- game: a full game of random agents, replayed through the backend decision by decision and
+  scored round by round
+
+Every mismatch is shrunk to a minimal reproducer (a failing game reports its first failing trick,
+legal-move or score case) and can be written out as a regression fixture with the reference
+engine's expected output, for skull_king/tests/fixtures/engine_cases.json.
+
+    python -m skull_king.fuzz --cases 1000000 --workers 8
+"""
+import copy
+import json
+import multiprocessing
+import os
+import random
+import time
+from importlib import import_module
+from types import SimpleNamespace
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+from skull_king import game
+from skull_king.agents import BaseAgent
+from skull_king.fast_engine import bit_ids, hand_bits
+
+N_CARDS = len(game.ALL_CARDS)
+KRAKEN_ID = next(card.id for card in game.ALL_CARDS if isinstance(card, game.Kraken))
+LOOT_IDS = [card.id for card in game.ALL_CARDS if isinstance(card, game.Loot)]
+
+BACKENDS = {
+    "tables": "skull_king.fast_engine",
+    "kernels": "skull_king.kernels",
+}
+
+
+def register_backend(name: str, module: str) -> None:
+    """Register a fast engine under `name`, given as a module path."""
+    BACKENDS[name] = module
+
+
+def get_backend(name: str):
+    return import_module(BACKENDS[name])
+
+
+#################################### Reference engine ####################################
+
+def _fresh(card_id: int) -> game.Card:
+    # Cards collect capture bonuses, so every trick gets its own copies
+    return copy.copy(game.ALL_CARDS[card_id])
+
+
+def _trick(cards: List[int]) -> game.Trick:
+    trick = game.Trick()
+    for position, card_id in enumerate(cards):
+        trick.add_card(position, _fresh(card_id))
+    return trick
+
+
+def reference_trick(cards: List[int]) -> list:
+    trick = _trick(cards)
+    winner = trick.get_winner()
+    return [winner, trick.bonus_points]
+
+
+def reference_legal(hand: List[int], cards: List[int]) -> List[int]:
+    agent = BaseAgent(0)
+    agent.hand.add_cards([_fresh(i) for i in hand])
+    legal = agent._get_legal_actions({"current_trick": _trick(cards)})
+    return np.nonzero(legal)[0].tolist()
+
+
+def reference_score(round_number: int, bet: int, bonuses: List[int]) -> int:
+    agent = BaseAgent(0)
+    agent.tricks = [SimpleNamespace(bonus_points=bonus) for bonus in bonuses]
+    return agent.compute_score(round_number, bet)
+
+
+def reference_loot(loot: List[int], tricks_taken: List[int], bets: List[int]) -> List[int]:
+    from skull_king.env import SkullKingGame
+
+    env = SimpleNamespace(n_players=len(bets), tricks_taken=np.array(tricks_taken), player_bets=np.array(bets))
+    return SkullKingGame.score_loot(env, list(loot)).astype(int).tolist()
+
+
+def expected_output(case: dict):
+    """The reference engine's output for a trick, legal, score or loot case."""
+    kind = case["kind"]
+    if kind == "trick":
+        return reference_trick(case["cards"])
+    if kind == "legal":
+        return reference_legal(case["hand"], case["trick"])
+    if kind == "score":
+        return reference_score(case["round"], case["bet"], case["bonuses"])
+    if kind == "loot":
+        return reference_loot(case["loot"], case["tricks_taken"], case["bets"])
+    raise ValueError(f"No reference output for {kind!r} cases")
+
+
+def backend_output(case: dict, backend):
+    kind = case["kind"]
+    if kind == "trick":
+        return [int(x) for x in backend.trick_winner(case["cards"])]
+    if kind == "legal":
+        return bit_ids(backend.legal_bits(hand_bits(case["hand"]), case["trick"]))
+    if kind == "score":
+        return int(backend.compute_score(case["round"], case["bet"], case["bonuses"]))
+    if kind == "loot":
+        return [int(x) for x in backend.score_loot(case["loot"], case["tricks_taken"], case["bets"])]
+    raise ValueError(f"Unknown case kind {kind!r}")
+
+
+#################################### Cases ####################################
+
+# Special cards are rare in a random draw but hold most of the rules, so they are drawn more often
+_CARD_WEIGHTS = np.array([4.0 if i < 17 else 1.0 for i in range(N_CARDS)])
+_CARD_WEIGHTS /= _CARD_WEIGHTS.sum()
+
+
+def _draw(rng: np.random.Generator, n: int) -> List[int]:
+    return rng.choice(N_CARDS, n, replace=False, p=_CARD_WEIGHTS).tolist()
+
+
+def random_case(kind: str, rng: np.random.Generator) -> dict:
+    if kind == "trick":
+        return {"kind": kind, "cards": _draw(rng, int(rng.integers(1, 7)))}
+    if kind == "legal":
+        hand_size = int(rng.integers(1, 11))
+        cards = _draw(rng, hand_size + int(rng.integers(0, 6)))
+        return {"kind": kind, "hand": cards[:hand_size], "trick": cards[hand_size:]}
+    if kind == "score":
+        round_number = int(rng.integers(1, 11))
+        n_tricks = int(rng.integers(0, round_number + 1))
+        return {"kind": kind, "round": round_number, "bet": int(rng.integers(0, round_number + 1)),
+                "bonuses": (10 * rng.integers(0, 8, n_tricks)).tolist()}
+    if kind == "loot":
+        n_players = int(rng.integers(2, 7))
+        loot = [-1, -1] if rng.random() < 0.2 else rng.integers(0, n_players, 2).tolist()
+        return {"kind": kind, "loot": loot, "tricks_taken": rng.integers(0, 3, n_players).tolist(),
+                "bets": rng.integers(0, 3, n_players).tolist()}
+    if kind == "game":
+        return {"kind": kind, "seed": int(rng.integers(2**31)), "n_players": int(rng.integers(2, 7))}
+    raise ValueError(f"Unknown case kind {kind!r}")
+
+
+def check(case: dict, backend) -> Optional[dict]:
+    """None if `backend` agrees with the reference engine on `case`, else the mismatch."""
+    if case["kind"] == "game":
+        return _check_game(case, backend)
+    expected = expected_output(case)
+    try:
+        actual = backend_output(case, backend)
+    except Exception as e:
+        actual = f"{type(e).__name__}: {e}"
+    if actual != expected:
+        return {"case": case, "expected": expected, "actual": actual}
+    return None
+
+
+class _GameRecorder:
+    """Records the deals, bids, tricks and round scores of a reference game."""
+    def __init__(self) -> None:
+        self.rounds = []
+
+    def on_bid(self, player_id, player, state, bid):
+        if player_id == 0:
+            self.rounds.append({"hands": [], "bets": [], "tricks": [], "scores": None})
+        self.rounds[-1]["hands"].append([card.id for card in player.hand.cards])
+        self.rounds[-1]["bets"].append(int(bid))
+
+    def on_trick(self, winner_id, trick):
+        self.rounds[-1]["tricks"].append([(player_id, card.id) for player_id, card in trick.cards])
+
+    def on_round_scored(self, round_scores):
+        self.rounds[-1]["scores"] = round_scores.astype(int).tolist()
+
+    def before_play(self, *args):
+        pass
+
+    def after_play(self, *args):
+        pass
+
+
+def _check_game(case: dict, backend) -> Optional[dict]:
+    from skull_king.agents import RandomAgent
+    from skull_king.env import SkullKingGame
+
+    random.seed(case["seed"])
+    np.random.seed(case["seed"])
+    n = case["n_players"]
+    env = SkullKingGame(n_manual=0, n_random=n)
+    env.players = [RandomAgent(i) for i in range(n)]
+    recorder = env.recorder = _GameRecorder()
+    env.play_game()
+
+    for round_index, record in enumerate(recorder.rounds):
+        hands = [hand_bits(hand) for hand in record["hands"]]
+        tricks_taken = [0] * n
+        bonuses = [[] for _ in range(n)]
+        loot = {loot_id: [-1, -1] for loot_id in LOOT_IDS}
+        for trick in record["tricks"]:
+            cards = []
+            for player_id, card_id in trick:
+                mismatch = check({"kind": "legal", "hand": bit_ids(hands[player_id]), "trick": cards[:]}, backend)
+                if mismatch is not None:
+                    return mismatch
+                hands[player_id] &= ~(1 << card_id)
+                cards.append(card_id)
+
+            mismatch = check({"kind": "trick", "cards": cards}, backend)
+            if mismatch is not None:
+                return mismatch
+            position, bonus = backend.trick_winner(cards)
+            if KRAKEN_ID not in cards:
+                tricks_taken[trick[position][0]] += 1
+                bonuses[trick[position][0]].append(int(bonus))
+            for player_id, card_id in trick:
+                if card_id in loot:
+                    loot[card_id] = [player_id, trick[0][0]]
+
+        scores = [backend.compute_score(round_index + 1, record["bets"][p], bonuses[p]) for p in range(n)]
+        for pair in loot.values():
+            scores = [s + b for s, b in zip(scores, backend.score_loot(pair, tricks_taken, record["bets"]))]
+        if [int(s) for s in scores] != record["scores"]:
+            return {"case": case, "expected": record["scores"], "actual": [int(s) for s in scores],
+                    "round": round_index + 1}
+    return None
+
+
+#################################### Shrinking ####################################
+
+# The simplest card of each kind, to replace cards with while shrinking
+_SIMPLE_CARDS = [0, 1, 6, 8, 9, 13, 15, 16, 17, 31, 45, 59]
+
+
+def _smaller(case: dict) -> Iterator[dict]:
+    """Candidate simplifications of `case`, roughly from most to least aggressive."""
+    kind = case["kind"]
+
+    def with_(**changes):
+        return {**case, **changes}
+
+    def simpler_lists(cards: List[int], min_len: int, exclude=()) -> Iterator[List[int]]:
+        for i in range(len(cards)):
+            if len(cards) > min_len:
+                yield cards[:i] + cards[i + 1:]
+        for i in range(len(cards)):
+            for simple in _SIMPLE_CARDS:
+                if simple < cards[i] and simple not in cards and simple not in exclude:
+                    yield cards[:i] + [simple] + cards[i + 1:]
+
+    if kind == "trick":
+        for cards in simpler_lists(case["cards"], 1):
+            yield with_(cards=cards)
+    elif kind == "legal":
+        for hand in simpler_lists(case["hand"], 1, exclude=case["trick"]):
+            yield with_(hand=hand)
+        for trick in simpler_lists(case["trick"], 0, exclude=case["hand"]):
+            yield with_(trick=trick)
+    elif kind == "score":
+        bonuses = case["bonuses"]
+        for i in range(len(bonuses)):
+            if bonuses[i]:
+                yield with_(bonuses=bonuses[:i] + [0] + bonuses[i + 1:])
+        if bonuses and case["round"] > len(bonuses) - 1:
+            yield with_(bonuses=bonuses[:-1])
+        if case["bet"] > 0:
+            yield with_(bet=case["bet"] - 1)
+        if case["round"] > max(1, case["bet"], len(bonuses)):
+            yield with_(round=case["round"] - 1)
+    elif kind == "loot":
+        for key in ("tricks_taken", "bets"):
+            for i, value in enumerate(case[key]):
+                if value:
+                    yield with_(**{key: case[key][:i] + [0] + case[key][i + 1:]})
+
+
+def shrink(mismatch: dict, backend) -> dict:
+    """Greedily simplify a mismatch's case while the backend still disagrees with the reference."""
+    while True:
+        for candidate in _smaller(mismatch["case"]):
+            smaller = check(candidate, backend)
+            if smaller is not None:
+                mismatch = smaller
+                break
+        else:
+            return mismatch
+
+
+#################################### Driver ####################################
+
+# Relative frequency of each kind of case; games are checked decision by decision, so are far slower
+KIND_WEIGHTS = {"trick": 40, "legal": 40, "score": 10, "loot": 9, "game": 1}
+
+
+def _fuzz_worker(backend_names: List[str], kinds: List[str], seed: List[int], n_cases: int) -> dict:
+    rng = np.random.default_rng(seed)
+    backends = {name: get_backend(name) for name in backend_names}
+    weights = np.array([KIND_WEIGHTS[kind] for kind in kinds], dtype=float)
+    case_kinds = rng.choice(len(kinds), n_cases, p=weights / weights.sum())
+
+    counts = {kind: 0 for kind in kinds}
+    mismatches = []
+    for k in case_kinds:
+        case = random_case(kinds[k], rng)
+        counts[case["kind"]] += 1
+        for name, backend in backends.items():
+            mismatch = check(case, backend)
+            if mismatch is not None:
+                mismatches.append({"backend": name, **shrink(mismatch, backend)})
+    return {"counts": counts, "mismatches": mismatches}
+
+
+def fuzz(backend_names: List[str] = None,
+         n_cases: int = 100000,
+         n_workers: int = None,
+         seed: int = 0,
+         kinds: List[str] = None,
+         chunk_size: int = 10000) -> dict:
+    """
+    Check `n_cases` random cases against every backend in `backend_names` (default: all registered),
+    across `n_workers` processes (default: one per core).
+    """
+    backend_names = list(BACKENDS) if backend_names is None else backend_names
+    kinds = list(KIND_WEIGHTS) if kinds is None else kinds
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    sizes = [min(chunk_size, n_cases - start) for start in range(0, n_cases, chunk_size)]
+    tasks = [(backend_names, kinds, [seed, i], size) for i, size in enumerate(sizes)]
+
+    start = time.perf_counter()
+    if n_workers <= 1:
+        results = [_fuzz_worker(*task) for task in tasks]
+    else:
+        with multiprocessing.get_context("spawn").Pool(n_workers) as pool:
+            results = pool.starmap(_fuzz_worker, tasks)
+    seconds = time.perf_counter() - start
+
+    counts = {kind: sum(result["counts"][kind] for result in results) for kind in kinds}
+    # Many random cases shrink to the same reproducer
+    unique = {}
+    for result in results:
+        for mismatch in result["mismatches"]:
+            unique.setdefault(json.dumps([mismatch["backend"], mismatch["case"]], sort_keys=True), mismatch)
+    mismatches = list(unique.values())
+    return {
+        "cases": n_cases,
+        "counts": counts,
+        "seconds": seconds,
+        "cases_per_second": n_cases / seconds if seconds > 0 else float("inf"),
+        "mismatches": mismatches,
+    }
+
+
+def to_fixture(case: dict) -> dict:
+    """A regression fixture: the case with the reference engine's output."""
+    return {**case, "expected": expected_output(case)}
+
+
+def write_fixtures(path: str, cases: List[dict]) -> int:
+    """Add `cases` (not already present) to the fixture file at `path`; returns how many were added."""
+    fixtures = []
+    if os.path.exists(path):
+        with open(path) as f:
+            fixtures = json.load(f)
+    seen = {json.dumps({k: v for k, v in fixture.items() if k != "expected"}, sort_keys=True) for fixture in fixtures}
+    added = 0
+    for case in cases:
+        key = json.dumps(case, sort_keys=True)
+        if key not in seen and case["kind"] != "game":
+            fixtures.append(to_fixture(case))
+            seen.add(key)
+            added += 1
+    with open(path, "w") as f:
+        # One fixture per line keeps the file readable and its diffs small
+        f.write("[\n" + ",\n".join(json.dumps(fixture) for fixture in fixtures) + "\n]\n")
+    return added
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Differentially fuzz fast rule engines against the reference engine")
+    parser.add_argument("--backend", nargs="+", default=None, help="Backends to check (default: all registered)")
+    parser.add_argument("--cases", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: one per core)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--kinds", nargs="+", default=None, choices=list(KIND_WEIGHTS))
+    parser.add_argument("--fixtures", type=str, default=None,
+                        help="Add the shrunk reproducers of any mismatches to this fixture file")
+
+    args = parser.parse_args()
+    report = fuzz(args.backend, args.cases, args.workers, args.seed, args.kinds)
+
+    counts = ", ".join(f"{n} {kind}" for kind, n in report["counts"].items())
+    print(f"Checked {report['cases']} cases ({counts}) in {report['seconds']:.1f}s, "
+          f"{report['cases_per_second']:.0f} cases/s")
+    for mismatch in report["mismatches"]:
+        print(f"[{mismatch['backend']}] {json.dumps(mismatch['case'])}: "
+              f"expected {mismatch['expected']}, got {mismatch['actual']}")
+    if not report["mismatches"]:
+        print("No mismatches")
+    elif args.fixtures is not None:
+        added = write_fixtures(args.fixtures, [mismatch["case"] for mismatch in report["mismatches"]])
+        print(f"Added {added} fixtures to {args.fixtures}")
@@ -380,8 +380,12 @@ class Trick:
     def get_first_color(self):
         return self.color
 
-    def get_winner(self):
-        """Compute the id of the player who won the trick"""
+    def compute_winner(self) -> Tuple[int, Card]:
+        """
+        Compute the id of the player currently winning the trick and their card, without awarding
+        any bonus points, so it can be called after every card. When a pirate, mermaid and skull
+        king have all been played, the card returned is the Mermaid class rather than the card.
+        """
         current_winner = self.cards[0][0]
         current_winning_card = self.cards[0][1]
 
@@ -395,8 +399,7 @@ class Trick:
                         current_winning_card = card
                         current_winner = player_id
 
-            self.winner_id = current_winner
-            return current_winner
+            return current_winner, current_winning_card
 
         # No white whale was played, get winner as usual
 
@@ -430,8 +433,16 @@ class Trick:
                     current_winner = player_id
                     current_winning_card = Mermaid
 
+        return current_winner, current_winning_card
+
+    def get_winner(self):
+        """Compute the id of the player who won the trick"""
+        current_winner, current_winning_card = self.compute_winner()
+
         # Add bonus points if the winning card was the skull king, mermaid, or pirate
-        if isinstance(current_winning_card, Pirate):
+        if self.white_whale_played:
+            pass
+        elif isinstance(current_winning_card, Pirate):
             count = 0
             for _, card in self.cards:
                 if isinstance(card, Mermaid): count += 1
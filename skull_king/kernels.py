@@ -0,0 +1,437 @@
+"""
+Batched rule kernels on integer card arrays, compiled with Numba when it is installed.
+
+The functions of `skull_king.fast_engine` resolve one trick, legal-move mask or score at a time.
+The kernels here do the same for a whole batch, e.g. every trick of thousands of simulated games,
+with one call:
+
+- `trick_winners(cards)`: winning position and bonus points of each row of an [N, P] array of
+  card ids in play order, padded with -1 for tricks still in progress
+- `legal_masks(hands, tricks)`: which cards of each [N, 73] boolean hand may be played onto the
+  trick in the same row of `tricks`
+- `round_scores(rounds, bets, n_tricks, bonuses)`: round scores, elementwise
+- `loot_bonuses(loot, tricks_taken, bets)`: loot alliance bonuses, [N, 2] alliances against
+  [N, n_players] tricks taken and bets
+
+There are two implementations, with bit-identical results: per-row loops compiled by Numba
+(`numba`), and NumPy array operations that loop only over the few positions of a trick (`numpy`).
+The Numba backend is used automatically when Numba can be imported, unless the
+SKULL_KING_KERNELS environment variable names the other one. Compiled kernels are cached on
+disk (in __pycache__, or NUMBA_CACHE_DIR), so only the first process ever pays for compilation.
+The uncompiled loops also run as the `python` backend, the per-element baseline for benchmarks.
+
+The module also provides the single-case functions of `skull_king.fast_engine`, so the fuzz
+harness checks the kernels against the reference engine (registered there as "kernels").
+Benchmark every available backend with:
+
+    python -m skull_king.kernels --n 100000
+"""
+import os
+import time
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from skull_king import fast_engine, game
+from skull_king.fast_engine import MERMAID, N_CARDS, NUMBER, PIRATE, SKULL_KING, WHITE_WHALE
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BLACK = game.CARD_COLOR_BLACK
+
+# Card tables with one extra row, for the -1 padding (which indexes the last row)
+KIND = np.array(fast_engine.KIND + [-1], dtype=np.int64)
+COLOR = np.array(fast_engine.COLOR + [-1], dtype=np.int64)
+VALUE = np.array(fast_engine.VALUE + [0], dtype=np.int64)
+BONUS = np.array(fast_engine.BONUS + [0], dtype=np.int64)
+BEATS = np.array(fast_engine.BEATS, dtype=np.bool_)
+IS_NUMBER = KIND[:N_CARDS] == NUMBER
+# COLOR_CARDS[color] marks the numbers of that color; the last row (color -1) marks none
+COLOR_CARDS = np.zeros((5, N_CARDS), dtype=np.bool_)
+for _color in range(4):
+    COLOR_CARDS[_color] = COLOR[:N_CARDS] == _color
+
+
+#################################### Per-row loops ####################################
+
+def _loop_trick_winners(cards, positions, bonuses):
+    for t in range(cards.shape[0]):
+        n = 0
+        while n < cards.shape[1] and cards[t, n] >= 0:
+            n += 1
+        total = 0
+        whale = False
+        for p in range(n):
+            total += BONUS[cards[t, p]]
+            whale = whale or KIND[cards[t, p]] == WHITE_WHALE
+        bonuses[t] = total
+        if whale:
+            # Numbers above the first card's value take the lead; the threshold is never raised
+            threshold = VALUE[cards[t, 0]]
+            winner = 0
+            for p in range(1, n):
+                if KIND[cards[t, p]] == NUMBER and VALUE[cards[t, p]] > threshold:
+                    winner = p
+            positions[t] = winner
+            continue
+
+        lead = -1
+        for p in range(n):
+            kind = KIND[cards[t, p]]
+            if kind == NUMBER:
+                lead = COLOR[cards[t, p]]
+                break
+            if kind == PIRATE or kind == MERMAID or kind == SKULL_KING:
+                break
+
+        winner = 0
+        winning = cards[t, 0]
+        n_pirates = 0
+        n_mermaids = 0
+        skull_king = False
+        for p in range(n):
+            card = cards[t, p]
+            kind = KIND[card]
+            if kind == PIRATE:
+                n_pirates += 1
+            elif kind == MERMAID:
+                n_mermaids += 1
+            elif kind == SKULL_KING:
+                skull_king = True
+            if p == 0:
+                continue
+            winning_kind = KIND[winning]
+            if kind == NUMBER and winning_kind == NUMBER:
+                if COLOR[card] == BLACK and COLOR[winning] != BLACK:
+                    beats = True
+                elif COLOR[card] != BLACK and COLOR[winning] == BLACK:
+                    beats = False
+                elif COLOR[card] == lead and COLOR[winning] != lead:
+                    beats = True
+                elif COLOR[card] != lead and COLOR[winning] == lead:
+                    beats = False
+                else:
+                    beats = VALUE[card] > VALUE[winning]
+            else:
+                beats = BEATS[kind, winning_kind]
+            if beats:
+                winner = p
+                winning = card
+
+        if n_pirates > 0 and n_mermaids > 0 and skull_king:
+            # The last mermaid wins, without capturing the skull king
+            for p in range(n):
+                if KIND[cards[t, p]] == MERMAID:
+                    winner = p
+        else:
+            winning_kind = KIND[winning]
+            if winning_kind == PIRATE:
+                bonuses[t] += 20 * n_mermaids
+            elif winning_kind == MERMAID and skull_king:
+                bonuses[t] += 50
+            elif winning_kind == SKULL_KING:
+                bonuses[t] += 30 * n_pirates
+        positions[t] = winner
+
+
+def _loop_legal_masks(hands, tricks, masks):
+    for t in range(hands.shape[0]):
+        lead = -1
+        for p in range(tricks.shape[1]):
+            card = tricks[t, p]
+            if card < 0:
+                break
+            kind = KIND[card]
+            if kind == NUMBER:
+                lead = COLOR[card]
+                break
+            if kind == PIRATE or kind == MERMAID or kind == SKULL_KING:
+                break
+        follow = False
+        if lead >= 0:
+            for c in range(N_CARDS):
+                if hands[t, c] and COLOR[c] == lead:
+                    follow = True
+                    break
+        for c in range(N_CARDS):
+            masks[t, c] = hands[t, c] and (not follow or KIND[c] != NUMBER or COLOR[c] == lead)
+
+
+def _loop_round_scores(rounds, bets, n_tricks, bonuses, scores):
+    for i in range(bets.shape[0]):
+        if bets[i] == 0:
+            scores[i] = rounds[i] * 10 if n_tricks[i] == 0 else -rounds[i] * 10
+        elif n_tricks[i] == bets[i]:
+            scores[i] = 20 * bets[i] + bonuses[i]
+        else:
+            scores[i] = -10 * abs(bets[i] - n_tricks[i])
+
+
+def _loop_loot_bonuses(loot, tricks_taken, bets, bonuses):
+    for i in range(loot.shape[0]):
+        p1 = loot[i, 0]
+        p2 = loot[i, 1]
+        if p1 != -1 and p1 != p2 and tricks_taken[i, p1] == bets[i, p1] and tricks_taken[i, p2] == bets[i, p2]:
+            bonuses[i, p1] += 20
+            bonuses[i, p2] += 20
+
+
+_LOOPS = {
+    "trick_winners": _loop_trick_winners,
+    "legal_masks": _loop_legal_masks,
+    "round_scores": _loop_round_scores,
+    "loot_bonuses": _loop_loot_bonuses,
+}
+
+
+#################################### NumPy ####################################
+
+def _numpy_trick_winners(cards, positions, bonuses):
+    n_rows, n_positions = cards.shape
+    rows = np.arange(n_rows)
+    valid = cards >= 0
+    kind, color, value = KIND[cards], COLOR[cards], VALUE[cards]
+    bonuses[:] = BONUS[cards].sum(axis=1)
+
+    # White whale: the last number above the first card's value, else the first card
+    above = (kind == NUMBER) & (value > value[:, :1])
+    above[:, 0] = False
+    whale_winner = np.where(above.any(axis=1), n_positions - 1 - np.argmax(above[:, ::-1], axis=1), 0)
+
+    decisive = (kind == NUMBER) | (kind == PIRATE) | (kind == MERMAID) | (kind == SKULL_KING)
+    first = np.argmax(decisive, axis=1)
+    lead = np.where(decisive.any(axis=1) & (kind[rows, first] == NUMBER), color[rows, first], -1)
+
+    # Scan the positions of all rows at once
+    winner = np.zeros(n_rows, dtype=np.int64)
+    winning_kind, winning_color, winning_value = kind[:, 0].copy(), color[:, 0].copy(), value[:, 0].copy()
+    for p in range(1, n_positions):
+        k, c, v = kind[:, p], color[:, p], value[:, p]
+        black, winning_black = c == BLACK, winning_color == BLACK
+        led, winning_led = c == lead, winning_color == lead
+        number_beats = np.where(black != winning_black, black,
+                                np.where(led != winning_led, led, v > winning_value))
+        beats = valid[:, p] & np.where((k == NUMBER) & (winning_kind == NUMBER), number_beats, BEATS[k, winning_kind])
+        winner[beats] = p
+        winning_kind[beats], winning_color[beats], winning_value[beats] = k[beats], c[beats], v[beats]
+
+    n_pirates = (kind == PIRATE).sum(axis=1)
+    n_mermaids = (kind == MERMAID).sum(axis=1)
+    skull_king = (kind == SKULL_KING).any(axis=1)
+    triple = (n_pirates > 0) & (n_mermaids > 0) & skull_king
+    last_mermaid = n_positions - 1 - np.argmax((kind == MERMAID)[:, ::-1], axis=1)
+    captures = np.select([winning_kind == PIRATE, (winning_kind == MERMAID) & skull_king, winning_kind == SKULL_KING],
+                         [20 * n_mermaids, 50, 30 * n_pirates], 0)
+
+    whale = (kind == WHITE_WHALE).any(axis=1)
+    positions[:] = np.where(whale, whale_winner, np.where(triple, last_mermaid, winner))
+    bonuses += np.where(whale | triple, 0, captures)
+
+
+def _numpy_legal_masks(hands, tricks, masks):
+    n_rows = hands.shape[0]
+    if tricks.shape[1] == 0:
+        masks[:] = hands
+        return
+    kind = KIND[tricks]
+    decisive = (kind == NUMBER) | (kind == PIRATE) | (kind == MERMAID) | (kind == SKULL_KING)
+    first = np.argmax(decisive, axis=1)
+    rows = np.arange(n_rows)
+    lead = np.where(decisive.any(axis=1) & (kind[rows, first] == NUMBER), COLOR[tricks[rows, first]], -1)
+    follow = hands & COLOR_CARDS[lead]
+    can_follow = follow.any(axis=1, keepdims=True)
+    masks[:] = np.where(can_follow, (hands & ~IS_NUMBER) | follow, hands)
+
+
+def _numpy_round_scores(rounds, bets, n_tricks, bonuses, scores):
+    scores[:] = np.where(bets == 0,
+                         np.where(n_tricks == 0, 10 * rounds, -10 * rounds),
+                         np.where(n_tricks == bets, 20 * bets + bonuses, -10 * np.abs(bets - n_tricks)))
+
+
+def _numpy_loot_bonuses(loot, tricks_taken, bets, bonuses):
+    rows = np.arange(loot.shape[0])
+    p1, p2 = loot[:, 0], loot[:, 1]
+    made = tricks_taken == bets
+    alliance = (p1 != -1) & (p1 != p2) & made[rows, p1] & made[rows, p2]
+    bonuses[rows[alliance], p1[alliance]] += 20
+    bonuses[rows[alliance], p2[alliance]] += 20
+
+
+_NUMPY = {
+    "trick_winners": _numpy_trick_winners,
+    "legal_masks": _numpy_legal_masks,
+    "round_scores": _numpy_round_scores,
+    "loot_bonuses": _numpy_loot_bonuses,
+}
+
+IMPLEMENTATIONS: Dict[str, dict] = {"numpy": _NUMPY, "python": _LOOPS}
+if numba is not None:
+    IMPLEMENTATIONS["numba"] = {name: numba.njit(cache=True)(function) for name, function in _LOOPS.items()}
+
+
+def available_backends() -> List[str]:
+    return list(IMPLEMENTATIONS)
+
+
+def _default_backend() -> str:
+    requested = os.environ.get("SKULL_KING_KERNELS")
+    if requested is not None:
+        if requested not in IMPLEMENTATIONS:
+            raise ValueError(f"SKULL_KING_KERNELS={requested!r}, but the available backends are {available_backends()}")
+        return requested
+    return "numba" if numba is not None else "numpy"
+
+
+BACKEND = _default_backend()
+
+
+def set_backend(name: str) -> None:
+    global BACKEND
+    if name not in IMPLEMENTATIONS:
+        raise ValueError(f"Unknown or unavailable kernel backend {name!r}; available: {available_backends()}")
+    BACKEND = name
+
+
+def _kernel(name: str, backend: str = None):
+    return IMPLEMENTATIONS[BACKEND if backend is None else backend][name]
+
+
+#################################### Batched API ####################################
+
+def trick_winners(cards: np.ndarray, backend: str = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Winning position and bonus points of each trick in an [N, P] array of card ids padded with -1."""
+    cards = np.ascontiguousarray(cards, dtype=np.int64)
+    positions = np.zeros(len(cards), dtype=np.int64)
+    bonuses = np.zeros(len(cards), dtype=np.int64)
+    _kernel("trick_winners", backend)(cards, positions, bonuses)
+    return positions, bonuses
+
+
+def legal_masks(hands: np.ndarray, tricks: np.ndarray, backend: str = None) -> np.ndarray:
+    """Boolean [N, 73] masks of the cards in `hands` that may be played onto `tricks` ([N, P], padded with -1)."""
+    hands = np.ascontiguousarray(hands, dtype=np.bool_)
+    tricks = np.ascontiguousarray(tricks, dtype=np.int64).reshape(len(hands), -1)
+    masks = np.zeros_like(hands)
+    _kernel("legal_masks", backend)(hands, tricks, masks)
+    return masks
+
+
+def round_scores(rounds, bets, n_tricks, bonuses, backend: str = None) -> np.ndarray:
+    """Round scores for bets `bets` on tricks `n_tricks` worth `bonuses` bonus points, elementwise."""
+    bets = np.ascontiguousarray(bets, dtype=np.int64)
+    rounds, n_tricks, bonuses = (np.ascontiguousarray(np.broadcast_to(x, bets.shape), dtype=np.int64).ravel()
+                                 for x in (rounds, n_tricks, bonuses))
+    scores = np.zeros(bets.size, dtype=np.int64)
+    _kernel("round_scores", backend)(rounds, bets.ravel(), n_tricks, bonuses, scores)
+    return scores.reshape(bets.shape)
+
+
+def loot_bonuses(loot: np.ndarray, tricks_taken: np.ndarray, bets: np.ndarray, backend: str = None) -> np.ndarray:
+    """Loot bonus per player for [N, 2] alliances (player, starting player of the trick), or (-1, -1)."""
+    loot = np.ascontiguousarray(loot, dtype=np.int64)
+    tricks_taken = np.ascontiguousarray(tricks_taken, dtype=np.int64)
+    bets = np.ascontiguousarray(bets, dtype=np.int64)
+    bonuses = np.zeros(bets.shape, dtype=np.int64)
+    _kernel("loot_bonuses", backend)(loot, tricks_taken, bets, bonuses)
+    return bonuses
+
+
+#################################### fast_engine API ####################################
+
+def trick_winner(cards: Sequence[int]) -> Tuple[int, int]:
+    positions, bonuses = trick_winners(np.array([cards]))
+    return int(positions[0]), int(bonuses[0])
+
+
+def legal_bits(hand_bits: int, cards: Sequence[int]) -> int:
+    hand = np.array([[hand_bits >> i & 1 for i in range(N_CARDS)]], dtype=np.bool_)
+    mask = legal_masks(hand, np.array([cards], dtype=np.int64).reshape(1, -1))[0]
+    return fast_engine.hand_bits(np.flatnonzero(mask).tolist())
+
+
+def compute_score(round_number: int, bet: int, trick_bonuses: Sequence[int]) -> int:
+    return int(round_scores(round_number, [bet], len(trick_bonuses), sum(trick_bonuses))[0])
+
+
+def score_loot(loot: Sequence[int], tricks_taken: Sequence[int], bets: Sequence[int]) -> List[int]:
+    return loot_bonuses([loot], [tricks_taken], [bets])[0].tolist()
+
+
+#################################### Benchmarks ####################################
+
+def random_batch(n: int, n_players: int = 4, seed: int = 0) -> dict:
+    """Random inputs for every kernel: full tricks, hands with tricks in progress, and scores."""
+    rng = np.random.default_rng(seed)
+    deals = np.argsort(rng.random((n, N_CARDS)), axis=1)
+    hand_size = rng.integers(1, 11, n)
+    hands = np.zeros((n, N_CARDS), dtype=np.bool_)
+    for size in range(1, 11):
+        rows = np.flatnonzero(hand_size == size)
+        hands[rows[:, None], deals[rows, n_players:n_players + size]] = True
+    in_progress = np.where(np.arange(n_players - 1) < rng.integers(0, n_players, n)[:, None],
+                           deals[:, :n_players - 1], -1)
+    return {
+        "tricks": deals[:, :n_players],
+        "hands": hands,
+        "in_progress": in_progress,
+        "rounds": rng.integers(1, 11, n),
+        "bets": rng.integers(0, 4, (n, n_players)),
+        "n_tricks": rng.integers(0, 4, (n, n_players)),
+        "bonuses": 10 * rng.integers(0, 4, (n, n_players)),
+        "loot": np.where(rng.random((n, 1)) < 0.5, rng.integers(0, n_players, (n, 2)), -1),
+    }
+
+
+def benchmark(n: int = 100000, backends: List[str] = None, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """Rows per second of each kernel on each backend (best of `repeat`), plus fast_engine one case at a time."""
+    batch = random_batch(n)
+    calls = {
+        "trick_winners": lambda b: trick_winners(batch["tricks"], b),
+        "legal_masks": lambda b: legal_masks(batch["hands"], batch["in_progress"], b),
+        "round_scores": lambda b: round_scores(batch["rounds"][:, None], batch["bets"], batch["n_tricks"],
+                                               batch["bonuses"], b),
+        "loot_bonuses": lambda b: loot_bonuses(batch["loot"], batch["n_tricks"], batch["bets"], b),
+    }
+    results = {}
+    for backend in backends or available_backends():
+        results[backend] = {}
+        for name, call in calls.items():
+            call(backend)  # compile, or load the compiled kernel from the cache
+            seconds = min(_timed(call, backend) for _ in range(repeat))
+            results[backend][name] = n / seconds
+
+    tricks = batch["tricks"].tolist()
+    hands = [fast_engine.hand_bits(np.flatnonzero(h).tolist()) for h in batch["hands"]]
+    in_progress = [[c for c in row if c >= 0] for row in batch["in_progress"].tolist()]
+    start = time.perf_counter()
+    for cards in tricks:
+        fast_engine.trick_winner(cards)
+    trick_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for hand, cards in zip(hands, in_progress):
+        fast_engine.legal_bits(hand, cards)
+    legal_seconds = time.perf_counter() - start
+    results["fast_engine"] = {"trick_winners": n / trick_seconds, "legal_masks": n / legal_seconds}
+    return results
+
+
+def _timed(call, backend) -> float:
+    start = time.perf_counter()
+    call(backend)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Benchmark the rule kernels on every available backend")
+    parser.add_argument("--n", type=int, default=100000, help="Rows per batch")
+    args = parser.parse_args()
+
+    print(f"default backend: {BACKEND}")
+    for backend, rates in benchmark(args.n).items():
+        print(f"{backend:>12}: " + "  ".join(f"{name} {rate / 1e6:.2f}M/s" for name, rate in rates.items()))
@@ -0,0 +1,442 @@
+"""
+Self-play league: actor-learner training against a pool of frozen snapshots of the learner.
+
+Every `freeze_interval` updates the learner copies its weights into a `SnapshotPool`, a ring of
+inference-only snapshots held in shared memory as flat float16 tensors, so hundreds of them cost
+every actor process nothing beyond the single shared copy. Each game seats `n_learner` copies of
+the current policy against opponents drawn from one snapshot, sampled in favour of the snapshots
+the learner still loses to (prioritized fictitious self-play).
+
+An actor plays `games_per_actor` games at once on threads. Their frozen seats never run a network
+themselves: they hand their observations to a `FrozenPolicyServer`, which waits until every game
+is blocked on it and then serves all pending requests with one forward pass per snapshot. Actors
+report how much of each game's wall time the frozen seats took (waiting for their batch
+included) and how much of the actor's time went into their forward passes, so the cost of the
+league's opponents can be weighed against the learner's own acting.
+"""
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from torch.func import functional_call
+
+from skull_king import game
+from skull_king.agents import BaseAgent, RLAgent
+from skull_king.agents.rl_agent import BidNetwork, PlayNetwork
+from skull_king.batching import BatchingServer
+from skull_king.distributed import SharedPolicy, _OutboxMemory
+from skull_king.obs import bid_mask, encode_obs
+
+
+# Served in place of the outputs of a snapshot that has been overwritten (None means "not served yet")
+_STALE = object()
+
+
+def _flatten(network: torch.nn.Module) -> torch.Tensor:
+    return torch.cat([p.detach().reshape(-1) for p in network.parameters()])
+
+
+class SnapshotPool:
+    """
+    Up to `capacity` frozen bid/play network pairs in shared memory, with per-snapshot results.
+
+    Snapshots are stored flattened in `dtype` (float16 by default, half the memory of the live
+    networks) and cast back to float32 when served. Once the pool is full, each freeze
+    overwrites the oldest snapshot.
+    """
+    def __init__(self, capacity: int, n_obs: int, ctx=mp, dtype: torch.dtype = torch.float16,
+                 max_seats: int = None) -> None:
+        self.capacity = capacity
+        self.n_obs = n_obs
+        self.max_seats = max_seats
+        self._templates = (BidNetwork(n_obs), PlayNetwork(n_obs, len(game.ALL_CARDS)))
+        self.bid_weights = torch.zeros(capacity, sum(p.numel() for p in self._templates[0].parameters()),
+                                       dtype=dtype).share_memory_()
+        self.play_weights = torch.zeros(capacity, sum(p.numel() for p in self._templates[1].parameters()),
+                                        dtype=dtype).share_memory_()
+        # Results of the learner against each snapshot since it was frozen
+        self.games = torch.zeros(capacity, dtype=torch.float64).share_memory_()
+        self.learner_wins = torch.zeros(capacity, dtype=torch.float64).share_memory_()
+        # Bumped whenever a slot is overwritten, so stale results and cached weights can be told apart
+        self.generation = torch.zeros(capacity, dtype=torch.int64).share_memory_()
+        self.frozen = ctx.Value("q", 0)
+        self.lock = ctx.Lock()
+
+    def __len__(self) -> int:
+        return min(self.frozen.value, self.capacity)
+
+    def freeze(self, agent: RLAgent) -> int:
+        """Copy `agent`'s current networks into the pool and return the slot they went to."""
+        with self.lock:
+            slot = self.frozen.value % self.capacity
+            self.bid_weights[slot] = _flatten(agent.bid_network)
+            self.play_weights[slot] = _flatten(agent.play_network)
+            self.games[slot] = 0
+            self.learner_wins[slot] = 0
+            self.generation[slot] += 1
+            self.frozen.value += 1
+            return slot
+
+    def record(self, slot: int, generation: int, result: float) -> None:
+        """Add a game's result for the learner (1 won, 0.5 tied, 0 lost) against snapshot `slot`."""
+        with self.lock:
+            if self.generation[slot] == generation:
+                self.games[slot] += 1
+                self.learner_wins[slot] += result
+
+    def win_rates(self, prior: float = 0.5) -> np.ndarray:
+        """The learner's win rate against each snapshot, shrunk towards `prior` by one pseudo-game."""
+        n = len(self)
+        return ((self.learner_wins[:n] + prior) / (self.games[:n] + 1)).numpy()
+
+    def sample(self, power: float = 2.0, rng: random.Random = random) -> Tuple[int, int]:
+        """
+        Draw an opponent snapshot, weighted by (1 - learner win rate) ** `power`: opponents the
+        learner already beats are rarely picked, and `power` = 0 samples uniformly.
+        Returns the slot and its generation.
+        """
+        weights = (1 - self.win_rates()) ** power + 1e-6
+        slot = rng.choices(range(len(weights)), weights=weights)[0]
+        return slot, int(self.generation[slot])
+
+    def networks(self, slot: int, generation: int) -> Optional[Tuple[Dict[str, torch.Tensor], Dict[str, torch.Tensor]]]:
+        """
+        Float32 parameters of snapshot `slot`, ready for `functional_call` on the template networks,
+        or None if the slot has been overwritten since `generation`. The weights are copied under
+        the lock, so a concurrent `freeze` can't tear them.
+        """
+        def unflatten(template: torch.nn.Module, flat: torch.Tensor) -> Dict[str, torch.Tensor]:
+            params, start = {}, 0
+            for name, p in template.named_parameters():
+                params[name] = flat[start:start + p.numel()].view_as(p)
+                start += p.numel()
+            return params
+
+        with self.lock:
+            if self.generation[slot] != generation:
+                return None
+            bid_weights = self.bid_weights[slot].to(torch.float32, copy=True)
+            play_weights = self.play_weights[slot].to(torch.float32, copy=True)
+        return unflatten(self._templates[0], bid_weights), unflatten(self._templates[1], play_weights)
+
+    def forward(self, params: Dict[str, torch.Tensor], kind: str, obs: torch.Tensor) -> torch.Tensor:
+        template = self._templates[0] if kind == "bid" else self._templates[1]
+        return functional_call(template, params, (obs,))
+
+
+class FrozenPolicyServer(BatchingServer):
+    """
+    Batches the frozen seats' forward passes across the games an actor plays on threads, with
+    one forward pass per snapshot and network for each batch. Unflattened snapshot weights are
+    kept for the `cache_size` most recently served snapshots. Requests for a snapshot that has
+    been overwritten since it was sampled get None, and the seat draws another one.
+    """
+    def __init__(self, pool: SnapshotPool, n_clients: int, max_wait: float = 0.002, cache_size: int = 8) -> None:
+        super().__init__(n_clients, max_wait)
+        self.pool = pool
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[int, int], tuple]" = OrderedDict()
+
+    def request(self, slot: int, generation: int, kind: str, obs: torch.Tensor) -> Optional[torch.Tensor]:
+        """
+        Output of snapshot `slot`'s `kind` ("bid" or "play") network on the single observation `obs`,
+        or None if the snapshot was overwritten after `generation`.
+        """
+        output = self.submit(((slot, generation), kind), obs)
+        return None if output is _STALE else output
+
+    def _params(self, key: Tuple[int, int]) -> Optional[tuple]:
+        params = self._cache.get(key)
+        if params is not None and int(self.pool.generation[key[0]]) != key[1]:
+            del self._cache[key]
+            return None
+        if params is None:
+            params = self.pool.networks(*key)
+            if params is None:
+                return None
+            self._cache[key] = params
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return params
+
+    @torch.no_grad()
+    def _serve(self, group: tuple, observations: List[torch.Tensor]) -> torch.Tensor:
+        key, kind = group
+        params = self._params(key)
+        if params is None:
+            return [_STALE] * len(observations)
+        bid_params, play_params = params
+        return self.pool.forward(bid_params if kind == "bid" else play_params, kind, torch.stack(observations))
+
+    def stats(self) -> dict:
+        return {
+            "frozen_decisions": self.decisions,
+            "frozen_batches": self.batches,
+            "mean_batch_size": self.decisions / self.batches if self.batches else 0.0,
+            "frozen_compute_seconds": self.compute_seconds,
+            "seconds": time.perf_counter() - self.started,
+        }
+
+
+class FrozenAgent(BaseAgent):
+    """A seat played by a pool snapshot through a FrozenPolicyServer. Bids greedily and samples its plays."""
+    def __init__(self, id: int, server: FrozenPolicyServer, slot: int = 0, generation: int = 0) -> None:
+        super().__init__(id)
+        self.server = server
+        self.slot = slot
+        self.generation = generation
+        self.seconds = 0.0  # wall time spent deciding, including waiting for the batch
+
+    def _request(self, kind: str, obs: torch.Tensor) -> torch.Tensor:
+        output = self.server.request(self.slot, self.generation, kind, obs)
+        while output is None:
+            # The learner froze itself over this snapshot: play on with another one
+            self.slot, self.generation = self.server.pool.sample()
+            output = self.server.request(self.slot, self.generation, kind, obs)
+        return output
+
+    def bid(self, game_state: dict) -> int:
+        start = time.perf_counter()
+        obs = torch.from_numpy(encode_obs(self.hand, game_state, self.id, max_seats=self.server.pool.max_seats))
+        probs = self._request("bid", obs)
+        mask = torch.from_numpy(bid_mask(game_state["current_round"]))
+        bid = probs.masked_fill(~mask, float('-inf')).argmax().item()
+        self.seconds += time.perf_counter() - start
+        return bid
+
+    def play(self, game_state: dict) -> game.Card:
+        start = time.perf_counter()
+        obs = torch.from_numpy(encode_obs(self.hand, game_state, self.id, max_seats=self.server.pool.max_seats))
+        logits = self._request("play", obs)
+        legal = torch.from_numpy(self._get_legal_actions(game_state)) != 0
+        probs = torch.softmax(logits.masked_fill(~legal, float('-inf')), dim=-1)
+        card = self.hand.pick_card(torch.multinomial(probs, 1).item())
+        self.seconds += time.perf_counter() - start
+        return card
+
+
+def learner_result(scores: np.ndarray, learner_seats: List[int]) -> float:
+    """1 if the learner's best seat outscored every frozen seat, 0.5 on a tie, else 0."""
+    frozen = np.delete(scores, learner_seats)
+    best = scores[learner_seats].max()
+    if best > frozen.max():
+        return 1.0
+    return 0.5 if best == frozen.max() else 0.0
+
+
+def _game_thread(env, policy: SharedPolicy, pool: SnapshotPool, server: FrozenPolicyServer,
+                 outbox: "queue.Queue", stop, n_learner: int, power: float, seed: int) -> None:
+    rng = random.Random(seed)
+    learner_seats = list(range(len(env.players) - n_learner, len(env.players)))
+    rl_agents = [env.players[i] for i in learner_seats]
+    frozen_agents = [FrozenAgent(i, server) for i in range(len(env.players) - n_learner)]
+    env.players[:len(frozen_agents)] = frozen_agents
+
+    play_memory, bid_memory = _OutboxMemory(), _OutboxMemory()
+    policy_agent = rl_agents[0]
+    for agent in rl_agents:
+        agent.memory = play_memory
+        agent.bid_memory = bid_memory
+        agent.play_network = policy_agent.play_network
+        agent.bid_network = policy_agent.bid_network
+
+    def sync() -> int:
+        version = policy.pull(policy_agent)
+        for agent in rl_agents:
+            agent.games_played = policy_agent.games_played
+        return version
+
+    try:
+        version = sync()
+        while not stop.is_set():
+            slot, generation = pool.sample(power, rng)
+            for agent in frozen_agents:
+                agent.slot, agent.generation, agent.seconds = slot, generation, 0.0
+            start = time.perf_counter()
+            for i in range(1, env.n_rounds + 1):
+                env.round = i
+                env.play_round()
+                env.player_scores += env.score_round()
+                env.cleanup_round()
+                outbox.put(("round", version, play_memory.drain(), bid_memory.drain()))
+                if policy.version.value != version:
+                    version = sync()
+                if stop.is_set():
+                    return
+            elapsed = time.perf_counter() - start
+            frozen_seconds = sum(agent.seconds for agent in frozen_agents)
+            outbox.put(("game", slot, generation, learner_result(env.player_scores, learner_seats),
+                        frozen_seconds, elapsed))
+            env.reset_game()
+    finally:
+        server.leave()
+
+
+def _league_actor_main(actor_id: int, policy: SharedPolicy, pool: SnapshotPool, transitions: mp.Queue, stop,
+                       n_learner: int, n_players: int, games_per_actor: int, power: float, seed: int) -> None:
+    # Imported here so the spawned process doesn't need the caller's globals
+    from skull_king.env import SkullKingGame
+
+    torch.set_num_threads(1)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    server = FrozenPolicyServer(pool, games_per_actor)
+    outbox = queue.Queue()
+    threads = []
+    for g in range(games_per_actor):
+        env = SkullKingGame(n_manual=0, n_random=n_players - n_learner, n_rl=n_learner, max_seats=pool.max_seats)
+        threads.append(threading.Thread(target=_game_thread, daemon=True,
+                                        args=(env, policy, pool, server, outbox, stop, n_learner, power,
+                                              seed * games_per_actor + g)))
+    for thread in threads:
+        thread.start()
+
+    # Forward the games' messages, tagged with the server's counters so far
+    while not stop.is_set() or any(thread.is_alive() for thread in threads):
+        try:
+            message = outbox.get(timeout=0.1)
+        except queue.Empty:
+            if not any(thread.is_alive() for thread in threads):
+                break
+            continue
+        message = (actor_id, server.stats()) + message
+        while not stop.is_set():
+            try:
+                transitions.put(message, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+
+def train_league(learner: RLAgent,
+                 n_actors: int = None,
+                 n_learner: int = 2,
+                 n_players: int = 4,
+                 games_per_actor: int = 8,
+                 pool_size: int = 200,
+                 freeze_interval: int = 100,
+                 power: float = 2.0,
+                 max_updates: int = 10000,
+                 publish_interval: int = 10,
+                 report_interval: float = 10.0,
+                 seed: int = 0) -> dict:
+    """
+    Train `learner` in a league until it has made `max_updates` optimization steps: `n_learner`
+    seats of every game play the learner's current policy and the other seats one frozen
+    snapshot from a pool of up to `pool_size`. The learner is frozen into the pool at the start
+    and every `freeze_interval` updates. Returns the final statistics.
+    """
+    if not 0 < n_learner < n_players:
+        raise ValueError("A league game needs at least one learner seat and one frozen seat")
+    if learner.card_sets:
+        raise ValueError("The league's shared policy and snapshot pool hold dense networks, so set networks "
+                         "can't be trained this way")
+    n_cores = os.cpu_count() or 1
+    if n_actors is None:
+        n_actors = max(1, n_cores - 1)
+    torch.set_num_threads(max(1, n_cores - n_actors))
+
+    ctx = mp.get_context("spawn")
+    policy = SharedPolicy(learner._get_obs_size(), ctx)
+    policy.publish(learner)
+    pool = SnapshotPool(pool_size, learner._get_obs_size(), ctx, max_seats=learner.max_seats)
+    pool.freeze(learner)
+    transitions = ctx.Queue(maxsize=64 * n_actors)
+    stop = ctx.Event()
+
+    actors = [ctx.Process(target=_league_actor_main, daemon=True,
+                          args=(i, policy, pool, transitions, stop, n_learner, n_players, games_per_actor,
+                                power, seed + i))
+              for i in range(n_actors)]
+    for actor in actors:
+        actor.start()
+
+    stats = {}
+    updates = 0
+    server_stats = {}
+    window_start = time.perf_counter()
+    window_steps, window_updates, window_games, window_wins = 0, 0, 0, 0.0
+    window_frozen_seconds, window_game_seconds = 0.0, 0.0
+    try:
+        while updates < max_updates:
+            # Take in everything the actors have produced so far, waiting only if there is nothing to train on
+            while True:
+                try:
+                    block = len(learner.memory) < learner.batch_size or len(learner.bid_memory) < learner.batch_size
+                    message = transitions.get(block=block, timeout=1.0)
+                except queue.Empty:
+                    break
+                actor_id, server_stats[actor_id], kind = message[:3]
+                if kind == "round":
+                    _, play_items, bid_items = message[3:]
+                    for item in play_items:
+                        learner.memory.push(item)
+                    for item in bid_items:
+                        learner.bid_memory.push(item)
+                    window_steps += len(play_items)
+                else:
+                    slot, generation, result, frozen_seconds, game_seconds = message[3:]
+                    pool.record(slot, generation, result)
+                    window_games += 1
+                    window_wins += result
+                    window_frozen_seconds += frozen_seconds
+                    window_game_seconds += game_seconds
+
+            before = learner.games_played
+            learner.optimize()
+            if learner.games_played > before:
+                updates += 1
+                window_updates += 1
+                if updates % publish_interval == 0:
+                    policy.publish(learner)
+                if updates % freeze_interval == 0:
+                    pool.freeze(learner)
+
+            elapsed = time.perf_counter() - window_start
+            if elapsed >= report_interval or updates >= max_updates:
+                decisions = sum(s["frozen_decisions"] for s in server_stats.values())
+                batches = sum(s["frozen_batches"] for s in server_stats.values())
+                actor_seconds = sum(s["seconds"] for s in server_stats.values())
+                stats = {
+                    "actor_steps_per_sec": window_steps / elapsed,
+                    "learner_updates_per_sec": window_updates / elapsed,
+                    "games": window_games,
+                    "learner_win_rate": window_wins / window_games if window_games else 0.0,
+                    "frozen_time_fraction": window_frozen_seconds / window_game_seconds if window_game_seconds else 0.0,
+                    "frozen_compute_fraction": sum(s["frozen_compute_seconds"] for s in server_stats.values())
+                    / actor_seconds if actor_seconds else 0.0,
+                    "mean_batch_size": decisions / batches if batches else 0.0,
+                    "frozen_decisions": decisions,
+                    "snapshots": len(pool),
+                    "updates": updates,
+                }
+                logging.info("actor steps/s: {actor_steps_per_sec:.1f}  learner updates/s: {learner_updates_per_sec:.2f}  "
+                             "win rate: {learner_win_rate:.2f} over {games} games  "
+                             "frozen seats: {frozen_time_fraction:.1%} of game time "
+                             "({frozen_compute_fraction:.1%} of actor time in their forward passes), mean batch {mean_batch_size:.1f}  snapshots: {snapshots}".format(**stats))
+                window_start = time.perf_counter()
+                window_steps, window_updates, window_games, window_wins = 0, 0, 0, 0.0
+                window_frozen_seconds, window_game_seconds = 0.0, 0.0
+    finally:
+        stop.set()
+        # Drain so actors blocked on a full queue can exit
+        while any(actor.is_alive() for actor in actors):
+            try:
+                transitions.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for actor in actors:
+            actor.join()
+
+    return stats
@@ -0,0 +1,228 @@
+"""
+Low-overhead training and simulation metrics.
+
+Counters, gauges and latency histograms are kept in the process-wide METRICS registry, which is
+disabled (and costs a single attribute check per instrumented call) until `METRICS.enable(path)`
+is called. Snapshots of the cumulative values are appended to a JSONL (or long-format CSV) file
+every `interval` seconds, and `python -m skull_king.metrics summarize <file>` turns a run's file
+into rates and latency percentiles.
+"""
+import csv
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class Histogram:
+    """
+    Latency histogram with logarithmic buckets, 20 per decade from 100ns to 1000s,
+    so quantiles are accurate to about 6% at any scale.
+    """
+    MIN_VALUE = 1e-7
+    BUCKETS_PER_DECADE = 20
+    N_BUCKETS = 10 * BUCKETS_PER_DECADE
+
+    def __init__(self) -> None:
+        self.buckets = [0] * self.N_BUCKETS
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        if value <= self.MIN_VALUE:
+            index = 0
+        else:
+            index = min(int(math.log10(value / self.MIN_VALUE) * self.BUCKETS_PER_DECADE), self.N_BUCKETS - 1)
+        self.buckets[index] += 1
+        self.count += 1
+        self.sum += value
+
+    @classmethod
+    def bucket_value(cls, index: int) -> float:
+        """Geometric midpoint of a bucket."""
+        return cls.MIN_VALUE * 10 ** ((index + 0.5) / cls.BUCKETS_PER_DECADE)
+
+    @classmethod
+    def quantile_from_buckets(cls, buckets: Dict[int, int], q: float) -> float:
+        total = sum(buckets.values())
+        if total == 0:
+            return 0.0
+        target = q * total
+        seen = 0
+        for index in sorted(buckets):
+            seen += buckets[index]
+            if seen >= target:
+                return cls.bucket_value(index)
+        return cls.bucket_value(max(buckets))
+
+    def quantile(self, q: float) -> float:
+        return self.quantile_from_buckets(self.sparse_buckets(), q)
+
+    def sparse_buckets(self) -> Dict[int, int]:
+        return {i: n for i, n in enumerate(self.buckets) if n}
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.path = None
+        self.interval = 10.0
+        self.reset()
+
+    def reset(self) -> None:
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.start_time = time.time()
+        self.last_flush = time.perf_counter()
+
+    def enable(self, path: str = None, interval: float = 10.0) -> None:
+        """Start collecting, flushing to `path` (.jsonl or .csv) at most every `interval` seconds."""
+        self.reset()
+        self.enabled = True
+        self.path = path
+        self.interval = interval
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            open(path, "w").close()
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def count(self, name: str, n: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name: str, value: float) -> None:
+        self.gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Record the wall-clock time of the block in the `name` histogram."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        return {
+            "time": time.time(),
+            "elapsed": time.time() - self.start_time,
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "histograms": {
+                name: {"count": h.count, "sum": h.sum, "p50": h.quantile(0.5), "p99": h.quantile(0.99),
+                       "buckets": h.sparse_buckets()}
+                for name, h in self.histograms.items()
+            },
+        }
+
+    def maybe_flush(self) -> None:
+        if self.enabled and time.perf_counter() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self.last_flush = time.perf_counter()
+        if not self.enabled or self.path is None:
+            return
+
+        snapshot = self.snapshot()
+        if self.path.endswith(".csv"):
+            # Long format, so new metrics can appear mid-run without changing the header
+            with open(self.path, "a", newline="") as f:
+                writer = csv.writer(f)
+                if f.tell() == 0:
+                    writer.writerow(["time", "elapsed", "metric", "value"])
+                for name, value in _flatten(snapshot).items():
+                    writer.writerow([snapshot["time"], snapshot["elapsed"], name, value])
+        else:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(snapshot) + "\n")
+
+
+def _flatten(snapshot: dict) -> Dict[str, float]:
+    flat = {}
+    for name, value in snapshot["counters"].items():
+        flat[f"counter/{name}"] = value
+    for name, value in snapshot["gauges"].items():
+        flat[f"gauge/{name}"] = value
+    for name, h in snapshot["histograms"].items():
+        for key in ("count", "sum", "p50", "p99"):
+            flat[f"histogram/{name}/{key}"] = h[key]
+    return flat
+
+
+METRICS = Metrics()
+
+
+def load_run(path: str):
+    """Read the snapshots written by METRICS.flush, as a list of flattened {metric: value} dicts."""
+    rows = []
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            by_time = {}
+            for row in csv.DictReader(f):
+                entry = by_time.setdefault(row["time"], {"elapsed": float(row["elapsed"])})
+                entry[row["metric"]] = float(row["value"])
+            rows = list(by_time.values())
+    else:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    snapshot = json.loads(line)
+                    rows.append({"elapsed": snapshot["elapsed"], **_flatten(snapshot)})
+    return rows
+
+
+def summarize(path: str) -> str:
+    rows = load_run(path)
+    if not rows:
+        return f"{path}: no snapshots"
+
+    last = rows[-1]
+    lines = [f"{path}: {len(rows)} snapshots over {last['elapsed']:.1f}s"]
+
+    lines.append("\nThroughput (whole run / last interval):")
+    interval = last["elapsed"] - (rows[-2]["elapsed"] if len(rows) > 1 else 0)
+    previous = rows[-2] if len(rows) > 1 else {}
+    for name in sorted(k for k in last if k.startswith("counter/")):
+        total_rate = last[name] / max(last["elapsed"], 1e-9)
+        last_rate = (last[name] - previous.get(name, 0)) / max(interval, 1e-9)
+        lines.append(f"  {name[8:]:<40} {last[name]:>12.0f}  {total_rate:>10.2f}/s  {last_rate:>10.2f}/s")
+
+    gauges = sorted(k for k in last if k.startswith("gauge/"))
+    if gauges:
+        lines.append("\nGauges (last value):")
+        for name in gauges:
+            lines.append(f"  {name[6:]:<40} {last[name]:>12.4g}")
+
+    histograms = sorted({k.rsplit("/", 1)[0] for k in last if k.startswith("histogram/")})
+    if histograms:
+        lines.append("\nLatency (ms):                                    count        p50        p99    total s")
+        for name in histograms:
+            lines.append(f"  {name[10:]:<40} {last[name + '/count']:>10.0f} {last[name + '/p50'] * 1000:>10.3f} "
+                         f"{last[name + '/p99'] * 1000:>10.3f} {last[name + '/sum']:>10.1f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Summarize a metrics file written during training or simulation")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summarize_parser = subparsers.add_parser("summarize")
+    summarize_parser.add_argument("path", type=str)
+
+    args = parser.parse_args()
+    print(summarize(args.path))
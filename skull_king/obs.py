@@ -0,0 +1,198 @@
+"""
+Observation encoding and reward shaping shared by the learning agents.
+
+Kept free of torch so that torch-free runtimes (e.g. NumpyRLAgent) build exactly the
+observations the networks were trained on.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+from skull_king import game
+
+N_CARDS = len(game.ALL_CARDS)
+N_BIDS = 11  # [0-10]
+N_TRICKS_TAKEN = 10  # [0-9] (can't take the 10th unless the game is over, in which case it doesn't matter)
+MAX_SEATS = 8  # the largest table the seat-relative layout is usually padded to
+
+
+def obs_size(n_players: int = 4, max_seats: int = None) -> int:
+    """Size of an observation for `n_players`, or of the seat-relative layout padded to `max_seats` (see encode_obs)."""
+    cards_played_space = N_CARDS  # cards played in current round
+    hand_space = N_CARDS  # cards in our hand
+    trick_space = N_CARDS  # cards played in current trick
+
+    is_starting_player_space = 1
+
+    # per-player state
+    bid_space = N_BIDS
+    score_space = 1  # raw score value
+    tricks_taken_space = N_TRICKS_TAKEN
+
+    player_id_space = max(4, n_players)  # one-hot of the seat, at least 4 wide as checkpoints expect
+    if max_seats is not None:
+        n_players = max_seats
+        player_id_space = max_seats  # seat mask instead
+    return cards_played_space + hand_space + trick_space + is_starting_player_space \
+        + n_players * (bid_space + score_space + tricks_taken_space) \
+        + player_id_space
+
+
+def _seats(game_state: dict, player_id: int, n_players: int, max_seats: int):
+    """The players whose states are encoded, in order (None for an empty seat), and the table size."""
+    if max_seats is not None:
+        n_players = len(game_state["player_bets"])
+        if n_players > max_seats:
+            raise ValueError(f"Cannot encode a {n_players} player table padded to {max_seats} seats")
+        return [(player_id + i) % n_players for i in range(n_players)] + [None] * (max_seats - n_players), n_players
+    return list(range(n_players)), n_players
+
+
+def _encode_features(features: np.ndarray, game_state: dict, player_id: int, seats: list, n_players: int,
+                     max_seats: int) -> None:
+    """Write everything after the card sections (from offset 3 * N_CARDS of an observation) into `features`."""
+    # 4. Encode starting player flag
+    features[0] = 1.0 if game_state["starting_player"] == player_id else 0.0
+    offset = 1
+
+    # 5. Encode player states
+    for i in seats:
+        if i is None:
+            # Empty seat
+            offset += N_BIDS + 1 + N_TRICKS_TAKEN
+            continue
+
+        # Encode bid (one-hot)
+        if i < len(game_state['player_bets']):
+            bid = int(game_state['player_bets'][i])
+            if 0 <= bid <= 10:
+                features[offset + bid] = 1
+        offset += N_BIDS
+
+        # Raw score (continuous value)
+        if i < len(game_state['player_scores']):
+            features[offset] = game_state['player_scores'][i]
+        offset += 1
+
+        # Encode tricks taken (one-hot)
+        if i < len(game_state['tricks_taken']):
+            tricks = int(game_state['tricks_taken'][i])
+            if 0 <= tricks <= 9:
+                features[offset + tricks] = 1
+        offset += N_TRICKS_TAKEN
+
+    # 6. Encode player id, or which seats are in use
+    if max_seats is not None:
+        features[offset:offset + n_players] = 1
+    else:
+        features[offset + player_id] = 1
+
+
+def encode_obs(hand: game.Hand, game_state: dict, player_id: int, n_players: int = 4,
+               max_seats: int = None) -> np.ndarray:
+    """
+    Convert a global game_state from the environment to an observation for `player_id`, who holds `hand`.
+
+    By default the per-player states are in seat order for `n_players` seats and the observation
+    ends with a one-hot of `player_id`. With `max_seats`, the per-player states start with the
+    player's own and continue in playing order, padded to `max_seats` for however many players
+    the state has, and the observation ends with a mask of the seats in use. The size then only
+    depends on `max_seats`, so tables of any size up to it share networks and batches.
+    """
+    seats, n_players = _seats(game_state, player_id, n_players, max_seats)
+    obs = np.zeros(obs_size(n_players, max_seats), dtype=np.float32)
+
+    # 1. Encode cards in hand (one-hot)
+    for card in hand.cards:
+        obs[card.id] = 1
+    offset = N_CARDS
+
+    # 2. Encode cards played in round (one-hot)
+    obs[offset:offset + N_CARDS][np.asarray(game_state['cards_played']) == 1] = 1
+    offset += N_CARDS
+
+    # 3. Encode cards played in current trick (one-hot)
+    for _, card in game_state['current_trick'].cards:
+        obs[offset + card.id] = 1
+    offset += N_CARDS
+
+    _encode_features(obs[offset:], game_state, player_id, seats, n_players, max_seats)
+    return obs
+
+
+class CardSetObs(NamedTuple):
+    """
+    An observation with its three card sections given as the indices of their ones: hand card ids,
+    then N_CARDS + the ids of the cards played this round, then 2 * N_CARDS + the current trick's ids.
+    `features` is the rest of the observation, as encode_obs would give it from offset 3 * N_CARDS.
+    """
+    ids: np.ndarray
+    features: np.ndarray
+
+
+def encode_card_sets(hand: game.Hand, game_state: dict, player_id: int, n_players: int = 4,
+                     max_seats: int = None) -> CardSetObs:
+    """The observation of encode_obs, without building the one-hot card sections (see CardSetObs)."""
+    seats, n_players = _seats(game_state, player_id, n_players, max_seats)
+    ids = np.concatenate([
+        np.array([card.id for card in hand.cards], dtype=np.int64),
+        N_CARDS + np.flatnonzero(np.asarray(game_state['cards_played']) == 1),
+        np.array([2 * N_CARDS + card.id for _, card in game_state['current_trick'].cards], dtype=np.int64),
+    ])
+    features = np.zeros(obs_size(n_players, max_seats) - 3 * N_CARDS, dtype=np.float32)
+    _encode_features(features, game_state, player_id, seats, n_players, max_seats)
+    return CardSetObs(ids, features)
+
+
+def score_indices(n_players: int = 4) -> np.ndarray:
+    """Positions of the raw score values, the only entries of an observation that aren't 0/1."""
+    first = 3 * N_CARDS + 1 + N_BIDS
+    return first + np.arange(n_players) * (N_BIDS + 1 + N_TRICKS_TAKEN)
+
+
+class ObsCodec:
+    """
+    Compact, lossless storage for observations: every 0/1 entry becomes one bit (np.packbits) and
+    the scores, which are whole numbers, are kept as int16. A 4-player observation shrinks from
+    1248 bytes as float32 to 47 bytes. Both directions work on whole batches at once.
+    """
+    def __init__(self, n_players: int = 4, max_seats: int = None) -> None:
+        self.n_players = n_players
+        self.size = obs_size(n_players, max_seats)
+        self.score_index = score_indices(n_players if max_seats is None else max_seats)
+        self.bit_index = np.setdiff1d(np.arange(self.size), self.score_index)
+        self.n_bytes = (len(self.bit_index) + 7) // 8
+
+    def pack(self, obs: np.ndarray):
+        """Encode a (batch, obs size) array, or a single observation, as (bits, scores)."""
+        obs = np.atleast_2d(np.asarray(obs))
+        bits = np.packbits(obs[:, self.bit_index] != 0, axis=1)
+        scores = np.rint(obs[:, self.score_index]).astype(np.int16)
+        return bits, scores
+
+    def unpack(self, bits: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        obs = np.zeros((len(bits), self.size), dtype=np.float32)
+        obs[:, self.bit_index] = np.unpackbits(bits, axis=1, count=len(self.bit_index))
+        obs[:, self.score_index] = scores
+        return obs
+
+
+def bid_mask(current_round: int) -> np.ndarray:
+    """Bids 0..current_round are allowed."""
+    return np.arange(N_BIDS) <= current_round
+
+
+def trick_reward(bid: int, tricks_won: int, bonus_points: int) -> float:
+    """
+    RLAgent's reward for winning a trick, given its bid and the tricks won so far including this
+    one: negative once the bid is exceeded, and the trick's bonus only while working towards it.
+    """
+    if bid == 0:
+        reward = -10
+    elif tricks_won > bid:
+        reward = -2
+    else:
+        reward = 2
+    if reward > 0:
+        reward += bonus_points
+    return reward
@@ -0,0 +1,258 @@
+"""
+Population-based training of RLAgent hyperparameters on one machine.
+
+`population` member processes each train their own RLAgent, with its own hyperparameters, for
+the same number of games per generation; the generation's games are what shares the cores
+fairly between members, with each process limited to its share of torch threads. After each
+generation every member is evaluated in duplicate deals against RandomAgent and against every
+other member. The worst quarter then copy the weights, optimizer state and hyperparameters of a
+member from the best quarter, and perturb the hyperparameters (exploit and explore). Members
+keep their replay memories, so a copied member goes on training on its own experience.
+
+Every member's hyperparameters, fitness and parent are appended to `lineage.jsonl` each
+generation, and the fittest member so far is saved to `best.torch`, loadable as
+"rl:<out_dir>/best.torch":
+
+    python -m skull_king.pbt --population 8 --generations 20 --games 50 --out local/pbt
+"""
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+from typing import Dict, List
+
+import numpy as np
+
+from skull_king.evaluation import evaluate_duplicate, summarize
+
+logger = logging.getLogger(__name__)
+
+# name: (low, high, log scale, integer)
+HYPERPARAMETERS = {
+    "lr": (1e-6, 1e-3, True, False),
+    "bid_lr": (1e-5, 1e-2, True, False),
+    "gamma": (0.8, 0.999, False, False),
+    "eps_decay": (200, 10000, True, False),
+    "batch_size": (32, 512, True, True),
+    "target_update": (1, 20, True, True),
+}
+
+
+def sample_hyperparameters(rng: random.Random) -> dict:
+    hyperparameters = {}
+    for name, (low, high, log, integer) in HYPERPARAMETERS.items():
+        value = math.exp(rng.uniform(math.log(low), math.log(high))) if log else rng.uniform(low, high)
+        hyperparameters[name] = int(round(value)) if integer else value
+    return hyperparameters
+
+
+def perturb(hyperparameters: dict, rng: random.Random, factors=(0.8, 1.25), resample: float = 0.25) -> dict:
+    """Scale each hyperparameter by one of `factors`, or with probability `resample` draw it afresh."""
+    fresh = sample_hyperparameters(rng)
+    perturbed = {}
+    for name, (low, high, _, integer) in HYPERPARAMETERS.items():
+        if rng.random() < resample:
+            perturbed[name] = fresh[name]
+            continue
+        factor = rng.choice(factors)
+        value = hyperparameters[name] * factor
+        if integer:
+            value = int(round(value))
+            if value == hyperparameters[name]:
+                # Small integers would never move under rounding
+                value += 1 if factor > 1 else -1
+        value = min(max(value, low), high)
+        perturbed[name] = int(value) if integer else float(value)
+    return perturbed
+
+
+def _apply(agent, hyperparameters: dict) -> None:
+    agent.gamma = hyperparameters["gamma"]
+    agent.eps_decay = hyperparameters["eps_decay"]
+    agent.batch_size = hyperparameters["batch_size"]
+    agent.target_update = hyperparameters["target_update"]
+    agent.set_learning_rates(hyperparameters["lr"], hyperparameters["bid_lr"])
+
+
+def _member_main(conn, n_rl: int, n_threads: int, seed: int) -> None:
+    # Imported here so the spawned process doesn't need the caller's globals
+    import torch
+
+    from skull_king.agents import RLAgent
+    from skull_king.env import SkullKingGame
+
+    torch.set_num_threads(n_threads)
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    env = SkullKingGame(n_manual=0, n_random=4 - n_rl, n_rl=n_rl)
+    # All RL seats play the one learner's networks, and feed its replay memories
+    rl_agents = [player for player in env.players if isinstance(player, RLAgent)]
+    learner = rl_agents[0]
+    for agent in rl_agents[1:]:
+        agent.play_network = learner.play_network
+        agent.bid_network = learner.bid_network
+
+    while True:
+        command, *args = conn.recv()
+        if command == "train":
+            n_games, = args
+            for _ in range(n_games):
+                for i in range(1, env.n_rounds + 1):
+                    env.round = i
+                    env.play_round()
+                    env.player_scores += env.score_round()
+                    env.cleanup_round()
+                    learner.optimize()
+                env.reset_game()
+                for agent in rl_agents[1:]:
+                    agent.games_played = learner.games_played
+            conn.send(learner.games_played)
+        elif command == "set":
+            state, hyperparameters = args
+            if state is not None:
+                learner.load_training_state(state)
+            _apply(learner, hyperparameters)
+            for agent in rl_agents:
+                agent.eps_decay = hyperparameters["eps_decay"]
+            conn.send(None)
+        elif command == "state":
+            conn.send(learner.training_state())
+        elif command == "save":
+            path, = args
+            learner.save(path)
+            conn.send(None)
+        elif command == "stop":
+            conn.close()
+            return
+
+
+class _Member:
+    def __init__(self, index: int, ctx, n_rl: int, n_threads: int, seed: int, hyperparameters: dict) -> None:
+        self.index = index
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_member_main, args=(child, n_rl, n_threads, seed), daemon=True)
+        self.process.start()
+        self.hyperparameters = hyperparameters
+        self.parent: int = None
+        self.call("set", None, hyperparameters)
+
+    def call(self, command: str, *args):
+        self.conn.send((command, *args))
+        return self.conn.recv()
+
+
+def _fitness(checkpoints: List[str], n_deals: int, n_workers: int, seed: int) -> Dict[str, np.ndarray]:
+    """Per member, the duplicate score difference per game against RandomAgent and against each member."""
+    m = len(checkpoints)
+    specs = [f"rl:{path}" for path in checkpoints]
+    vs_random = np.array([summarize(evaluate_duplicate([spec, "random", spec, "random"], n_deals,
+                                                       n_workers=n_workers, seed=seed))["difference"]
+                          for spec in specs])
+    vs_members = np.zeros((m, m))
+    for a in range(m):
+        for b in range(a + 1, m):
+            summary = summarize(evaluate_duplicate([specs[a], specs[b], specs[a], specs[b]], n_deals,
+                                                   n_workers=n_workers, seed=seed))
+            vs_members[a, b], vs_members[b, a] = summary["difference"], -summary["difference"]
+    return {"vs_random": vs_random, "vs_members": vs_members}
+
+
+def train_population(out_dir: str,
+                     population: int = 8,
+                     generations: int = 20,
+                     games_per_generation: int = 50,
+                     n_deals: int = 20,
+                     n_rl: int = 2,
+                     truncation: float = 0.25,
+                     seed: int = 0) -> dict:
+    """
+    Run population-based training and return the best member's fitness and hyperparameters.
+    A member's fitness is its mean score difference per game against RandomAgent plus its mean
+    difference against the other members, each measured over `n_deals` duplicate deals.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    n_cores = os.cpu_count() or 1
+    ctx = multiprocessing.get_context("spawn")
+    members = [_Member(i, ctx, n_rl, max(1, n_cores // population), seed + i, sample_hyperparameters(rng))
+               for i in range(population)]
+    checkpoints = [os.path.join(out_dir, f"member_{i}.torch") for i in range(population)]
+    n_exploit = max(1, int(population * truncation))
+
+    best = {"fitness": -math.inf}
+    try:
+        with open(os.path.join(out_dir, "lineage.jsonl"), "a") as lineage:
+            for generation in range(generations):
+                # Every member trains the same number of games, all at once
+                for member in members:
+                    member.conn.send(("train", games_per_generation))
+                updates = [member.conn.recv() for member in members]
+
+                for member, path in zip(members, checkpoints):
+                    member.call("save", path)
+                results = _fitness(checkpoints, n_deals, n_cores, seed + generation)
+                fitness = results["vs_random"] + results["vs_members"].sum(axis=1) / max(1, population - 1)
+
+                for member in members:
+                    lineage.write(json.dumps({
+                        "generation": generation,
+                        "member": member.index,
+                        "parent": member.parent,
+                        "updates": updates[member.index],
+                        "fitness": float(fitness[member.index]),
+                        "vs_random": float(results["vs_random"][member.index]),
+                        "hyperparameters": member.hyperparameters,
+                    }) + "\n")
+                lineage.flush()
+
+                ranking = np.argsort(-fitness)
+                leader = int(ranking[0])
+                logger.info(f"generation {generation}: best member {leader} fitness {fitness[leader]:+.1f} "
+                            f"({results['vs_random'][leader]:+.1f} against random)")
+                if fitness[leader] > best["fitness"]:
+                    members[leader].call("save", os.path.join(out_dir, "best.torch"))
+                    best = {"fitness": float(fitness[leader]), "generation": generation, "member": leader,
+                            "vs_random": float(results["vs_random"][leader]),
+                            "hyperparameters": members[leader].hyperparameters}
+                    with open(os.path.join(out_dir, "best.json"), "w") as f:
+                        json.dump(best, f, indent=2)
+
+                # Exploit and explore
+                for member in members:
+                    member.parent = None
+                if generation < generations - 1:
+                    for loser in ranking[-n_exploit:]:
+                        winner = members[int(rng.choice(ranking[:n_exploit]))]
+                        hyperparameters = perturb(winner.hyperparameters, rng)
+                        members[loser].call("set", winner.call("state"), hyperparameters)
+                        members[loser].hyperparameters = hyperparameters
+                        members[loser].parent = winner.index
+    finally:
+        for member in members:
+            if member.process.is_alive():
+                member.conn.send(("stop",))
+            member.process.join()
+    return best
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Population-based training of RLAgent hyperparameters")
+    parser.add_argument("--out", type=str, default="local/pbt", help="Directory for the lineage log and checkpoints")
+    parser.add_argument("--population", type=int, default=8)
+    parser.add_argument("--generations", type=int, default=20)
+    parser.add_argument("--games", type=int, default=50, help="Training games per member per generation")
+    parser.add_argument("--deals", type=int, default=20, help="Duplicate deals per evaluation match")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    best = train_population(args.out, args.population, args.generations, args.games, args.deals, seed=args.seed)
+    print(f"Best: member {best['member']} of generation {best['generation']}, fitness {best['fitness']:+.1f}, "
+          f"{best['hyperparameters']}")
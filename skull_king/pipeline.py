@@ -0,0 +1,217 @@
+"""
+Pipelined single-process training: a learner thread optimizes while the simulation thread plays.
+
+Each RLAgent seat gets an unseated learner twin that shares its replay memories. The learner
+thread keeps sampling and stepping the twins' optimizers (torch releases the GIL during the heavy
+ops, so this overlaps with simulation). The seats keep acting with a snapshot of the weights,
+which the learner republishes every `refresh_interval` updates and the simulation thread swaps in
+at the next round boundary, so acting never waits on a lock.
+"""
+import copy
+import threading
+import time
+from typing import List
+
+import numpy as np
+
+from skull_king.agents import RLAgent
+from skull_king.env import SkullKingGame
+
+
+class PipelinedTrainer:
+    def __init__(self,
+                 game: SkullKingGame,
+                 refresh_interval: int = 10,
+                 updates_per_transition: float = None) -> None:
+        """
+        `updates_per_transition` caps the update-to-data ratio: the learner pauses whenever it has
+        made more optimization steps than this many per transition collected. None lets it run freely.
+        """
+        self.game = game
+        self.refresh_interval = refresh_interval
+        self.updates_per_transition = updates_per_transition
+
+        self.seats: List[RLAgent] = [p for p in game.players if isinstance(p, RLAgent)]
+        self.lock = threading.Lock()
+        self.learners: List[RLAgent] = []
+        for seat in self.seats:
+            # Copies of the seat's networks, so twins match its observation layout and network family
+            learner = RLAgent(seat.id, bid_network=copy.deepcopy(seat.bid_network),
+                              play_network=copy.deepcopy(seat.play_network),
+                              target_network=copy.deepcopy(seat.target_network),
+                              play_memory=seat.memory, bid_memory=seat.bid_memory,
+                              batch_size=seat.batch_size, gamma=seat.gamma, eps_start=seat.eps_start,
+                              eps_end=seat.eps_end, eps_decay=seat.eps_decay, target_update=seat.target_update,
+                              lr=seat.play_optimizer.param_groups[0]["lr"],
+                              bid_lr=seat.bid_optimizer.param_groups[0]["lr"], max_seats=seat.max_seats)
+            learner.load_training_state(seat.training_state())
+            self.learners.append(learner)
+
+        self.updates = 0
+        self.transitions = 0
+        self._published_at = 0
+        self._pending = None  # weight snapshots waiting for the simulation thread
+        self._stop = threading.Event()
+        self._error: BaseException = None
+
+    def _ratio_reached(self) -> bool:
+        return self.updates_per_transition is not None \
+            and self.updates >= self.updates_per_transition * self.transitions
+
+    def _learner_loop(self) -> None:
+        try:
+            while not self._stop.is_set():
+                if self._ratio_reached():
+                    time.sleep(0.001)
+                    continue
+
+                progressed = False
+                for learner in self.learners:
+                    before = learner.games_played
+                    learner.optimize()
+                    if learner.games_played > before:
+                        self.updates += 1
+                        progressed = True
+                if not progressed:
+                    time.sleep(0.01)  # not enough experience yet
+
+                if self.updates - self._published_at >= self.refresh_interval:
+                    self._publish()
+        except BaseException as e:
+            self._error = e
+
+    def _publish(self) -> None:
+        self._published_at = self.updates
+        self._pending = [
+            ({k: v.detach().clone() for k, v in learner.bid_network.state_dict().items()},
+             {k: v.detach().clone() for k, v in learner.play_network.state_dict().items()},
+             learner.games_played)
+            for learner in self.learners
+        ]
+
+    def _refresh(self) -> None:
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        for seat, (bid_state, play_state, games_played) in zip(self.seats, pending):
+            seat.bid_network.load_state_dict(bid_state)
+            seat.play_network.load_state_dict(play_state)
+            seat.games_played = games_played
+
+    def run(self, num_episodes: int) -> None:
+        """Play `num_episodes` games with the learner thread running alongside, then sync the seats."""
+        for agent in self.seats + self.learners:
+            agent.memory_lock = self.lock
+
+        self._stop.clear()
+        learner_thread = threading.Thread(target=self._learner_loop, name="learner", daemon=True)
+        learner_thread.start()
+        try:
+            for _ in range(num_episodes):
+                for i in range(1, self.game.n_rounds + 1):
+                    self.game.round = i
+                    self.game.play_round()
+                    self.game.player_scores += self.game.score_round()
+                    self.transitions += sum(len(seat.round_traj) for seat in self.seats)
+                    self.game.cleanup_round()
+                    self._refresh()
+                    if self._error is not None:
+                        raise self._error
+                self.game.reset_game()
+        finally:
+            self._stop.set()
+            learner_thread.join()
+
+        # Leave the seats holding the latest learner state, e.g. for saving or checkpointing
+        for seat, learner in zip(self.seats, self.learners):
+            seat.load_training_state(learner.training_state())
+        if self._error is not None:
+            raise self._error
+
+
+class SerialTrainer:
+    """The plain train.py loop (simulate a round, then optimize every seat), for comparison."""
+    def __init__(self, game: SkullKingGame) -> None:
+        self.game = game
+        self.seats: List[RLAgent] = [p for p in game.players if isinstance(p, RLAgent)]
+
+    def run(self, num_episodes: int) -> None:
+        for _ in range(num_episodes):
+            for i in range(1, self.game.n_rounds + 1):
+                self.game.round = i
+                self.game.play_round()
+                self.game.player_scores += self.game.score_round()
+                self.game.cleanup_round()
+                for seat in self.seats:
+                    seat.optimize()
+            self.game.reset_game()
+
+
+def evaluate_against_random(seats: List[RLAgent], n_games: int = 50) -> float:
+    """
+    Mean final score of copies of `seats`, acting without exploration, minus the mean score of the
+    RandomAgents filling the other seats.
+    """
+    game = SkullKingGame(n_manual=0, n_random=4 - len(seats), n_rl=len(seats))
+    for player, seat in zip(game.players[4 - len(seats):], seats):
+        player.bid_network.load_state_dict(seat.bid_network.state_dict())
+        player.play_network.load_state_dict(seat.play_network.state_dict())
+        player.eps_start = player.eps_end = 0.0
+
+    margins = []
+    for _ in range(n_games):
+        game.play_game()
+        scores = game.player_scores
+        margins.append(scores[4 - len(seats):].mean() - scores[:4 - len(seats)].mean())
+        game.reset_game()
+    return float(np.mean(margins))
+
+
+def time_to_target(pipelined: bool,
+                   target_margin: float,
+                   max_seconds: float = 3600,
+                   eval_every: int = 20,
+                   eval_games: int = 50,
+                   n_agents: int = 2,
+                   **trainer_kwargs) -> float:
+    """
+    Training wall-clock seconds (excluding evaluation) until the RL seats beat RandomAgent by
+    `target_margin` points per game, or None if `max_seconds` runs out first.
+    """
+    game = SkullKingGame(n_manual=0, n_random=4 - n_agents, n_rl=n_agents)
+    trainer = PipelinedTrainer(game, **trainer_kwargs) if pipelined else SerialTrainer(game)
+
+    elapsed = 0.0
+    while elapsed < max_seconds:
+        start = time.perf_counter()
+        trainer.run(eval_every)
+        elapsed += time.perf_counter() - start
+
+        margin = evaluate_against_random(trainer.seats, eval_games)
+        print(f"[{'pipelined' if pipelined else 'serial'}] {elapsed:.0f}s: margin vs random {margin:.1f}")
+        if margin >= target_margin:
+            return elapsed
+    return None
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Compare wall-clock time to beat RandomAgent, serial vs pipelined training")
+    parser.add_argument("--target-margin", type=float, default=20.0)
+    parser.add_argument("--max-seconds", type=float, default=3600)
+    parser.add_argument("--eval-every", type=int, default=20, help="Training games between evaluations")
+    parser.add_argument("--refresh-interval", type=int, default=10)
+    parser.add_argument("--utd", type=float, default=None, help="Max learner updates per transition")
+
+    args = parser.parse_args()
+    times = {}
+    for pipelined in (False, True):
+        kwargs = {"refresh_interval": args.refresh_interval, "updates_per_transition": args.utd} if pipelined else {}
+        times[pipelined] = time_to_target(pipelined, args.target_margin, args.max_seconds, args.eval_every, **kwargs)
+
+    for pipelined, seconds in times.items():
+        name = "pipelined" if pipelined else "serial"
+        print(f"{name:>9}: " + (f"{seconds:.0f}s" if seconds is not None else f"did not reach target in {args.max_seconds:.0f}s"))
+    if None not in times.values():
+        print(f"Speedup: {times[False] / times[True]:.2f}x")
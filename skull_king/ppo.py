@@ -0,0 +1,306 @@
+"""
+On-policy training with PPO, an alternative to RLAgent's per-seat DQN.
+
+Each iteration a `PPOTrainer` plays `n_envs` games at once on threads, their PPOAgent seats
+sharing one network through a BatchingServer, until it has collected at least `n_steps`
+decisions. Every decision keeps the legal-action mask it was taken under. A seat's round (its
+bid and its plays) is one episode whose only reward is the round score at the end. Advantages
+are computed for all episodes at once with GAE as padded array operations, and the network is
+then trained for a few epochs of clipped-surrogate minibatch updates.
+
+`time_to_margin` measures how much training wall time PPO, or the DQN path of train.py, needs
+to beat RandomAgent by a given margin in duplicate evaluation:
+
+    python -m skull_king.ppo --margin 50 --budget 1800
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, List
+
+import numpy as np
+import torch
+
+from skull_king.agents import RLAgent
+from skull_king.agents.ppo_agent import PPOAgent, masked_logits, select_actions
+from skull_king.batching import BatchingServer
+from skull_king.env import SkullKingGame
+from skull_king.evaluation import evaluate_duplicate, summarize
+
+logger = logging.getLogger(__name__)
+
+
+def gae(rewards: np.ndarray, values: np.ndarray, lengths: np.ndarray, gamma: float = 1.0,
+        lam: float = 0.95) -> np.ndarray:
+    """
+    Generalized advantage estimates for a batch of episodes padded to a common length.
+
+    `rewards` and `values` are indexed by [episode, step] and only the first `lengths[e]` steps
+    of episode e are real; every episode ends in a terminal state. A_t = sum_k (gamma lam)^k
+    delta_{t+k}, computed as one matrix product with the upper-triangular discount matrix.
+    """
+    n_steps = values.shape[1]
+    steps = np.arange(n_steps)
+    valid = steps < lengths[:, None]
+    next_values = np.zeros_like(values)
+    next_values[:, :-1] = values[:, 1:] * (steps[1:] < lengths[:, None])
+    deltas = np.where(valid, rewards + gamma * next_values - values, 0.0)
+
+    offsets = steps[None, :] - steps[:, None]  # [t, t + k] -> k
+    discounts = np.where(offsets >= 0, (gamma * lam) ** np.maximum(offsets, 0), 0.0)
+    return deltas @ discounts.T
+
+
+class _PolicyServer(BatchingServer):
+    def __init__(self, network: torch.nn.Module, n_clients: int) -> None:
+        super().__init__(n_clients)
+        self.network = network
+
+    def _serve(self, group, payloads: list) -> list:
+        obs, masks, kinds = zip(*payloads)
+        return select_actions(self.network, np.stack(obs), np.stack(masks), np.array(kinds))
+
+
+class PPOTrainer:
+    def __init__(self,
+                 n_envs: int = 16,
+                 n_learner: int = 2,
+                 n_players: int = 4,
+                 n_steps: int = 4096,
+                 epochs: int = 4,
+                 minibatch_size: int = 512,
+                 lr: float = 3e-4,
+                 gamma: float = 1.0,
+                 lam: float = 0.95,
+                 clip: float = 0.2,
+                 value_coef: float = 0.5,
+                 entropy_coef: float = 0.01,
+                 reward_scale: float = 0.02,
+                 max_seats: int = None) -> None:
+        """
+        Every game seats `n_learner` PPOAgents, sharing one network, and RandomAgents in its
+        other seats. Round scores are multiplied by `reward_scale` to keep returns near unit scale.
+        """
+        self.n_steps = n_steps
+        self.epochs = epochs
+        self.minibatch_size = minibatch_size
+        self.gamma = gamma
+        self.lam = lam
+        self.clip = clip
+        self.value_coef = value_coef
+        self.entropy_coef = entropy_coef
+        self.reward_scale = reward_scale
+
+        self.agent = PPOAgent(0, max_seats=max_seats)
+        self.network = self.agent.network
+        self.optimizer = torch.optim.Adam(self.network.parameters(), lr=lr)
+
+        self.envs: List[SkullKingGame] = []
+        for _ in range(n_envs):
+            env = SkullKingGame(n_manual=0, n_random=n_players, max_seats=max_seats)
+            for seat in range(n_players - n_learner, n_players):
+                env.players[seat] = PPOAgent(seat, network=self.network, max_seats=max_seats)
+                env.players[seat].sink = self._add_episode
+            self.envs.append(env)
+
+        self._lock = threading.Lock()
+        self._episodes = []
+        self._steps = 0
+        self.iterations = 0
+        self.total_steps = 0
+
+    def _add_episode(self, trajectory: list, score: int) -> None:
+        with self._lock:
+            self._episodes.append((trajectory, score))
+            self._steps += len(trajectory)
+
+    def _run_env(self, env: SkullKingGame, server: _PolicyServer) -> None:
+        try:
+            while self._steps < self.n_steps:
+                # Games carry on across iterations, a round at a time
+                if env.round == env.n_rounds:
+                    env.reset_game()
+                env.round += 1
+                env.play_round()
+                env.player_scores += env.score_round()
+                env.cleanup_round()
+        finally:
+            server.leave()
+
+    def collect(self) -> dict:
+        """Play until at least `n_steps` decisions are collected and return them as padded arrays."""
+        self._episodes, self._steps = [], 0
+        server = _PolicyServer(self.network, len(self.envs))
+        for env in self.envs:
+            for player in env.players:
+                if isinstance(player, PPOAgent):
+                    player.server = server
+        threads = [threading.Thread(target=self._run_env, args=(env, server)) for env in self.envs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        episodes = self._episodes
+        lengths = np.array([len(trajectory) for trajectory, _ in episodes])
+        n_episodes, max_length = len(episodes), lengths.max()
+        obs_dim, n_actions = episodes[0][0][0][0].shape[0], episodes[0][0][0][1].shape[0]
+        rollout = {
+            "obs": np.zeros((n_episodes, max_length, obs_dim), dtype=np.float32),
+            "mask": np.zeros((n_episodes, max_length, n_actions), dtype=bool),
+            "kind": np.zeros((n_episodes, max_length), dtype=np.int64),
+            "action": np.zeros((n_episodes, max_length), dtype=np.int64),
+            "log_prob": np.zeros((n_episodes, max_length), dtype=np.float32),
+            "value": np.zeros((n_episodes, max_length), dtype=np.float32),
+            "reward": np.zeros((n_episodes, max_length), dtype=np.float32),
+            "length": lengths,
+            "score": np.array([score for _, score in episodes], dtype=np.float32),
+        }
+        for e, (trajectory, score) in enumerate(episodes):
+            columns = list(zip(*trajectory))
+            for name, column in zip(("obs", "mask", "kind", "action", "log_prob", "value"), columns):
+                rollout[name][e, :len(trajectory)] = np.stack(column) if name in ("obs", "mask") else column
+            rollout["reward"][e, len(trajectory) - 1] = score * self.reward_scale
+        return rollout
+
+    def update(self, rollout: dict) -> dict:
+        """PPO epochs over a collected rollout; returns the mean losses."""
+        advantages = gae(rollout["reward"], rollout["value"], rollout["length"], self.gamma, self.lam)
+        returns = advantages + rollout["value"]
+        valid = np.arange(rollout["value"].shape[1]) < rollout["length"][:, None]
+
+        data = {name: torch.from_numpy(np.ascontiguousarray(rollout[name][valid]))
+                for name in ("obs", "mask", "kind", "action", "log_prob")}
+        data["advantage"] = torch.from_numpy(advantages[valid].astype(np.float32))
+        data["return"] = torch.from_numpy(returns[valid].astype(np.float32))
+        n = len(data["action"])
+
+        losses = []
+        for _ in range(self.epochs):
+            for batch in torch.randperm(n).split(self.minibatch_size):
+                logits, values = self.network(data["obs"][batch])
+                dist = torch.distributions.Categorical(logits=masked_logits(logits, data["mask"][batch]))
+                log_probs = dist.log_prob(data["action"][batch])
+                values = values.gather(1, data["kind"][batch].unsqueeze(1)).squeeze(1)
+
+                advantage = data["advantage"][batch]
+                advantage = (advantage - advantage.mean()) / (advantage.std() + 1e-8)
+                ratio = torch.exp(log_probs - data["log_prob"][batch])
+                policy_loss = -torch.min(ratio * advantage,
+                                         ratio.clamp(1 - self.clip, 1 + self.clip) * advantage).mean()
+                value_loss = (data["return"][batch] - values).pow(2).mean()
+                entropy = dist.entropy().mean()
+                loss = policy_loss + self.value_coef * value_loss - self.entropy_coef * entropy
+
+                self.optimizer.zero_grad()
+                loss.backward()
+                torch.nn.utils.clip_grad_norm_(self.network.parameters(), max_norm=0.5)
+                self.optimizer.step()
+                losses.append((policy_loss.item(), value_loss.item(), entropy.item()))
+
+        policy_loss, value_loss, entropy = np.mean(losses, axis=0)
+        return {"policy_loss": float(policy_loss), "value_loss": float(value_loss), "entropy": float(entropy),
+                "steps": n}
+
+    def iterate(self) -> dict:
+        """Collect one rollout and train on it."""
+        start = time.perf_counter()
+        rollout = self.collect()
+        collected = time.perf_counter()
+        stats = self.update(rollout)
+        self.iterations += 1
+        self.total_steps += stats["steps"]
+        stats.update({
+            "iteration": self.iterations,
+            "mean_round_score": float(rollout["score"].mean()),
+            "collect_seconds": collected - start,
+            "update_seconds": time.perf_counter() - collected,
+        })
+        logger.info("iteration {iteration}: {steps} steps, mean round score {mean_round_score:.1f}, "
+                     "entropy {entropy:.2f}, collect {collect_seconds:.1f}s, update {update_seconds:.1f}s".format(**stats))
+        return stats
+
+    def save(self, filepath: str) -> None:
+        self.agent.save(filepath)
+
+
+def time_to_margin(step: Callable[[], None], save: Callable[[str], str], margin: float = 50.0,
+                   budget: float = 1800.0, eval_interval: float = 60.0, n_deals: int = 50,
+                   seed: int = 0) -> dict:
+    """
+    Call `step` until the agent it trains beats RandomAgent by `margin` points per game, or
+    `budget` seconds of training have passed. Every `eval_interval` seconds of training, `save`
+    writes the agent to the path it is given and returns its agent spec, which is evaluated in an
+    alternating lineup with RandomAgent over `n_deals` duplicate deals. Evaluation time is not
+    counted. Returns the training seconds it took (None if the budget ran out) and every
+    evaluation as (training seconds, score difference).
+    """
+    trained, history = 0.0, []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "agent")
+        while trained < budget:
+            start = time.perf_counter()
+            while time.perf_counter() - start < eval_interval:
+                step()
+            trained += time.perf_counter() - start
+
+            spec = save(path)
+            summary = summarize(evaluate_duplicate([spec, "random", spec, "random"], n_deals, n_workers=1, seed=seed))
+            history.append((trained, summary["difference"]))
+            logger.info(f"{trained:.0f}s trained: {summary['difference']:+.1f} points per game against random")
+            if summary["difference"] >= margin:
+                return {"seconds": trained, "history": history}
+    return {"seconds": None, "history": history}
+
+
+def race(margin: float = 50.0, budget: float = 1800.0, eval_interval: float = 60.0, n_deals: int = 50) -> dict:
+    """time_to_margin for PPO and for train.py's DQN loop, both with two learner seats against two random ones."""
+    results = {}
+
+    trainer = PPOTrainer()
+
+    def save_ppo(path: str) -> str:
+        trainer.save(path + ".ppo")
+        return f"ppo:{path}.ppo"
+
+    results["ppo"] = time_to_margin(trainer.iterate, save_ppo, margin, budget, eval_interval, n_deals)
+
+    game = SkullKingGame(n_manual=0, n_random=2, n_rl=2)
+    learners = [player for player in game.players if isinstance(player, RLAgent)]
+
+    def dqn_game() -> None:
+        # The loop of train.py
+        for i in range(1, game.n_rounds + 1):
+            game.round = i
+            game.play_round()
+            game.player_scores += game.score_round()
+            game.cleanup_round()
+            for player in learners:
+                player.optimize()
+        game.reset_game()
+
+    def save_dqn(path: str) -> str:
+        learners[0].save(path + ".torch")
+        return f"rl:{path}.torch"
+
+    results["dqn"] = time_to_margin(dqn_game, save_dqn, margin, budget, eval_interval, n_deals)
+    return results
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Compare training time to beat RandomAgent with PPO and with DQN")
+    parser.add_argument("--margin", type=float, default=50.0, help="Points per game to beat RandomAgent by")
+    parser.add_argument("--budget", type=float, default=1800.0, help="Training seconds allowed per method")
+    parser.add_argument("--eval-interval", type=float, default=60.0, help="Training seconds between evaluations")
+    parser.add_argument("--deals", type=int, default=50, help="Duplicate deals per evaluation")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    for method, result in race(args.margin, args.budget, args.eval_interval, args.deals).items():
+        seconds = "not reached" if result["seconds"] is None else f"{result['seconds']:.0f}s"
+        print(f"{method}: {seconds}  ({', '.join(f'{t:.0f}s: {d:+.1f}' for t, d in result['history'])})")
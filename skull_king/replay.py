@@ -0,0 +1,487 @@
+import json
+import os
+import random
+from collections import deque
+
+import numpy as np
+
+from skull_king.obs import ObsCodec
+
+
+class ReplayMemory:
+    """
+    Captures interactions between agents and the environment so they can be
+    used to train the neural networks for RL-based agents.
+    """
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.memory = deque([], maxlen=capacity)
+
+    def push(self, x):
+        self.memory.append(x)
+
+    def sample(self, batch_size: int):
+        return random.sample(self.memory, batch_size)
+
+    def state_dict(self) -> dict:
+        # Stored transitions are never modified, so a shallow copy is a consistent snapshot
+        return {"memory": list(self.memory)}
+
+    def load_state_dict(self, state: dict) -> None:
+        self.memory = deque(state["memory"], maxlen=self.memory.maxlen)
+
+    def __len__(self):
+        return len(self.memory)
+
+
+class SumTree:
+    """
+    Binary tree of priorities stored in a flat array, where each node holds the sum of its children.
+
+    Leaves live at [size, 2*size). Updates and prefix-sum lookups are O(log n) and take whole
+    batches of indices at once, so a batch costs one numpy operation per tree level.
+    """
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.depth = max(0, (capacity - 1).bit_length())
+        self.size = 1 << self.depth  # number of leaves, rounded up to a power of two
+        self.tree = np.zeros(2 * self.size, dtype=np.float64)
+
+    @property
+    def total(self) -> float:
+        return self.tree[1]
+
+    def get(self, indices) -> np.ndarray:
+        return self.tree[np.asarray(indices, dtype=np.int64) + self.size]
+
+    def update(self, indices, priorities) -> None:
+        """Set the priority of each leaf in `indices` and recompute the affected parents."""
+        nodes = np.asarray(indices, dtype=np.int64) + self.size
+        self.tree[nodes] = priorities
+
+        # Parents are recomputed from their children rather than adjusted by a delta,
+        # so repeated indices within a batch can't corrupt the sums.
+        nodes = np.unique(nodes >> 1)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            if nodes[0] == 1:
+                break
+            nodes = np.unique(nodes >> 1)
+
+    def find(self, values: np.ndarray) -> np.ndarray:
+        """For each value in [0, total), return the leaf index whose prefix-sum interval contains it."""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = nodes << 1
+            left_sum = self.tree[left]
+            go_right = values >= left_sum
+            values = np.where(go_right, values - left_sum, values)
+            nodes = np.where(go_right, left + 1, left)
+        return nodes - self.size
+
+
+class PrioritizedReplayMemory:
+    """
+    Proportional prioritized experience replay (Schaul et al., 2016) backed by a SumTree.
+
+    Transitions are sampled with probability p_i^alpha / sum_k p_k^alpha, where p_i is the last
+    absolute TD error seen for transition i. Importance-sampling weights correct for the
+    non-uniform sampling, with beta annealed linearly from `beta_start` to 1 over `beta_steps`
+    calls to `sample_weighted`.
+    """
+    def __init__(self,
+                 capacity: int,
+                 alpha: float = 0.6,
+                 beta_start: float = 0.4,
+                 beta_steps: int = 100000,
+                 eps: float = 1e-3) -> None:
+        self.capacity = capacity
+        self.alpha = alpha
+        self.beta_start = beta_start
+        self.beta_steps = beta_steps
+        self.eps = eps
+
+        self.memory = [None] * capacity
+        self.tree = SumTree(capacity)
+        self.position = 0
+        self.size = 0
+        self.max_priority = 1.0
+        self.steps = 0
+
+    @property
+    def beta(self) -> float:
+        return min(1.0, self.beta_start + (1.0 - self.beta_start) * self.steps / self.beta_steps)
+
+    def push(self, x):
+        # New transitions get the largest priority seen so far so they are replayed at least once
+        self.memory[self.position] = x
+        self.tree.update([self.position], [self.max_priority ** self.alpha])
+        self.position = (self.position + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batch_size: int):
+        transitions, _, _ = self.sample_weighted(batch_size)
+        return transitions
+
+    def sample_weighted(self, batch_size: int):
+        """
+        Sample a batch proportionally to priority.
+        Returns (transitions, indices, weights), where `indices` must be handed back to
+        `update_priorities` and `weights` are the importance-sampling weights, normalized
+        so the largest weight in the batch is 1.
+        """
+        # Stratified sampling: one value from each of `batch_size` equal slices of the total
+        total = self.tree.total
+        segment = total / batch_size
+        values = (np.arange(batch_size) + np.random.random_sample(batch_size)) * segment
+        indices = np.minimum(self.tree.find(np.minimum(values, np.nextafter(total, 0))), self.size - 1)
+
+        probs = self.tree.get(indices) / total
+        weights = (self.size * probs) ** -self.beta
+        weights /= weights.max()
+        self.steps += 1
+
+        return [self.memory[i] for i in indices], indices, weights.astype(np.float32)
+
+    def update_priorities(self, indices, td_errors) -> None:
+        priorities = np.abs(np.asarray(td_errors, dtype=np.float64)) + self.eps
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(indices, priorities ** self.alpha)
+
+    def state_dict(self) -> dict:
+        return {
+            "memory": list(self.memory),
+            "tree": self.tree.tree.copy(),
+            "position": self.position,
+            "size": self.size,
+            "max_priority": self.max_priority,
+            "steps": self.steps,
+        }
+
+    def load_state_dict(self, state: dict) -> None:
+        self.memory = list(state["memory"])
+        self.tree.tree[:] = state["tree"]
+        self.position = state["position"]
+        self.size = state["size"]
+        self.max_priority = state["max_priority"]
+        self.steps = state["steps"]
+
+    def __len__(self):
+        return self.size
+
+
+class PackedReplayMemory:
+    """
+    Replay memory holding observations packed with ObsCodec in preallocated arrays, about 55 bytes
+    per transition instead of two float32 observations (~2.5 KB), so it can hold an order of
+    magnitude more experience in the same RAM.
+
+    A transition's next state is not stored a second time: transitions are pushed in trajectory
+    order (as RLAgent.compute_score does), so it is the state in the following slot. If a pushed
+    state is not the previous transition's next state, that next state gets a slot of its own
+    which is never sampled. Bid samples, (state, label), can be stored as well.
+
+    `sample_batch` unpacks a whole batch with a few vectorized numpy operations; `sample` returns
+    tuples shaped like the ones pushed, like the other memories.
+    """
+    HAS_NEXT = 1
+    SAMPLEABLE = 2
+
+    def __init__(self, capacity: int, n_players: int = 4, max_seats: int = None) -> None:
+        """`n_players` and `max_seats` describe the observations, as for encode_obs."""
+        self.capacity = capacity
+        self.codec = ObsCodec(n_players, max_seats)
+        self.bits = np.zeros((capacity, self.codec.n_bytes), dtype=np.uint8)
+        self.scores = np.zeros((capacity, len(self.codec.score_index)), dtype=np.int16)
+        self.actions = np.zeros(capacity, dtype=np.int16)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.flags = np.zeros(capacity, dtype=np.uint8)
+        self.position = 0
+        self.size = 0
+        self.arity = None  # 4 for (state, action, next_state, reward), 2 for (state, label)
+        self._expected_next = None  # next state of the last transition, due to be pushed next
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.bits, self.scores, self.actions, self.rewards, self.flags))
+
+    def _write(self, state, action: int, reward: float, flags: int) -> None:
+        bits, scores = self.codec.pack(np.asarray(state))
+        i = self.position
+        self.bits[i] = bits[0]
+        self.scores[i] = scores[0]
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.flags[i] = flags
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def push(self, x):
+        if self.arity is None:
+            self.arity = len(x)
+        if self.arity == 2:
+            state, label = x
+            self._write(state, label, 0.0, self.SAMPLEABLE)
+            return
+
+        state, action, next_state, reward = x
+        expected, self._expected_next = self._expected_next, next_state
+        if expected is not None and state is not expected and not np.array_equal(state, expected):
+            self._write(expected, 0, 0.0, 0)
+        self._write(state, action, reward, self.SAMPLEABLE | (self.HAS_NEXT if next_state is not None else 0))
+
+    def _sample_indices(self, batch_size: int) -> np.ndarray:
+        last = (self.position - 1) % self.capacity
+        pending = self._expected_next is not None  # the last transition's next state isn't stored yet
+        if self.size - pending <= 0:
+            raise ValueError("Cannot sample from an empty replay memory")
+
+        # Unsampleable slots are rare, so rejection sampling almost always takes one pass
+        indices = np.zeros(0, dtype=np.int64)
+        while len(indices) < batch_size:
+            draw = np.random.randint(0, self.size, 2 * batch_size)
+            valid = (self.flags[draw] & self.SAMPLEABLE).astype(bool)
+            if pending:
+                valid &= draw != last
+            indices = np.concatenate([indices, draw[valid]])
+        return indices[:batch_size]
+
+    def sample_batch(self, batch_size: int) -> dict:
+        """
+        A batch as arrays: state, action and, for transitions, reward, next_state (zeros where
+        there is none) and non_terminal.
+        """
+        indices = self._sample_indices(batch_size)
+        batch = {
+            "state": self.codec.unpack(self.bits[indices], self.scores[indices]),
+            "action": self.actions[indices].astype(np.int64),
+        }
+        if self.arity == 2:
+            return batch
+
+        non_terminal = (self.flags[indices] & self.HAS_NEXT).astype(bool)
+        next_indices = (indices[non_terminal] + 1) % self.capacity
+        next_state = np.zeros_like(batch["state"])
+        next_state[non_terminal] = self.codec.unpack(self.bits[next_indices], self.scores[next_indices])
+        batch.update(reward=self.rewards[indices], next_state=next_state, non_terminal=non_terminal)
+        return batch
+
+    def sample(self, batch_size: int):
+        batch = self.sample_batch(batch_size)
+        if self.arity == 2:
+            return [(s, int(a)) for s, a in zip(batch["state"], batch["action"])]
+        return [(s, int(a), n if nt else None, float(r)) for s, a, n, nt, r
+                in zip(batch["state"], batch["action"], batch["next_state"], batch["non_terminal"], batch["reward"])]
+
+    def state_dict(self) -> dict:
+        return {
+            "bits": self.bits[:self.size].copy(),
+            "scores": self.scores[:self.size].copy(),
+            "actions": self.actions[:self.size].copy(),
+            "rewards": self.rewards[:self.size].copy(),
+            "flags": self.flags[:self.size].copy(),
+            "position": self.position,
+            "arity": self.arity,
+            "expected_next": None if self._expected_next is None else np.asarray(self._expected_next).copy(),
+        }
+
+    def load_state_dict(self, state: dict) -> None:
+        self.size = len(state["flags"])
+        for name in ("bits", "scores", "actions", "rewards", "flags"):
+            getattr(self, name)[:self.size] = state[name]
+        self.position = state["position"]
+        self.arity = state["arity"]
+        self._expected_next = state["expected_next"]
+
+    def __len__(self):
+        return self.size
+
+
+class MemmapReplayMemory:
+    """
+    Replay memory stored as fixed-width records in memory-mapped files, so it can hold more than
+    fits in RAM (the OS page cache keeps the hot part resident) and be read by many processes
+    without copying.
+
+    The buffer is split into `n_shards` ring buffers with exactly one writer each, so writes need
+    no locks: a writer fills a record and only then bumps its shard's head counter, and readers
+    only look at records below the head. Layout of `directory`:
+        meta.json       - record fields, capacity per shard and number of shards
+        shard_{k}.bin   - `capacity` records for shard k
+        shard_{k}.head  - int64 count of records ever written to shard k
+
+    Records are tuples like the ones pushed to ReplayMemory, e.g. (state, action, next_state, reward).
+    The record layout is taken from the first complete push; after that any field may be None
+    (stored as zeros plus a flag). Opening an existing directory picks up where the previous writer left off, so the
+    buffer survives a restart. A slot being overwritten while it is read can come back torn; for
+    a replay buffer that is an acceptable price for lock-free access.
+    """
+    def __init__(self, directory: str, capacity: int = 100000, shard: int = 0, n_shards: int = 1,
+                 readonly: bool = False) -> None:
+        self.directory = directory
+        self.capacity = capacity
+        self.shard = shard
+        self.n_shards = n_shards
+        self.readonly = readonly
+
+        self.fields = None
+        self.dtype = None
+        self._shards = {}  # shard id -> (records, head)
+        self._pending = []
+
+        if os.path.exists(self._meta_path):
+            self._load_meta()
+        elif readonly:
+            raise FileNotFoundError(f"No replay memory found in {directory}")
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def open(cls, directory: str) -> "MemmapReplayMemory":
+        """Attach a read-only view of an existing buffer, e.g. from a learner process."""
+        return cls(directory, readonly=True)
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def _shard_path(self, shard: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"shard_{shard}.{suffix}")
+
+    def _load_meta(self) -> None:
+        with open(self._meta_path) as f:
+            meta = json.load(f)
+        self.capacity = meta["capacity"]
+        self.n_shards = meta["n_shards"]
+        self.fields = [(name, dtype, tuple(shape)) for name, dtype, shape in meta["fields"]]
+        self.dtype = self._record_dtype(self.fields)
+
+    def _create_meta(self, x) -> None:
+        fields = []
+        for i, value in enumerate(x):
+            value = np.asarray(value)
+            fields.append((f"f{i}", value.dtype.str, value.shape))
+
+        tmp_path = self._meta_path + f".{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"capacity": self.capacity, "n_shards": self.n_shards, "fields": fields}, f)
+        os.replace(tmp_path, self._meta_path)
+        self._load_meta()
+
+    @staticmethod
+    def _record_dtype(fields) -> np.dtype:
+        return np.dtype([(name, dtype, shape) for name, dtype, shape in fields] + [("missing", np.uint8)])
+
+    def _attach(self, shard: int):
+        """Map a shard's files, creating them if this process is the shard's writer."""
+        if shard in self._shards:
+            return self._shards[shard]
+
+        writer = not self.readonly and shard == self.shard
+        records_path = self._shard_path(shard, "bin")
+        head_path = self._shard_path(shard, "head")
+        if not os.path.exists(head_path):
+            if not writer:
+                return None
+            # Sparse files: disk blocks are only allocated as records are written
+            np.memmap(records_path, dtype=self.dtype, mode="w+", shape=(self.capacity,)).flush()
+            np.memmap(head_path, dtype=np.int64, mode="w+", shape=(1,)).flush()
+
+        mode = "r+" if writer else "r"
+        records = np.memmap(records_path, dtype=self.dtype, mode=mode, shape=(self.capacity,))
+        head = np.memmap(head_path, dtype=np.int64, mode=mode, shape=(1,))
+        self._shards[shard] = (records, head)
+        return self._shards[shard]
+
+    def push(self, x):
+        if self.readonly:
+            raise RuntimeError("Cannot push to a read-only replay memory")
+        if self.fields is None:
+            # The layout can only be inferred from a record with every field present, so
+            # hold records back until one arrives (e.g. terminal transitions of round 1)
+            if any(value is None for value in x):
+                self._pending.append(x)
+                return
+            self._create_meta(x)
+            pending, self._pending = self._pending, []
+            for record in pending:
+                self.push(record)
+
+        records, head = self._attach(self.shard)
+        slot = records[int(head[0]) % self.capacity]
+        missing = 0
+        for i, ((name, _, _), value) in enumerate(zip(self.fields, x)):
+            if value is None:
+                missing |= 1 << i
+                slot[name] = 0
+            else:
+                slot[name] = np.asarray(value)
+        slot["missing"] = missing
+
+        # Publish the record only once it is fully written
+        head[0] += 1
+
+    def _fills(self) -> np.ndarray:
+        fills = np.zeros(self.n_shards, dtype=np.int64)
+        if self.fields is None:
+            return fills
+        for shard in range(self.n_shards):
+            attached = self._attach(shard)
+            if attached is not None:
+                fills[shard] = min(int(attached[1][0]), self.capacity)
+        return fills
+
+    def sample_records(self, batch_size: int) -> np.ndarray:
+        """Sample a batch uniformly over all shards as a structured array of records."""
+        fills = self._fills()
+        positions = np.random.randint(0, fills.sum(), size=batch_size)
+        bounds = np.cumsum(fills)
+        shards = np.searchsorted(bounds, positions, side="right")
+        offsets = positions - (bounds - fills)[shards]
+
+        batch = np.empty(batch_size, dtype=self.dtype)
+        for shard in np.unique(shards):
+            selected = shards == shard
+            batch[selected] = self._shards[shard][0][offsets[selected]]
+        return batch
+
+    def sample(self, batch_size: int):
+        batch = self.sample_records(batch_size)
+        transitions = []
+        for record in batch:
+            missing = int(record["missing"])
+            transitions.append(tuple(
+                None if missing & (1 << i) else self._unwrap(record[name])
+                for i, (name, _, _) in enumerate(self.fields)
+            ))
+        return transitions
+
+    @staticmethod
+    def _unwrap(value):
+        return value.item() if np.ndim(value) == 0 else value
+
+    def flush(self) -> None:
+        """Force written records to disk; the OS does this lazily otherwise."""
+        for records, head in self._shards.values():
+            if records.mode == "r+":
+                records.flush()
+                head.flush()
+
+    def state_dict(self) -> dict:
+        # The records already live on disk, so a checkpoint only needs to point at them
+        self.flush()
+        return {"directory": os.path.abspath(self.directory)}
+
+    def load_state_dict(self, state: dict) -> None:
+        if os.path.abspath(self.directory) != state["directory"]:
+            raise ValueError(f"Checkpoint refers to the replay memory in {state['directory']}, not {self.directory}")
+
+    def __len__(self):
+        return int(self._fills().sum())
+
+    def __getstate__(self):
+        # Pickle the location rather than the mapped data, so other processes re-map the same files
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        return state
@@ -0,0 +1,112 @@
+"""
+Training on single rounds instead of whole games.
+
+A game's late rounds deal the most cards, produce most of the score variance and are the hardest
+to bid, yet a game plays each round once. `train_round_slices` instead starts each game directly
+at a round drawn from a `RoundSampler` (see `SkullKingGame.start_round`), plays that one round and
+optimizes, so the simulation budget goes where it is wanted. With `adaptive` sampling the
+weights follow how often the learning agents miss their bids in each round.
+
+The cumulative scores the round starts from come from a `ScoreBank` of scores seen at the start
+of each round. Every slice played adds its final scores as a sample for the next round, so the
+bank fills itself from round 1 (which always starts at zero) upwards.
+"""
+import random
+from typing import List, Sequence
+
+import numpy as np
+
+from skull_king.agents import RLAgent
+from skull_king.env import SkullKingGame
+
+
+class RoundSampler:
+    def __init__(self, n_rounds: int = 10, weights: Sequence[float] = None, adaptive: bool = False,
+                 decay: float = 0.99, floor: float = 0.05) -> None:
+        """
+        `weights` are the relative frequencies of rounds 1..n_rounds, by default proportional to
+        the round number (i.e. to the decisions each round takes). With `adaptive`, each weight is
+        further multiplied by the round's bid miss rate (an exponential moving average with
+        `decay`) plus `floor`, so rounds the agents already bid well are still visited.
+        """
+        if weights is None:
+            weights = range(1, n_rounds + 1)
+        if len(weights) != n_rounds:
+            raise ValueError(f"Expected {n_rounds} round weights, got {len(weights)}")
+        self.n_rounds = n_rounds
+        self.base_weights = np.asarray(weights, dtype=float)
+        self.adaptive = adaptive
+        self.decay = decay
+        self.floor = floor
+        self.miss_rates = np.full(n_rounds, 0.5)
+
+    def weights(self) -> np.ndarray:
+        """The current probability of each round."""
+        weights = self.base_weights * (self.miss_rates + self.floor if self.adaptive else 1.0)
+        return weights / weights.sum()
+
+    def sample(self, rng: random.Random = random) -> int:
+        return rng.choices(range(1, self.n_rounds + 1), weights=self.weights())[0]
+
+    def update(self, round_number: int, missed: float) -> None:
+        """Record the fraction of learning agents who missed their bid in a round just played."""
+        i = round_number - 1
+        self.miss_rates[i] = self.decay * self.miss_rates[i] + (1 - self.decay) * missed
+
+
+class ScoreBank:
+    """Cumulative score vectors seen at the start of each round, up to `capacity` per round."""
+    def __init__(self, n_rounds: int = 10, capacity: int = 1000) -> None:
+        self.capacity = capacity
+        self.samples: List[List[np.ndarray]] = [[] for _ in range(n_rounds + 1)]
+
+    def add(self, round_number: int, scores: np.ndarray) -> None:
+        if round_number >= len(self.samples):
+            return
+        samples = self.samples[round_number]
+        if len(samples) < self.capacity:
+            samples.append(np.array(scores))
+        else:
+            samples[random.randrange(self.capacity)] = np.array(scores)
+
+    def sample(self, round_number: int, n_players: int, rng: random.Random = random) -> np.ndarray:
+        """
+        Scores to start `round_number` from: a stored vector for that round with its seats
+        shuffled, or zeros if none has been seen yet (and always for round 1).
+        """
+        samples = [s for s in self.samples[round_number] if len(s) == n_players] if round_number > 1 else []
+        if not samples:
+            return np.zeros(n_players)
+        scores = rng.choice(samples).copy()
+        rng.shuffle(scores)
+        return scores
+
+
+def train_round_slices(game: SkullKingGame, n_slices: int, sampler: RoundSampler = None,
+                       bank: ScoreBank = None, rng: random.Random = random) -> np.ndarray:
+    """
+    Play `n_slices` single rounds in `game`, optimizing its RLAgents after each one like the
+    training loop of train.py. Returns how many times each round was played.
+    """
+    if sampler is None:
+        sampler = RoundSampler(game.n_rounds)
+    if bank is None:
+        bank = ScoreBank(game.n_rounds)
+    learners = [i for i, player in enumerate(game.players) if isinstance(player, RLAgent)]
+    counts = np.zeros(game.n_rounds, dtype=int)
+
+    for _ in range(n_slices):
+        round_number = sampler.sample(rng)
+        counts[round_number - 1] += 1
+        game.start_round(round_number, bank.sample(round_number, game.n_players, rng))
+        game.play_round()
+        if learners:
+            missed = np.mean([game.tricks_taken[i] != game.player_bets[i] for i in learners])
+            sampler.update(round_number, missed)
+        game.player_scores += game.score_round()
+        bank.add(round_number + 1, game.player_scores)
+        game.cleanup_round()
+        for i in learners:
+            game.players[i].optimize()
+
+    return counts
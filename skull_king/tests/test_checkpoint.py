@@ -0,0 +1,44 @@
+import random
+
+import numpy as np
+import pytest
+
+from skull_king.checkpoint import CheckpointManager, restore_training_state, training_state
+from skull_king.env import SkullKingGame
+
+
+def play_rounds(game, n_rounds):
+    for i in range(1, n_rounds + 1):
+        game.round = i
+        game.play_round()
+        game.player_scores += game.score_round()
+        game.cleanup_round()
+
+
+def test_checkpoint_resume_restores_full_state(tmp_path):
+    game = SkullKingGame(n_manual=0, n_random=2, n_rl=2)
+    play_rounds(game, 4)
+    game.players[2].games_played = 123
+
+    manager = CheckpointManager(str(tmp_path), keep_last=2)
+    for step in range(1, 4):
+        assert manager.save_async(training_state(game, {"episode": step}), step)
+        manager.wait()
+    assert [p[-8:] for p in manager.checkpoints()] == ["00002.pt", "00003.pt"]
+    expected_draws = (random.random(), np.random.random())
+
+    resumed = SkullKingGame(n_manual=0, n_random=2, n_rl=2)
+    progress = restore_training_state(resumed, manager.load_latest())
+    assert progress == {"episode": 3}
+    assert resumed.players[2].games_played == 123
+    assert len(resumed.players[2].memory) == len(game.players[2].memory) > 0
+    assert resumed.players[2].memory is resumed.players[3].memory
+    assert (random.random(), np.random.random()) == expected_draws
+    for key, value in game.players[3].play_network.state_dict().items():
+        assert (resumed.players[3].play_network.state_dict()[key] == value).all()
+
+
+@pytest.mark.parametrize("keep_last", [0, -1])
+def test_checkpoint_manager_keeps_at_least_one(tmp_path, keep_last):
+    with pytest.raises(ValueError):
+        CheckpointManager(str(tmp_path), keep_last=keep_last)
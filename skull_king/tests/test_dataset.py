@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from skull_king.agents import RLAgent
+from skull_king.dataset import DatasetStream, generate_dataset, load_manifest, pretrain
+from skull_king.obs import MAX_SEATS, obs_size
+
+
+def test_generate_dataset_writes_consistent_shards(tmp_path):
+    manifest = generate_dataset(str(tmp_path), ["random"] * 4, n_games=3, n_workers=2, shard_size=60)
+    assert load_manifest(str(tmp_path)) == manifest
+    assert manifest["n_play"] == 3 * 4 * 55
+    assert manifest["n_bid"] == 3 * 4 * 10
+    assert {s["file"][:9] for s in manifest["shards"]} == {"shard_000", "shard_001"}
+
+    for shard in manifest["shards"]:
+        assert shard["n_play"] <= 60
+        data = np.load(tmp_path / shard["file"])
+        assert data["legal"][np.arange(shard["n_play"]), data["action"]].all()
+        # Every player-round ends with exactly one done transition, in the same shard
+        assert data["done"][-1] and data["done"].sum() == shard["n_bid"]
+        assert (data["bid_label"] <= data["bid_round"]).all()
+
+
+def test_stream_covers_dataset_and_trains_rl_agent(tmp_path):
+    generate_dataset(str(tmp_path), ["random"] * 4, n_games=2, n_workers=1, shard_size=100)
+
+    stream = DatasetStream(str(tmp_path), "play", shuffle_shards=2, seed=0)
+    batch = stream.sample_arrays(len(stream))
+    assert stream.epoch == 1
+    assert len(np.unique(np.concatenate([batch["obs"], batch["action"][:, None]], axis=1), axis=0)) == len(stream)
+
+    transitions = stream.sample(8)
+    assert all(next_state is None or next_state.shape == state.shape for state, _, next_state, _ in transitions)
+
+    agent = RLAgent(0, batch_size=16)
+    memory = agent.memory
+    pretrain(agent, str(tmp_path), n_updates=3, seed=0)
+    assert agent.games_played == 3
+    assert agent.memory is memory
+
+
+def test_observations_match_the_table_size(tmp_path):
+    for n_players in (3, 5):
+        directory = str(tmp_path / str(n_players))
+        manifest = generate_dataset(directory, ["random"] * n_players, n_games=1, n_workers=1)
+        # Other table sizes are recorded in the seat-relative layout RLAgents train with
+        assert manifest["max_seats"] == MAX_SEATS
+        assert manifest["obs_size"] == obs_size(n_players, MAX_SEATS)
+        data = np.load(tmp_path / str(n_players) / manifest["shards"][0]["file"])
+        assert data["obs"].shape[1] == data["bid_obs"].shape[1] == manifest["obs_size"]
+
+        agent = RLAgent(0, batch_size=8, max_seats=manifest["max_seats"])
+        pretrain(agent, directory, n_updates=2, seed=0)
+        assert agent.games_played == 2
+        with pytest.raises(ValueError):
+            pretrain(RLAgent(0), directory, n_updates=1)
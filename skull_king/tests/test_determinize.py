@@ -0,0 +1,80 @@
+import math
+import random
+from collections import Counter
+from itertools import permutations
+
+import numpy as np
+import pytest
+
+from skull_king import game
+from skull_king.determinize import DealSampler, _PositionRecorder
+from skull_king.env import SkullKingGame
+from skull_king.tracker import N_CARDS
+
+GREEN = game.CARD_COLOR_GREEN
+
+
+def small_sampler() -> DealSampler:
+    # Seat 0 sees 5 unseen cards, 2 of them green numbers; seat 1 (void in green) and seat 2 hold 2 each
+    unseen = [game.get_card(name).id for name in ("Green 1", "Green 2", "Pink 3")] + [9, 6]  # an Escape, a Mermaid
+    played = [c for c in range(N_CARDS) if c not in unseen and c != game.get_card("Black 7").id]
+    voids = np.zeros((3, 4), dtype=bool)
+    voids[1, GREEN] = True
+    return DealSampler(0, [game.get_card("Black 7").id], played, [1, 2, 2], voids)
+
+
+def test_small_deals_are_counted_exactly_and_sampled_uniformly():
+    sampler = small_sampler()
+    # Brute force: seat 1 takes 2 of the 3 non-green cards, seat 2 two of the remaining 3, one card left over
+    consistent = {(tuple(sorted(p[:2])), tuple(sorted(p[2:4]))) for p in permutations(sampler.unseen.tolist())
+                  if not {game.get_card("Green 1").id, game.get_card("Green 2").id} & set(p[:2])}
+    assert sampler.n_deals == len(consistent) == 9
+
+    deals = sampler.sample(18000, np.random.default_rng(0))
+    assert sampler.is_consistent(deals).all()
+    assert (deals[:, 0, 0] == game.get_card("Black 7").id).all() and (deals[:, 0, 1] == -1).all()
+    counts = Counter((tuple(d[1]), tuple(d[2])) for d in deals.tolist())
+    assert set(counts) == consistent
+    assert all(abs(n - 2000) < 200 for n in counts.values())
+
+    accepted, acceptance = sampler.rejection_sample(18000, np.random.default_rng(0))
+    assert sampler.is_consistent(accepted).all() and abs(acceptance - 0.3) < 0.02
+
+
+def test_deals_from_games_respect_every_constraint():
+    random.seed(0)
+    np.random.seed(0)
+    env = SkullKingGame(n_manual=0, n_random=4)
+    recorder = _PositionRecorder(env)
+    env.recorder = recorder
+    env.play_game()
+    assert any(len(sampler.counts) > 1 for _, sampler, _ in recorder.samplers)
+
+    rng = np.random.default_rng(0)
+    for _, sampler, _ in recorder.samplers:
+        deals = sampler.sample(200, rng)
+        assert sampler.is_consistent(deals).all()
+        assert (deals[:, 0, :len(sampler.hand)] == sampler.hand).all()
+
+
+def test_inconsistent_constraints_are_rejected():
+    voids = np.ones((2, 4), dtype=bool)
+    numbers = [card.id for card in game.ALL_CARDS if isinstance(card, game.Number)]
+    others = [card.id for card in game.ALL_CARDS if not isinstance(card, game.Number)]
+    # Seat 1 must hold 2 of the unseen cards, but every unseen card is a number it is void in
+    with pytest.raises(ValueError):
+        DealSampler(0, [numbers[0]], others + numbers[3:], [1, 2], voids)
+
+
+def test_voids_in_colors_with_no_unseen_cards_left():
+    greens = [card.id for card in game.ALL_CARDS if isinstance(card, game.Number) and card.color == GREEN]
+    others = [card.id for card in game.ALL_CARDS if card.id not in greens]
+    voids = np.zeros((3, 4), dtype=bool)
+    voids[1, GREEN] = True
+    # Every green is in our hand or already played, so seat 1's void rules nothing out
+    sampler = DealSampler(0, greens[:2], greens[2:] + others[:-5], [2, 2, 2], voids)
+    assert sampler.counts[0] == 0 and sampler.n_deals == math.comb(5, 2) * math.comb(3, 2)
+
+    assert sampler.is_consistent(sampler.sample(100, np.random.default_rng(0))).all()
+    accepted, acceptance = sampler.rejection_sample(100, np.random.default_rng(0))
+    assert len(accepted) == 100 and acceptance == 1.0
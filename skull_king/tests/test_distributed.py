@@ -0,0 +1,26 @@
+import pytest
+
+from skull_king.agents import RLAgent
+from skull_king.agents.set_networks import build_networks
+from skull_king.distributed import train_actor_learner
+from skull_king.obs import obs_size
+
+
+def test_actor_learner_smoke():
+    learner = RLAgent(0, batch_size=8)
+    stats = train_actor_learner(learner, n_actors=1, n_rl=2, max_updates=4, publish_interval=2)
+    assert stats["updates"] == 4
+    assert stats["policy_version"] == 3  # initial publish + one every 2 updates
+    assert learner.games_played == 4
+
+
+def test_actors_play_the_learners_table_size():
+    learner = RLAgent(0, batch_size=8, max_seats=8)
+    stats = train_actor_learner(learner, n_actors=1, n_rl=2, n_players=6, max_updates=2, publish_interval=1)
+    assert stats["updates"] == 2
+
+
+def test_set_networks_are_rejected():
+    learner = RLAgent(0, **build_networks("set", obs_size()))
+    with pytest.raises(ValueError):
+        train_actor_learner(learner, n_actors=1, max_updates=1)
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from skull_king.agents import AGENT_REGISTRY, RandomAgent, build_agents
+from skull_king.env import SkullKingGame
+from skull_king.evaluation import (confidence_radius, evaluate_duplicate, evaluate_sequential, format_sequential,
+                                   make_deal, play_deal, summarize)
+
+
+class OverbidAgent(RandomAgent):
+    """Bids every trick of the round, which almost always loses points."""
+    def bid(self, game_state) -> int:
+        return len(self.hand.cards)
+
+
+def test_deals_are_replayed_exactly():
+    env = SkullKingGame(n_manual=0, n_random=4)
+    deal = make_deal(seed=3, deal_index=7, n_players=4)
+    hands = []
+
+    class Spy:
+        def on_bid(self, player_id, player, state, bid):
+            hands.append(sorted(card.id for card in player.hand.cards))
+
+        def __getattr__(self, name):
+            return lambda *args: None
+
+    env.recorder = Spy()
+    play_deal(env, deal)
+    first = hands[:]
+    hands.clear()
+    np.random.seed(123)
+    play_deal(env, make_deal(seed=3, deal_index=7, n_players=4))
+    assert hands == first and len(first) == 40
+
+
+def test_duplicate_rotates_agents_through_every_seat():
+    result = evaluate_duplicate(["random", "rl", "random", "rl"], n_deals=2, n_workers=2, seed=1)
+    assert result["scores"].shape == (2, 2, 4)  # A, B, A, B has two distinct seatings
+
+    summary = summarize(result)
+    assert summary["n_games"] == 4 and summary["compared"] == ("random", "rl")
+    assert summary["ci95"] >= 0 and summary["variance_reduction"] > 0
+
+    # The same seed replays the same games
+    again = evaluate_duplicate(["random", "rl", "random", "rl"], n_deals=2, n_workers=1, seed=1)
+    assert (again["scores"] == result["scores"]).all()
+
+
+def test_build_agents_greedy_rl_agent():
+    agent = build_agents(["rl"], greedy=True)[0]
+    assert agent.greedy and agent.get_epsilon() == 0.0
+
+
+@pytest.mark.parametrize("kwargs", [{"max_seats": 6}, {"network": "set"}])
+def test_build_agents_loads_checkpoints_of_any_layout(tmp_path, kwargs):
+    path = str(tmp_path / "agent.torch")
+    trained = SkullKingGame(n_manual=0, n_random=0, n_rl=1, **kwargs).players[0]
+    trained.save(path)
+
+    agent = build_agents([f"rl:{path}"])[0]
+    assert (agent.max_seats, agent.network_kind) == (trained.max_seats, trained.network_kind)
+    with pytest.raises(ValueError):
+        build_agents(["rl"])[0].load(path)
+
+
+def test_confidence_radius_shrinks_and_widens_with_confidence():
+    assert confidence_radius(1000, 1.0, 0.05) < confidence_radius(100, 1.0, 0.05) < confidence_radius(10, 1.0, 0.05)
+    assert confidence_radius(100, 1.0, 0.01) > confidence_radius(100, 1.0, 0.05)
+
+
+def test_sequential_stops_early_when_one_agent_is_clearly_stronger(monkeypatch):
+    monkeypatch.setitem(AGENT_REGISTRY, "overbid", "skull_king.tests.test_evaluation:OverbidAgent")
+    result = evaluate_sequential(["random", "overbid"] * 2, max_deals=200, min_deals=5, n_workers=1, seed=2)
+    assert result["decision"] == "random"
+    assert len(result["deal_indices"]) < 200 and result["scores"].shape[0] == len(result["deal_indices"])
+    assert "random is stronger" in format_sequential(result)
+
+
+def test_sequential_respects_the_deal_cap_with_workers():
+    result = evaluate_sequential(["random", "rl"] * 2, max_deals=4, min_deals=10, n_workers=2, seed=1)
+    assert result["decision"] is None
+    assert sorted(result["deal_indices"]) == [0, 1, 2, 3]
+    assert "undecided" in format_sequential(result)
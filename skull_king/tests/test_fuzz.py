@@ -0,0 +1,42 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from skull_king import fast_engine
+from skull_king.fuzz import BACKENDS, backend_output, check, fuzz, get_backend, shrink
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "engine_cases.json")
+
+with open(FIXTURES) as f:
+    ENGINE_CASES = json.load(f)
+
+
+@pytest.mark.parametrize("backend_name", list(BACKENDS))
+@pytest.mark.parametrize("fixture", ENGINE_CASES, ids=lambda fixture: fixture["kind"])
+def test_backends_match_regression_fixtures(backend_name, fixture):
+    case = {k: v for k, v in fixture.items() if k != "expected"}
+    assert backend_output(case, get_backend(backend_name)) == fixture["expected"]
+
+
+def test_fuzz_finds_no_mismatches_across_workers():
+    report = fuzz(n_cases=2000, n_workers=2, seed=5, chunk_size=500)
+    assert report["mismatches"] == []
+    assert sum(report["counts"].values()) == 2000 and report["counts"]["game"] > 0
+    assert report["cases_per_second"] > 0
+
+
+def test_mismatches_are_shrunk_to_a_minimal_case():
+    # The first card always wins, which is only wrong once something beats it
+    broken = SimpleNamespace(**{name: getattr(fast_engine, name) for name in
+                                ("legal_bits", "compute_score", "score_loot")})
+    broken.trick_winner = lambda cards: (0, fast_engine.trick_winner(cards)[1])
+
+    mismatch = check({"kind": "trick", "cards": [9, 44, 30, 57, 2]}, broken)
+    assert mismatch is not None
+    assert len(shrink(mismatch, broken)["case"]["cards"]) == 2
+
+    # A failing game reports the trick that went wrong
+    mismatch = check({"kind": "game", "seed": 0, "n_players": 4}, broken)
+    assert mismatch["case"]["kind"] == "trick"
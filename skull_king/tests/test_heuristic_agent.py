@@ -0,0 +1,78 @@
+import random
+
+import numpy as np
+
+from skull_king.agents import RandomAgent, make_agent
+from skull_king.agents.heuristic_agent import HeuristicAgent, build_tables, load_tables
+from skull_king.env import SkullKingGame
+
+
+class CheckedHeuristicAgent(HeuristicAgent):
+    """Asserts every card played is one BaseAgent considers legal."""
+    def play(self, game_state):
+        legal = self._get_legal_actions(game_state)
+        card = super().play(game_state)
+        assert legal[card.id] == 1
+        return card
+
+
+def play_games(players, n_games, seed=0):
+    random.seed(seed)
+    np.random.seed(seed)
+    env = SkullKingGame(n_manual=0, n_random=len(players))
+    env.players = players
+    scores = np.zeros(len(players))
+    for _ in range(n_games):
+        env.play_game()
+        scores += env.player_scores
+        env.reset_game()
+    return scores / n_games
+
+
+def test_tables_shape_and_bids_are_in_range():
+    tables = load_tables()
+    assert tables.shape == (10, 4, 73)
+    assert ((tables >= 0) & (tables <= 1)).all()
+    # The Skull King wins more often than an escape
+    assert tables[:, :, 0].mean() > tables[:, :, 9].mean()
+
+    agent = make_agent("heuristic", 0)
+    agent.hand.add_cards([card for card in SkullKingGame(n_manual=0).deck.cards[:5]])
+    assert 0 <= agent.bid({"starting_player": 2, "current_round": 5, "player_bets": np.zeros(4)}) <= 5
+
+
+def test_bid_position_follows_the_table_size():
+    # Only the last position's table expects any tricks
+    tables = np.zeros((10, 4, 73))
+    tables[:, 3] = 1
+    agent = HeuristicAgent(5, tables=tables)
+    agent.hand.add_cards(SkullKingGame(n_manual=0).deck.cards[:3])
+    # Seat 5 is the 6th to play after seat 0 at a 6 player table, and is looked up as the last position
+    assert agent.bid({"starting_player": 0, "current_round": 3, "player_bets": np.zeros(6)}) == 3
+
+
+def test_winning_bits_when_a_mermaid_class_is_winning():
+    from skull_king import game
+
+    trick = game.Trick()
+    for player_id, name in enumerate(["Skull King", "Harry the Giant", "Sirena"]):
+        trick.add_card(player_id, game.get_card(name))
+    _, winning_card = trick.compute_winner()
+    assert winning_card is game.Mermaid
+
+    agent = HeuristicAgent(3)
+    pirate, number = game.get_card("Juanita Jade").id, game.get_card("Green 5").id
+    assert agent._winning_bits([pirate, number], trick, winning_card) == 1 << pirate
+
+
+def test_heuristic_agent_plays_legally_and_beats_random():
+    players = [CheckedHeuristicAgent(0), RandomAgent(1), CheckedHeuristicAgent(2), RandomAgent(3)]
+    scores = play_games(players, 20)
+    assert scores[[0, 2]].mean() > scores[[1, 3]].mean() + 100
+
+
+def test_build_tables_from_a_few_games():
+    tables = build_tables(3)
+    assert tables.shape == (10, 4, 73)
+    # Cells never observed stay at the prior
+    assert np.isclose(tables, 0.25).any()
@@ -0,0 +1,37 @@
+import pytest
+import torch
+
+from skull_king.agents import RLAgent
+from skull_king.agents.inference import benchmark_latency, check_agreement, collect_states, export_checkpoint
+
+
+@pytest.fixture(scope="module")
+def checkpoint(tmp_path_factory):
+    torch.manual_seed(0)
+    path = tmp_path_factory.mktemp("inference") / "agent.torch"
+    RLAgent(0).save(str(path))
+    return path
+
+
+@pytest.mark.parametrize("quantize,min_agreement", [(False, 1.0), (True, 0.8)])
+def test_exported_policy_agrees_with_float(checkpoint, quantize, min_agreement):
+    output = checkpoint.parent / f"policy_{quantize}.pt"
+    export_checkpoint(str(checkpoint), str(output), quantize=quantize)
+
+    reference = RLAgent(0)
+    reference.load(str(checkpoint))
+    exported = RLAgent(0)
+    exported.load_inference(str(output))
+
+    bid_agreement, play_agreement = check_agreement(reference, exported, collect_states(2))
+    assert bid_agreement >= min_agreement
+    assert play_agreement >= min_agreement
+
+    with pytest.raises(RuntimeError):
+        exported.optimize()
+
+
+def test_benchmark_latency_batch_sizes():
+    agent = RLAgent(0)
+    latency = benchmark_latency(agent.bid_network, agent._get_obs_size(), iters=2)
+    assert set(latency) == {1, 256}
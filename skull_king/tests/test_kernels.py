@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from skull_king import fast_engine, kernels
+
+
+@pytest.fixture(scope="module")
+def batch():
+    return kernels.random_batch(3000, seed=1)
+
+
+def test_trick_winners_match_fast_engine(batch):
+    for tricks in (batch["tricks"], batch["in_progress"]):
+        expected = [fast_engine.trick_winner([c for c in row if c >= 0]) if row[0] >= 0 else (0, 0)
+                    for row in tricks.tolist()]
+        for backend in kernels.available_backends():
+            positions, bonuses = kernels.trick_winners(tricks, backend)
+            assert list(zip(positions.tolist(), bonuses.tolist())) == expected, backend
+
+
+def test_legal_masks_match_fast_engine(batch):
+    expected = [fast_engine.legal_bits(fast_engine.hand_bits(np.flatnonzero(hand).tolist()), [c for c in row if c >= 0])
+                for hand, row in zip(batch["hands"], batch["in_progress"].tolist())]
+    for backend in kernels.available_backends():
+        masks = kernels.legal_masks(batch["hands"], batch["in_progress"], backend)
+        assert [fast_engine.hand_bits(np.flatnonzero(mask).tolist()) for mask in masks] == expected, backend
+
+
+def test_scores_are_identical_across_backends(batch):
+    results = [(kernels.round_scores(batch["rounds"][:, None], batch["bets"], batch["n_tricks"], batch["bonuses"], b),
+                kernels.loot_bonuses(batch["loot"], batch["n_tricks"], batch["bets"], b))
+               for b in kernels.available_backends()]
+    for scores, loot in results[1:]:
+        assert (scores == results[0][0]).all() and (loot == results[0][1]).all()
+    assert kernels.compute_score(5, 2, [0, 30]) == fast_engine.compute_score(5, 2, [0, 30]) == 70
+    assert kernels.score_loot([0, 2], [1, 0, 2], [1, 3, 2]) == fast_engine.score_loot([0, 2], [1, 0, 2], [1, 3, 2])
+
+
+def test_numba_kernels_are_cached_and_match_numpy(batch, tmp_path):
+    pytest.importorskip("numba")
+    # Compile in a fresh process so the kernels can't come from an already populated cache
+    code = ("from skull_king import kernels\n"
+            "b = kernels.random_batch(100, seed=2)\n"
+            "kernels.trick_winners(b['tricks'], 'numba')\n"
+            "kernels.legal_masks(b['hands'], b['in_progress'], 'numba')\n"
+            "kernels.round_scores(b['rounds'][:, None], b['bets'], b['n_tricks'], b['bonuses'], 'numba')\n"
+            "kernels.loot_bonuses(b['loot'], b['n_tricks'], b['bets'], 'numba')\n")
+    env = dict(os.environ, NUMBA_CACHE_DIR=str(tmp_path), SKULL_KING_KERNELS="numba")
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+    assert len(list(tmp_path.rglob("*.nbi"))) == len(kernels.IMPLEMENTATIONS["numba"])
+    assert list(tmp_path.rglob("*.nbc"))
+
+    for tricks in (batch["tricks"], batch["in_progress"]):
+        for numba_out, numpy_out in zip(kernels.trick_winners(tricks, "numba"), kernels.trick_winners(tricks, "numpy")):
+            assert numba_out.dtype == numpy_out.dtype and np.array_equal(numba_out, numpy_out)
+    assert np.array_equal(kernels.legal_masks(batch["hands"], batch["in_progress"], "numba"),
+                          kernels.legal_masks(batch["hands"], batch["in_progress"], "numpy"))
+    score_args = (batch["rounds"][:, None], batch["bets"], batch["n_tricks"], batch["bonuses"])
+    assert np.array_equal(kernels.round_scores(*score_args, "numba"), kernels.round_scores(*score_args, "numpy"))
+    loot_args = (batch["loot"], batch["n_tricks"], batch["bets"])
+    assert np.array_equal(kernels.loot_bonuses(*loot_args, "numba"), kernels.loot_bonuses(*loot_args, "numpy"))
+
+
+def test_backend_selection():
+    assert kernels.BACKEND in kernels.available_backends()
+    assert "numpy" in kernels.available_backends()
+    with pytest.raises(ValueError):
+        kernels.set_backend("fortran")
@@ -0,0 +1,86 @@
+import random
+import threading
+
+import pytest
+import torch
+
+from skull_king.agents import RLAgent
+from skull_king.agents.set_networks import build_networks
+from skull_king.league import FrozenPolicyServer, SnapshotPool, train_league
+from skull_king.obs import obs_size
+
+
+def test_pool_is_a_ring_and_samples_by_win_rate():
+    pool = SnapshotPool(2, RLAgent(0)._get_obs_size())
+    agents = [RLAgent(0) for _ in range(3)]
+    assert [pool.freeze(agent) for agent in agents] == [0, 1, 0]
+    assert len(pool) == 2 and pool.generation.tolist() == [2, 1]
+
+    # Results against an overwritten snapshot are dropped
+    pool.record(0, 1, 1.0)
+    assert pool.games[0] == 0
+
+    for _ in range(20):
+        pool.record(0, 2, 1.0)
+    slots = [pool.sample(rng=random.Random(i))[0] for i in range(200)]
+    assert slots.count(1) > 150  # the learner always beats snapshot 0
+
+
+def test_server_batches_threads_and_matches_the_frozen_network():
+    agent = RLAgent(0)
+    pool = SnapshotPool(4, agent._get_obs_size(), dtype=torch.float32)
+    slot = pool.freeze(agent)
+    n_threads = 4
+    server = FrozenPolicyServer(pool, n_threads, max_wait=1.0)
+    observations = torch.rand(n_threads, agent._get_obs_size())
+    outputs = [None] * n_threads
+
+    def client(i):
+        outputs[i] = server.request(slot, 1, "play", observations[i])
+        server.leave()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert server.stats()["frozen_batches"] == 1 and server.stats()["mean_batch_size"] == n_threads
+    with torch.no_grad():
+        assert torch.allclose(torch.stack(outputs), agent.play_network(observations), atol=1e-5)
+
+
+def test_overwritten_snapshots_are_not_served():
+    agents = [RLAgent(0) for _ in range(3)]
+    pool = SnapshotPool(2, agents[0]._get_obs_size(), dtype=torch.float32)
+    for agent in agents[:2]:
+        pool.freeze(agent)
+    server = FrozenPolicyServer(pool, 1, max_wait=0.01)
+    obs = torch.rand(agents[0]._get_obs_size())
+    assert server.request(0, 1, "play", obs) is not None
+
+    # Slot 0 now holds the third agent: generation 1 is gone, even from the server's cache
+    pool.freeze(agents[2])
+    assert pool.networks(0, 1) is None
+    assert server.request(0, 1, "play", obs) is None
+    with torch.no_grad():
+        assert torch.allclose(server.request(0, 2, "play", obs), agents[2].play_network(obs.unsqueeze(0))[0],
+                              atol=1e-5)
+
+
+def test_league_smoke():
+    learner = RLAgent(0, batch_size=8)
+    stats = train_league(learner, n_actors=1, games_per_actor=2, pool_size=3, freeze_interval=2, max_updates=6)
+    assert stats["updates"] == 6
+    assert stats["snapshots"] == 3
+    assert stats["frozen_decisions"] > 0 and stats["mean_batch_size"] >= 1
+
+
+def test_league_plays_the_learners_table_size_and_rejects_set_networks():
+    learner = RLAgent(0, batch_size=8, max_seats=8)
+    stats = train_league(learner, n_actors=1, n_players=5, games_per_actor=2, pool_size=3, freeze_interval=2,
+                         max_updates=2)
+    assert stats["updates"] == 2
+
+    with pytest.raises(ValueError):
+        train_league(RLAgent(0, **build_networks("set", obs_size())), n_actors=1, max_updates=1)
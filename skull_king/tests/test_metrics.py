@@ -0,0 +1,33 @@
+import pytest
+
+from skull_king.env import SkullKingGame
+from skull_king.metrics import METRICS, Histogram, load_run, summarize
+
+
+def test_histogram_quantiles():
+    histogram = Histogram()
+    for i in range(1, 1001):
+        histogram.observe(i * 1e-6)
+    assert histogram.count == 1000
+    assert histogram.quantile(0.5) == pytest.approx(500e-6, rel=0.07)
+    assert histogram.quantile(0.99) == pytest.approx(990e-6, rel=0.07)
+
+
+@pytest.mark.parametrize("suffix", ["jsonl", "csv"])
+def test_game_metrics_flush_and_summarize(tmp_path, suffix):
+    path = str(tmp_path / f"run.{suffix}")
+    METRICS.enable(path, interval=0)
+    try:
+        for _ in range(2):
+            SkullKingGame(0, 4).play_game()
+            METRICS.maybe_flush()
+    finally:
+        METRICS.disable()
+
+    rows = load_run(path)
+    assert len(rows) == 2
+    assert rows[-1]["counter/games"] == 2
+    # 4 players, 55 cards each plus 10 bids each
+    assert rows[-1]["counter/decisions"] == 2 * 4 * 65
+    assert rows[-1]["histogram/play/RandomAgent/count"] == 2 * 4 * 55
+    assert "bid/RandomAgent" in summarize(path)
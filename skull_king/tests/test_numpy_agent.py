@@ -0,0 +1,47 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+import torch
+
+from skull_king.agents import NumpyRLAgent, RLAgent, build_agents
+from skull_king.env import SkullKingGame
+
+
+def test_env_import_does_not_load_torch():
+    code = "import sys, skull_king.env; SkullKingGame = skull_king.env.SkullKingGame; " \
+           "SkullKingGame(0, 4).play_game(); sys.exit('torch' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
+
+
+def test_numpy_runtime_matches_torch(tmp_path):
+    agent = RLAgent(0)
+    agent.save_numpy(str(tmp_path / "weights.npz"))
+    runtime = NumpyRLAgent(0, str(tmp_path / "weights.npz"))
+
+    obs = np.random.random_sample((16, agent._get_obs_size())).astype(np.float32)
+    with torch.no_grad():
+        expected_play = agent.play_network(torch.from_numpy(obs)).numpy()
+        expected_bid = agent.bid_network(torch.from_numpy(obs)).argmax(1).numpy()
+    assert np.allclose(runtime.forward(runtime.play_layers, obs), expected_play, atol=1e-5)
+    assert (runtime.forward(runtime.bid_layers, obs).argmax(1) == expected_bid).all()
+
+
+def test_game_with_numpy_agents(tmp_path):
+    RLAgent(0).save_numpy(str(tmp_path / "weights.npz"))
+    skg = SkullKingGame(n_manual=0, n_random=2, n_rl=2, checkpoint_filepath=str(tmp_path / "weights.npz"))
+    assert all(isinstance(p, NumpyRLAgent) for p in skg.players[2:])
+    skg.play_game()
+
+
+def test_numpy_agents_use_the_exported_observation_layout(tmp_path):
+    path = str(tmp_path / "weights.npz")
+    RLAgent(0, max_seats=8).save_numpy(path)
+    skg = SkullKingGame(n_manual=0, n_random=3, n_rl=3, checkpoint_filepath=path, max_seats=8)
+    assert all(p.max_seats == 8 for p in skg.players[3:])
+    skg.play_game()
+
+    assert build_agents([f"numpy_rl:{path}"])[0].max_seats == 8
+    with pytest.raises(ValueError):
+        NumpyRLAgent(0, path)
@@ -0,0 +1,52 @@
+import numpy as np
+import torch
+
+from skull_king import game
+from skull_king.agents import RLAgent
+from skull_king.env import SkullKingGame
+from skull_king.obs import MAX_SEATS, N_BIDS, N_CARDS, ObsCodec, encode_obs, obs_size, score_indices
+
+
+def table_state(n_players):
+    return {
+        "current_round": 3,
+        "player_bets": np.arange(n_players) % 4,
+        "current_trick": game.Trick(),
+        "player_scores": np.arange(n_players) * 10.0,
+        "tricks_taken": np.zeros(n_players),
+        "cards_played": np.zeros(N_CARDS),
+        "starting_player": 1,
+    }
+
+
+def test_seat_relative_layout_is_padded_and_masked():
+    assert obs_size(4) == 312
+    size = obs_size(max_seats=MAX_SEATS)
+    first_seat = 3 * N_CARDS + 1
+    block = N_BIDS + 1 + 10
+
+    for n_players in (2, 3, 6, 8):
+        obs = encode_obs(game.Hand(), table_state(n_players), player_id=1, max_seats=MAX_SEATS)
+        assert obs.shape == (size,)
+        # Our own state comes first, then the next player's
+        assert obs[first_seat + 1] == 1  # player 1 bid 1
+        assert obs[score_indices(MAX_SEATS)[:2]].tolist() == [10.0, 20.0 if n_players > 2 else 0.0]
+        assert obs[-MAX_SEATS:].tolist() == [1] * n_players + [0] * (MAX_SEATS - n_players)
+        # Empty seats are all zeros
+        assert not obs[first_seat + n_players * block:first_seat + MAX_SEATS * block].any()
+
+    codec = ObsCodec(max_seats=MAX_SEATS)
+    assert (codec.unpack(*codec.pack(obs)) == obs).all()
+
+
+def test_rl_agents_play_any_table_size_and_share_a_batch():
+    agent_states = []
+    for n_players in (2, 5, 8):
+        env = SkullKingGame(n_manual=0, n_random=n_players - 1, n_rl=1, max_seats=MAX_SEATS)
+        env.play_game()
+        agent = env.players[-1]
+        agent_states.append(agent.get_obs(env.state))
+        assert env.n_rounds == (9 if n_players == 8 else 10)
+
+    batch = torch.stack(agent_states)
+    assert RLAgent(0, max_seats=MAX_SEATS).play_network(batch).shape == (3, N_CARDS)
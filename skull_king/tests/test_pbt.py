@@ -0,0 +1,31 @@
+import json
+import random
+
+from skull_king.agents import RLAgent, build_agents
+from skull_king.pbt import HYPERPARAMETERS, perturb, sample_hyperparameters, train_population
+
+
+def test_perturbed_hyperparameters_stay_in_range():
+    rng = random.Random(0)
+    hyperparameters = sample_hyperparameters(rng)
+    for _ in range(200):
+        hyperparameters = perturb(hyperparameters, rng)
+        for name, (low, high, _, integer) in HYPERPARAMETERS.items():
+            assert low <= hyperparameters[name] <= high
+            assert isinstance(hyperparameters[name], int) == integer
+
+    agent = RLAgent(0, lr=1e-4, bid_lr=1e-2)
+    agent.set_learning_rates(3e-4, 3e-3)
+    assert agent.play_optimizer.param_groups[0]["lr"] == 3e-4
+    assert agent.bid_optimizer.param_groups[0]["lr"] == 3e-3
+
+
+def test_population_exploits_and_logs_lineage(tmp_path):
+    best = train_population(str(tmp_path), population=2, generations=2, games_per_generation=1, n_deals=2)
+    with open(tmp_path / "lineage.jsonl") as f:
+        lineage = [json.loads(line) for line in f]
+    assert len(lineage) == 4
+    # After the first generation the worse member copies the better one
+    assert [entry["parent"] for entry in lineage[2:]].count(None) == 1
+    assert best["hyperparameters"] in [entry["hyperparameters"] for entry in lineage]
+    build_agents([f"rl:{tmp_path / 'best.torch'}"])
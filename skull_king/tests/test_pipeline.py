@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+from skull_king.env import SkullKingGame
+from skull_king.pipeline import PipelinedTrainer
+
+
+def small_batch_game(**kwargs):
+    game = SkullKingGame(n_manual=0, n_random=2, n_rl=2, **kwargs)
+    for seat in game.players[2:]:
+        seat.batch_size = 16
+    return game
+
+
+def test_pipelined_trainer_updates_and_refreshes_seats():
+    game = small_batch_game()
+    seat = game.players[2]
+    initial = {k: v.clone() for k, v in seat.play_network.state_dict().items()}
+
+    trainer = PipelinedTrainer(game, refresh_interval=1)
+    trainer.run(3)
+
+    assert trainer.updates > 0
+    assert trainer.transitions > 0
+    assert seat.games_played == trainer.learners[0].games_played > 0
+    assert any((seat.play_network.state_dict()[k] != v).any() for k, v in initial.items())
+    assert isinstance(seat.memory_lock, type(threading.Lock()))
+
+
+def test_pipelined_trainer_respects_update_to_data_cap():
+    game = small_batch_game()
+    trainer = PipelinedTrainer(game, updates_per_transition=0.01)
+    trainer.run(2)
+
+    # The cap is checked before each sweep over the learners, so it can overshoot by one sweep
+    assert trainer.updates <= 0.01 * trainer.transitions + len(trainer.learners)
+
+
+@pytest.mark.parametrize("kwargs", [{"max_seats": 6}, {"network": "set"}])
+def test_learner_twins_match_their_seats(kwargs):
+    game = small_batch_game(**kwargs)
+    game.players[2].set_learning_rates(0.003, 0.02)
+    trainer = PipelinedTrainer(game, refresh_interval=1)
+
+    learner = trainer.learners[0]
+    assert learner.max_seats == game.players[2].max_seats and learner.card_sets == game.players[2].card_sets
+    assert learner.play_network is not game.players[2].play_network
+    assert learner.play_optimizer.param_groups[0]["lr"] == 0.003
+    assert learner.bid_optimizer.param_groups[0]["lr"] == 0.02
+    trainer.run(2)
+    assert trainer.updates > 0
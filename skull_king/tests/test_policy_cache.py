@@ -0,0 +1,75 @@
+import random
+
+import numpy as np
+import torch
+
+from skull_king.agents import RLAgent
+from skull_king.agents.policy_cache import PolicyCache
+from skull_king.env import SkullKingGame
+from skull_king.obs import obs_size
+
+
+def play_games(players, n_games, seed=0):
+    random.seed(seed)
+    np.random.seed(seed)
+    env = SkullKingGame(n_manual=0, n_random=4)
+    env.players = players
+    scores = []
+    for _ in range(n_games):
+        env.play_game()
+        scores.append(env.player_scores.copy())
+        env.reset_game()
+    return np.array(scores)
+
+
+def test_cached_agents_play_the_same_games():
+    torch.manual_seed(0)
+    plain = [RLAgent(i, greedy=True) for i in range(4)]
+    cached = [RLAgent(i, greedy=True, cache_size=1000) for i in range(4)]
+    for a, b in zip(plain, cached):
+        b.bid_network.load_state_dict(a.bid_network.state_dict())
+        b.play_network.load_state_dict(a.play_network.state_dict())
+
+    assert (play_games(plain, 2) == play_games(cached, 2)).all()
+    misses = cached[0].play_cache.misses
+    assert misses > 0
+
+    # Replaying the same games with frozen weights never runs the networks
+    assert (play_games(plain, 2) == play_games(cached, 2)).all()
+    assert cached[0].play_cache.misses == misses and cached[0].play_cache.hits >= misses
+    assert cached[0].bid_cache.stats()["hit_rate"] >= 0.5
+
+
+def test_cache_is_invalidated_when_weights_change():
+    agent = RLAgent(0)
+    cache = PolicyCache(10)
+    obs = torch.zeros(obs_size(4))
+    mask = np.ones(73)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return agent.play_network(obs.unsqueeze(0))
+
+    cache.get(agent.play_network, obs, mask, compute)
+    cache.get(agent.play_network, obs, mask, compute)
+    assert len(calls) == 1
+
+    agent.play_network.load_state_dict(RLAgent(1).play_network.state_dict())
+    cache.get(agent.play_network, obs, mask, compute)
+    assert len(calls) == 2 and cache.stats()["invalidations"] == 1
+
+    # A different legal mask is a different entry
+    mask[0] = 0
+    cache.get(agent.play_network, obs, mask, compute)
+    assert len(calls) == 3
+
+
+def test_cache_evicts_least_recently_used():
+    network = torch.nn.Linear(obs_size(4), 2)
+    cache = PolicyCache(2)
+    observations = [torch.eye(obs_size(4))[i] for i in range(3)]
+    mask = np.ones(2)
+    for obs in observations + observations[2:]:
+        cache.get(network, obs, mask, lambda: network(obs))
+    assert cache.stats() == {"hits": 1, "misses": 3, "hit_rate": 0.25, "size": 2, "invalidations": 0}
@@ -0,0 +1,44 @@
+import numpy as np
+
+from skull_king.agents import build_agents
+from skull_king.agents.ppo_agent import N_BIDS
+from skull_king.env import SkullKingGame
+from skull_king.ppo import PPOTrainer, gae
+
+
+def test_gae_matches_the_recursive_definition():
+    rng = np.random.default_rng(0)
+    rewards, values = rng.random((4, 6)), rng.random((4, 6))
+    lengths = np.array([6, 1, 3, 4])
+    gamma, lam = 0.9, 0.8
+
+    advantages = gae(rewards, values, lengths, gamma, lam)
+    for e, length in enumerate(lengths):
+        advantage = 0.0
+        for t in reversed(range(length)):
+            next_value = values[e, t + 1] if t + 1 < length else 0.0
+            advantage = rewards[e, t] + gamma * next_value - values[e, t] + gamma * lam * advantage
+            assert np.isclose(advantages[e, t], advantage)
+        assert (advantages[e, length:] == 0).all()
+
+
+def test_rollouts_respect_masks_and_training_runs(tmp_path):
+    trainer = PPOTrainer(n_envs=4, n_steps=300, minibatch_size=64)
+    rollout = trainer.collect()
+    valid = np.arange(rollout["value"].shape[1]) < rollout["length"][:, None]
+    assert valid.sum() >= 300
+    # Every episode is a bid followed by that round's plays, each taken among its legal actions
+    assert (rollout["action"][:, 0] < N_BIDS).all()
+    taken = np.take_along_axis(rollout["mask"], rollout["action"][..., None], axis=-1)[..., 0]
+    assert taken[valid].all()
+
+    stats = trainer.update(rollout)
+    assert np.isfinite([stats["policy_loss"], stats["value_loss"], stats["entropy"]]).all()
+
+    # Checkpoints load into agents for play.py and the evaluation lineups
+    path = str(tmp_path / "policy.ppo")
+    trainer.save(path)
+    SkullKingGame(n_manual=0, n_random=2, n_rl=2, checkpoint_filepath=path).play_game()
+    env = SkullKingGame(n_manual=0, n_random=4)
+    env.players = build_agents([f"ppo:{path}", "random", "random", "random"], greedy=True)
+    env.play_game()
@@ -0,0 +1,147 @@
+import pickle
+
+import numpy as np
+
+from skull_king.env import SkullKingGame
+from skull_king.obs import ObsCodec
+from skull_king.replay import MemmapReplayMemory, PackedReplayMemory, PrioritizedReplayMemory, SumTree
+
+
+def test_sumtree_totals_and_find():
+    tree = SumTree(5)
+    tree.update([0, 1, 2, 3, 4], [1.0, 2.0, 3.0, 4.0, 0.0])
+    assert tree.total == 10.0
+    # Prefix intervals: [0,1) [1,3) [3,6) [6,10)
+    assert list(tree.find(np.array([0.0, 0.5, 1.0, 2.9, 3.0, 5.9, 6.0, 9.9]))) == [0, 0, 1, 1, 2, 2, 3, 3]
+
+
+def test_sumtree_duplicate_updates():
+    tree = SumTree(8)
+    tree.update(np.arange(8), np.ones(8))
+    tree.update([3, 3, 5], [4.0, 4.0, 0.0])
+    assert tree.total == 10.0
+    assert list(tree.get([3, 5])) == [4.0, 0.0]
+
+
+def test_prioritized_sampling_follows_priorities():
+    np.random.seed(0)
+    memory = PrioritizedReplayMemory(4, alpha=1.0, eps=0.0)
+    for i in range(4):
+        memory.push(i)
+    memory.update_priorities([0, 1, 2, 3], [0.0, 0.0, 1.0, 3.0])
+
+    counts = np.zeros(4)
+    for _ in range(200):
+        transitions, indices, weights = memory.sample_weighted(8)
+        np.add.at(counts, indices, 1)
+        assert transitions == list(indices)
+        assert weights.max() == 1.0
+
+    assert counts[0] == counts[1] == 0
+    assert 2.5 < counts[3] / counts[2] < 3.5
+
+
+def test_prioritized_beta_anneals():
+    memory = PrioritizedReplayMemory(16, beta_start=0.5, beta_steps=10)
+    for i in range(16):
+        memory.push(i)
+    for _ in range(20):
+        memory.sample_weighted(4)
+    assert memory.beta == 1.0
+
+
+def test_memmap_roundtrip_and_restart(tmp_path):
+    memory = MemmapReplayMemory(str(tmp_path), capacity=4)
+    memory.push((np.ones(3, dtype=np.float32), 2, None, 0.5))
+    memory.push((np.zeros(3, dtype=np.float32), 5, np.ones(3, dtype=np.float32), -1.0))
+    assert len(memory) == 2
+
+    # A fresh instance, as after a trainer restart, sees the same records
+    resumed = MemmapReplayMemory(str(tmp_path), capacity=4)
+    assert len(resumed) == 2
+    samples = {s[1]: s for s in resumed.sample(16)}
+    state, action, next_state, reward = samples[2]
+    assert list(state) == [1.0, 1.0, 1.0] and next_state is None and reward == 0.5
+    assert list(samples[5][2]) == [1.0, 1.0, 1.0]
+
+    # Writes wrap around the ring
+    for i in range(10):
+        resumed.push((np.zeros(3, dtype=np.float32), i, None, 0.0))
+    assert len(resumed) == 4
+    assert {s[1] for s in resumed.sample(64)} == {6, 7, 8, 9}
+
+
+def test_memmap_sharded_readers(tmp_path):
+    writers = [MemmapReplayMemory(str(tmp_path), capacity=8, shard=k, n_shards=2) for k in range(2)]
+    for k, writer in enumerate(writers):
+        for i in range(3):
+            writer.push((np.full(2, k, dtype=np.float32), k))
+
+    reader = pickle.loads(pickle.dumps(MemmapReplayMemory.open(str(tmp_path))))
+    assert len(reader) == 6
+    assert {s[1] for s in reader.sample(64)} == {0, 1}
+
+    writers[1].push((np.zeros(2, dtype=np.float32), 1))
+    assert len(reader) == 7
+
+
+def random_observations(n, n_players=4):
+    codec = ObsCodec(n_players)
+    obs = (np.random.random((n, codec.size)) < 0.1).astype(np.float32)
+    obs[:, codec.score_index] = np.random.randint(-300, 600, (n, n_players))
+    return obs
+
+
+def test_obs_codec_round_trip():
+    np.random.seed(0)
+    codec = ObsCodec()
+    obs = random_observations(32)
+    bits, scores = codec.pack(obs)
+    assert bits.shape == (32, codec.n_bytes) and scores.dtype == np.int16
+    assert (codec.unpack(bits, scores) == obs).all()
+
+
+def test_packed_memory_stores_next_states_by_reference():
+    np.random.seed(0)
+    memory = PackedReplayMemory(5)
+    obs = random_observations(8)
+
+    # A 3-step trajectory, then one pushed with a next state that never gets its own push
+    for i in range(3):
+        memory.push((obs[i], i, obs[i + 1] if i < 2 else None, float(i)))
+    memory.push((obs[3], 3, obs[4], 3.0))
+    memory.push((obs[5], 5, None, 5.0))
+    # Capacity 5: the orphaned next state took a slot and the oldest transition was overwritten
+    assert len(memory) == 5 and memory.position == 1
+
+    for _ in range(20):
+        batch = memory.sample_batch(4)
+        for state, action, next_state, non_terminal, reward in zip(
+                batch["state"], batch["action"], batch["next_state"], batch["non_terminal"], batch["reward"]):
+            assert (state == obs[action]).all() and reward == action
+            assert non_terminal == (action in (1, 3))
+            if non_terminal:
+                assert (next_state == obs[action + 1]).all()
+
+    unpacked_bytes = 2 * obs[0].nbytes
+    assert unpacked_bytes / (memory.nbytes / memory.capacity) > 10
+
+
+def test_packed_memory_trains_rl_agents():
+    game = SkullKingGame(n_manual=0, n_random=2, n_rl=2, packed_replay=True)
+    for i in range(1, 11):
+        game.round = i
+        game.play_round()
+        game.player_scores += game.score_round()
+        game.cleanup_round()
+
+    agent = game.players[2]
+    assert isinstance(agent.memory, PackedReplayMemory) and len(agent.memory) == 2 * 55
+    agent.batch_size = 16
+    agent.optimize()
+    assert agent.games_played == 1
+
+    restored = PackedReplayMemory(100)
+    restored.load_state_dict(agent.bid_memory.state_dict())
+    assert len(restored) == 20
+    assert restored.sample(1)[0][0].shape == (agent._get_obs_size(),)
@@ -0,0 +1,101 @@
+import json
+import random
+
+import numpy as np
+
+from skull_king.env import SkullKingGame
+from skull_king.rounds import RoundSampler, ScoreBank, train_round_slices
+
+
+def test_positions_round_trip_through_json_and_resume():
+    random.seed(3)
+    np.random.seed(3)
+    env = SkullKingGame(n_manual=0, n_random=4)
+    env.start_round(6, np.array([10.0, -20.0, 0.0, 40.0]))
+    env.deal()
+    env.collect_bids()
+    for _ in range(3):
+        env.play_trick()
+        env.finish_trick()
+    # Stop in the middle of the fourth trick
+    card = env.players[env.starting_player].play(env.state)
+    env.current_trick.add_card(env.starting_player, card)
+    env.public.on_card(env.starting_player, card, env.current_trick)
+
+    position = json.loads(json.dumps(env.get_position()))
+    restored = SkullKingGame(n_manual=0, n_random=4)
+    restored.set_position(position)
+    assert restored.get_position() == position
+    assert (restored.tricks_taken == env.tricks_taken).all()
+    assert (restored.cards_played == env.cards_played).all()
+    assert [len(p.tricks) for p in restored.players] == [len(p.tricks) for p in env.players]
+    assert [len(p.starting_hand) for p in restored.players] == [6] * 4
+
+    restored.resume_round()
+    assert len(restored.round_tricks) == 6
+    assert all(len(p.hand) == 0 for p in restored.players)
+    restored.score_round()
+
+
+def test_resumed_rounds_score_rl_seats_without_learning_their_bids():
+    random.seed(0)
+    np.random.seed(0)
+    env = SkullKingGame(n_manual=0, n_random=2, n_rl=2)
+    env.start_round(1)
+    env.deal()
+    env.collect_bids()
+    # Round 1 stopped after both RL seats have played their only card: they have no decisions left
+    while len(env.current_trick) < 4 and not all(len(player.hand) == 0 for player in env.players[2:]):
+        i = (env.starting_player + len(env.current_trick)) % 4
+        card = env.players[i].play(env.state)
+        env.current_trick.add_card(i, card)
+        env.public.on_card(i, card, env.current_trick)
+    position = env.get_position()
+
+    for resume_from in (position, None):
+        restored = SkullKingGame(n_manual=0, n_random=2, n_rl=2)
+        if resume_from is None:
+            # Round 3 from after its first trick: the RL seats still play, mid-round
+            restored.start_round(3)
+            restored.deal()
+            restored.collect_bids()
+            restored.play_trick()
+            restored.finish_trick()
+            resume_from = restored.get_position()
+            restored = SkullKingGame(n_manual=0, n_random=2, n_rl=2)
+        restored.set_position(resume_from)
+        assert all(player.resumed for player in restored.players[2:])
+        restored.resume_round()
+        restored.score_round()
+        rl_seats = restored.players[2:]
+        assert all(len(player.bid_memory) == 0 for player in rl_seats)
+        # Only the plays made after the position are stored
+        assert (len(rl_seats[0].memory) > 0) == (restored.round == 3)
+        restored.cleanup_round()
+        assert not any(player.resumed for player in rl_seats)
+
+
+def test_sampler_and_bank():
+    sampler = RoundSampler(weights=[0] * 7 + [1, 1, 1])
+    assert {sampler.sample(random.Random(i)) for i in range(50)} == {8, 9, 10}
+
+    adaptive = RoundSampler(adaptive=True, decay=0.0)
+    adaptive.update(10, 0.0)
+    adaptive.update(9, 1.0)
+    assert adaptive.weights()[8] > 10 * adaptive.weights()[9]
+
+    bank = ScoreBank()
+    assert (bank.sample(5, 4) == 0).all()
+    bank.add(5, np.array([1.0, 2.0, 3.0, 4.0]))
+    assert sorted(bank.sample(5, 4)) == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_round_slices_train_on_the_sampled_rounds():
+    game = SkullKingGame(n_manual=0, n_random=2, n_rl=2)
+    for player in game.players[2:]:
+        player.batch_size = 8
+    bank = ScoreBank()
+    counts = train_round_slices(game, 20, RoundSampler(weights=[1] * 5 + [0] * 5), bank, random.Random(0))
+    assert counts.sum() == 20 and counts[5:].sum() == 0
+    assert game.players[2].games_played > 0
+    assert sum(len(samples) for samples in bank.samples) == 20
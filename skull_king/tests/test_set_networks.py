@@ -0,0 +1,73 @@
+import numpy as np
+import torch
+
+from skull_king.agents.rl_agent import BidNetwork, PlayNetwork
+from skull_king.agents.set_networks import SetBidNetwork, SetPlayNetwork, card_sets_from_dense, collate
+from skull_king.env import SkullKingGame
+from skull_king.obs import N_CARDS, CardSetObs, encode_card_sets, encode_obs, obs_size
+
+
+def one_hot_observations(n):
+    torch.manual_seed(0)
+    x = torch.zeros(n, obs_size())
+    x[:, :3 * N_CARDS] = (torch.rand(n, 3 * N_CARDS) < 0.1).float()
+    x[0, :3 * N_CARDS] = 0  # a row with no cards at all
+    x[:, 3 * N_CARDS:] = torch.randn(n, obs_size() - 3 * N_CARDS)
+    return x
+
+
+def test_set_networks_match_converted_dense_networks():
+    x = one_hot_observations(16)
+    card_sets = card_sets_from_dense(x)
+    bid, play = BidNetwork(obs_size()), PlayNetwork(obs_size(), N_CARDS)
+    with torch.no_grad():
+        assert torch.allclose(SetBidNetwork.from_dense(bid)(card_sets), bid(x), atol=1e-5)
+        assert torch.allclose(SetPlayNetwork.from_dense(play, N_CARDS)(card_sets), play(x), atol=1e-5)
+
+    set_play = SetPlayNetwork(obs_size(), N_CARDS)
+    set_play(card_sets).sum().backward()
+    assert set_play.encoder.cards.weight.grad.abs().sum() > 0
+
+
+def test_card_set_observations_match_dense_observations():
+    observations = []
+
+    class Recorder:
+        def before_play(self, player_id, player, state):
+            for max_seats in (None, 8):
+                observations.append((encode_obs(player.hand, state, player_id, max_seats=max_seats),
+                                     encode_card_sets(player.hand, state, player_id, max_seats=max_seats)))
+
+        def __getattr__(self, name):
+            return lambda *args: None
+
+    np.random.seed(0)
+    env = SkullKingGame(n_manual=0, n_random=4)
+    env.recorder = Recorder()
+    env.round = 6
+    env.play_round()
+
+    for dense, card_set in observations:
+        assert (np.flatnonzero(dense[:3 * N_CARDS]) == np.sort(card_set.ids)).all()
+        assert (dense[3 * N_CARDS:] == card_set.features).all()
+    batch = collate([card_set for _, card_set in observations[::2]])
+    expected = card_sets_from_dense(torch.from_numpy(np.stack([dense for dense, _ in observations[::2]])))
+    assert all(torch.equal(torch.sort(a).values, torch.sort(b).values) for a, b in zip(batch[:2], expected[:2]))
+    assert torch.equal(batch.features, expected.features)
+
+
+def test_rl_agents_train_with_set_networks():
+    game = SkullKingGame(n_manual=0, n_random=2, n_rl=2, network="set")
+    agent = game.players[2]
+    assert isinstance(agent.play_network, SetPlayNetwork) and isinstance(agent.bid_network, SetBidNetwork)
+    assert agent.play_network is not game.players[3].play_network
+
+    for i in range(1, 11):
+        game.round = i
+        game.play_round()
+        game.player_scores += game.score_round()
+        game.cleanup_round()
+    assert isinstance(agent.memory.sample(1)[0][0], CardSetObs)
+    agent.batch_size = 16
+    agent.optimize()
+    assert agent.games_played == 1
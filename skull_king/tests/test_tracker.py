@@ -0,0 +1,61 @@
+import numpy as np
+
+from skull_king import game
+from skull_king.env import SkullKingGame
+from skull_king.obs import N_CARDS, encode_obs
+from skull_king.tracker import PublicState
+
+
+def play(state: PublicState, trick: game.Trick, player_id: int, name: str):
+    card = game.get_card(name)
+    trick.add_card(player_id, card)
+    state.on_card(player_id, card, trick)
+
+
+def test_tracker_updates_on_each_card():
+    state = PublicState(4)
+    trick = game.Trick()
+    play(state, trick, 0, "Escape")
+    assert state.trick_winner == 0
+    play(state, trick, 1, "Green 5")
+    assert state.trick_winner == 1 and not state.voids.any()
+    play(state, trick, 2, "Pink 9")
+    assert state.is_void(2, game.CARD_COLOR_GREEN) and state.trick_winner == 1
+    play(state, trick, 3, "Black 2")
+    assert state.is_void(3, game.CARD_COLOR_GREEN) and state.trick_winner == 3
+
+    assert state.is_played(game.get_card("Pink 9").id) and not state.is_played(game.get_card("Pink 8").id)
+    assert state.cards_played.sum() == 4
+
+    # The winner is computed without awarding bonus points
+    assert trick.bonus_points == 0
+    state.on_trick_end(trick.get_winner())
+    assert list(state.tricks_taken) == [0, 0, 0, 1] and state.trick_winner is None
+
+    state.reset_round()
+    assert state.played_bits == 0 and not state.cards_played.any() and not state.voids.any()
+
+
+def test_game_tracks_public_state_for_observations():
+    np.random.seed(0)
+    env = SkullKingGame(n_manual=0, n_random=4)
+    seen = []
+
+    class Spy:
+        def before_play(self, player_id, player, state):
+            seen.append(encode_obs(player.hand, state, player_id)[N_CARDS:2 * N_CARDS].sum())
+
+        def __getattr__(self, name):
+            return lambda *args: None
+
+    env.recorder = Spy()
+    env.round = 5
+    env.play_round()
+    # Cards played earlier in the round now show up in the observation
+    assert seen[0] == 0 and seen[-1] == 19
+    assert env.public.tricks_taken is env.tricks_taken and env.tricks_taken.sum() <= 5
+    assert env.public.played_bits.bit_count() == 20
+
+    env.score_round()
+    env.cleanup_round()
+    assert not env.state["cards_played"].any() and env.state["public"] is env.public
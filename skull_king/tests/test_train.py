@@ -0,0 +1,10 @@
+import train
+
+
+def test_eight_player_tables_play_the_rounds_the_deck_can_deal(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # train() saves its networks under local/
+    args = train.parse_args(["--players", "8", "-n", "2", "--num_episodes", "1"])
+    assert args.max_seats == 8
+
+    train.train(args)
+    assert sorted(p.name for p in (tmp_path / "local").iterdir()) == ["player_6.torch", "player_7.torch"]
@@ -0,0 +1,67 @@
+import random
+
+import numpy as np
+
+from skull_king.env import SkullKingGame
+from skull_king.zobrist import HashRecorder, ZobristHasher, duplicate_rate
+
+
+class CheckingRecorder(HashRecorder):
+    """Checks the incremental hashes against hashes computed from scratch at every decision."""
+    def check(self, player_id):
+        scratch = ZobristHasher.from_env(self.env)
+        args = (self.env.round, self.env.starting_player, self.env.player_scores)
+        assert self.env.state_hash() == scratch.state_hash(*args)
+        assert self.env.info_hash(player_id) == scratch.info_hash(player_id, *args)
+
+    def on_bid(self, player_id, player, state, bid):
+        self.check(player_id)
+        super().on_bid(player_id, player, state, bid)
+
+    def before_play(self, player_id, player, state):
+        self.check(player_id)
+        super().before_play(player_id, player, state)
+
+
+def test_incremental_hashes_match_recomputed_ones():
+    random.seed(0)
+    np.random.seed(0)
+    env = SkullKingGame(n_manual=0, n_random=4)
+    env.enable_hashing()
+    env.recorder = CheckingRecorder(env)
+    for _ in range(3):
+        env.play_game()
+        env.reset_game()
+    hashes = [h for h, _, _ in env.recorder.decisions]
+    assert len(set(hashes)) > 0.9 * len(hashes)
+
+
+def test_info_hash_ignores_other_hands_and_positions_restore_their_hash():
+    random.seed(1)
+    np.random.seed(1)
+    env = SkullKingGame(n_manual=0, n_random=4)
+    env.enable_hashing()
+    env.start_round(5)
+    env.deal()
+    env.collect_bids()
+    env.play_trick()
+    env.finish_trick()
+    state, info = env.state_hash(), env.info_hash(0)
+
+    restored = SkullKingGame(n_manual=0, n_random=4)
+    restored.enable_hashing()
+    restored.set_position(env.get_position())
+    assert (restored.state_hash(), restored.info_hash(0)) == (state, info)
+
+    # Swap a card between two other players' hands
+    position = env.get_position()
+    position["hands"][1][0], position["hands"][2][0] = position["hands"][2][0], position["hands"][1][0]
+    restored.set_position(position)
+    assert restored.info_hash(0) == info
+    assert restored.state_hash() != state and restored.info_hash(1) != env.info_hash(1)
+
+
+def test_duplicate_rate_report():
+    result = duplicate_rate(["random"] * 4, 20)
+    assert result["decisions"] == 20 * 4 * (10 + 55)
+    assert 0 <= result["rates"]["play"] <= result["rates"]["round 1"] <= 1
@@ -0,0 +1,60 @@
+"""
+Incrementally maintained public information about the current round.
+
+SkullKingGame updates a PublicState as each card is played and each trick ends, so agents and the
+observation encoder can look up what has been played, who is known to be out of a color, the
+tricks taken so far and who is currently winning the trick without replaying the round's Trick
+objects. Every query is O(1).
+"""
+import numpy as np
+
+from skull_king import game
+
+N_CARDS = len(game.ALL_CARDS)
+N_COLORS = 4
+
+
+class PublicState:
+    def __init__(self, n_players: int) -> None:
+        self.n_players = n_players
+
+        # Arrays are only ever modified in place, so references held elsewhere
+        # (e.g. SkullKingGame.cards_played) stay current
+        self.cards_played = np.zeros(N_CARDS)  # one-hot of the cards played this round
+        self.tricks_taken = np.zeros(n_players)
+        self.voids = np.zeros((n_players, N_COLORS), dtype=bool)  # voids[seat, color]
+        self.played_bits = 0  # the same set as cards_played, as an int bitset
+        self.trick_winner: int = None  # seat currently winning the trick in progress
+        self.trick_winning_card: game.Card = None
+
+    def reset_round(self) -> None:
+        self.cards_played[:] = 0
+        self.tricks_taken[:] = 0
+        self.voids[:] = False
+        self.played_bits = 0
+        self.trick_winner = None
+        self.trick_winning_card = None
+
+    def on_card(self, player_id: int, card: game.Card, trick: game.Trick) -> None:
+        """Record `card`, which `player_id` has just added to `trick`."""
+        self.cards_played[card.id] = 1
+        self.played_bits |= 1 << card.id
+
+        # Numbers must follow the trick's color when possible, so playing another color reveals a void
+        if isinstance(card, game.Number) and trick.color is not None and card.color != trick.color:
+            self.voids[player_id, trick.color] = True
+
+        self.trick_winner, self.trick_winning_card = trick.compute_winner()
+
+    def on_trick_end(self, winner_id: int) -> None:
+        """`winner_id` is None when nobody takes the trick (Kraken)."""
+        if winner_id is not None:
+            self.tricks_taken[winner_id] += 1
+        self.trick_winner = None
+        self.trick_winning_card = None
+
+    def is_played(self, card_id: int) -> bool:
+        return bool(self.played_bits >> card_id & 1)
+
+    def is_void(self, player_id: int, color: int) -> bool:
+        return bool(self.voids[player_id, color])
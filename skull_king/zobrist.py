@@ -0,0 +1,210 @@
+"""
+Zobrist hashes of game states and information sets.
+
+Every fact about a position (card c is in seat s's hand, seat s played card c into the current
+trick, seat s bid b, ...) has a fixed random 64-bit key, and a position's hash is the XOR of the
+keys of its facts. Since XOR is its own inverse, `ZobristHasher` keeps the hashes current with a
+couple of XORs per deal, bid, card and trick, so identifying a position costs one integer
+instead of comparing hands, tricks and state dicts. SkullKingGame maintains one once
+`enable_hashing` is called and exposes `state_hash()` and `info_hash(seat)`.
+
+The card facts, which are most of a position, are updated incrementally. The round, the
+leading seat and the cumulative scores are mixed in when a hash is asked for, since callers
+add round scores to `player_scores` themselves.
+
+`duplicate_rate` measures how often decisions in self-play are taken from an information set
+that has already been seen:
+
+    python -m skull_king.zobrist --games 1000 --lineup rl rl rl rl
+"""
+import random
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from skull_king.obs import MAX_SEATS, N_BIDS, N_CARDS
+
+MASK = (1 << 64) - 1
+
+
+def _splitmix64(x: int) -> int:
+    x = (x + 0x9E3779B97F4A7C15) & MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK
+    return x ^ (x >> 31)
+
+
+class ZobristKeys:
+    """The random keys, as Python ints (XOR on numpy scalars is several times slower)."""
+    def __init__(self, seed: int = 0) -> None:
+        rng = np.random.default_rng(seed)
+
+        def keys(*shape) -> list:
+            return rng.bit_generator.random_raw(shape).tolist()
+
+        self.seed = seed
+        self.hand = keys(MAX_SEATS, N_CARDS)  # card in a seat's hand
+        self.trick = keys(MAX_SEATS, N_CARDS)  # card a seat played into the current trick
+        self.played = keys(MAX_SEATS, N_CARDS)  # card a seat played into an earlier trick this round
+        self.bid = keys(MAX_SEATS, N_BIDS)
+        self.taken = keys(MAX_SEATS, N_BIDS)  # tricks taken so far
+        self.leader = keys(MAX_SEATS)
+        self.round = keys(N_BIDS)
+        self.seat = keys(MAX_SEATS)  # whose information set
+        self.score_salt = keys(MAX_SEATS)
+
+    def score(self, seat: int, score: float) -> int:
+        return _splitmix64(self.score_salt[seat] ^ (int(score) & 0xFFFFFFFF))
+
+
+_KEYS: Dict[int, ZobristKeys] = {}
+
+
+def get_keys(seed: int = 0) -> ZobristKeys:
+    if seed not in _KEYS:
+        _KEYS[seed] = ZobristKeys(seed)
+    return _KEYS[seed]
+
+
+class ZobristHasher:
+    """Incrementally maintained hashes of one table's public information and each seat's hand."""
+    def __init__(self, n_players: int, seed: int = 0) -> None:
+        if n_players > MAX_SEATS:
+            raise ValueError(f"Zobrist keys cover at most {MAX_SEATS} seats")
+        self.n_players = n_players
+        self.keys = get_keys(seed)
+        self.public = 0
+        self.hands = [0] * n_players
+        self.taken = [0] * n_players
+
+    def reset_round(self) -> None:
+        self.public = 0
+        self.hands = [0] * self.n_players
+        self.taken = [0] * self.n_players
+        for seat in range(self.n_players):
+            self.public ^= self.keys.taken[seat][0]
+
+    def on_deal(self, seat: int, card_ids: Sequence[int]) -> None:
+        keys = self.keys.hand[seat]
+        for card_id in card_ids:
+            self.hands[seat] ^= keys[card_id]
+
+    def on_bid(self, seat: int, bid: int) -> None:
+        self.public ^= self.keys.bid[seat][bid]
+
+    def on_card(self, seat: int, card_id: int) -> None:
+        self.hands[seat] ^= self.keys.hand[seat][card_id]
+        self.public ^= self.keys.trick[seat][card_id]
+
+    def on_trick_end(self, cards: Sequence[Tuple[int, int]], winner_id: int = None) -> None:
+        """`cards` are the trick's (seat, card id) pairs; `winner_id` is None when nobody takes it."""
+        for seat, card_id in cards:
+            self.public ^= self.keys.trick[seat][card_id] ^ self.keys.played[seat][card_id]
+        if winner_id is not None:
+            taken = self.keys.taken[winner_id]
+            self.public ^= taken[self.taken[winner_id]] ^ taken[self.taken[winner_id] + 1]
+            self.taken[winner_id] += 1
+
+    def _context(self, round_number: int, leader: int, scores: Sequence[float]) -> int:
+        h = self.keys.round[round_number] ^ self.keys.leader[leader]
+        for seat, score in enumerate(scores):
+            h ^= self.keys.score(seat, score)
+        return h
+
+    def state_hash(self, round_number: int, leader: int, scores: Sequence[float]) -> int:
+        h = self.public ^ self._context(round_number, leader, scores)
+        for hand in self.hands:
+            h ^= hand
+        return h
+
+    def info_hash(self, seat: int, round_number: int, leader: int, scores: Sequence[float]) -> int:
+        return self.public ^ self.hands[seat] ^ self.keys.seat[seat] ^ self._context(round_number, leader, scores)
+
+    @classmethod
+    def from_env(cls, env, seed: int = 0) -> "ZobristHasher":
+        """A hasher for `env`'s current position, computed from scratch."""
+        hasher = cls(env.n_players, seed)
+        hasher.reset_round()
+        for seat, player in enumerate(env.players):
+            hasher.on_deal(seat, [card.id for card in player.hand.cards])
+        for trick in env.round_tricks:
+            for seat, card in trick.cards:
+                hasher.public ^= hasher.keys.played[seat][card.id]
+        for seat, card in env.current_trick.cards:
+            hasher.public ^= hasher.keys.trick[seat][card.id]
+        for seat in range(env.n_players):
+            hasher.public ^= hasher.keys.taken[seat][0] ^ hasher.keys.taken[seat][int(env.tricks_taken[seat])]
+            hasher.taken[seat] = int(env.tricks_taken[seat])
+        for seat in range(env.n_bids):
+            hasher.on_bid(seat, int(env.player_bets[seat]))
+        return hasher
+
+
+class HashRecorder:
+    """An env recorder that logs the information-set hash of every decision, with its kind and round."""
+    def __init__(self, env) -> None:
+        self.env = env
+        self.decisions: List[Tuple[int, str, int]] = []  # (hash, "bid" or "play", round)
+
+    def on_bid(self, player_id, player, state, bid) -> None:
+        self.decisions.append((self.env.info_hash(player_id), "bid", self.env.round))
+
+    def before_play(self, player_id, player, state) -> None:
+        self.decisions.append((self.env.info_hash(player_id), "play", self.env.round))
+
+    def after_play(self, player_id, card) -> None:
+        pass
+
+    def on_trick(self, winner_id, trick) -> None:
+        pass
+
+    def on_round_scored(self, round_scores) -> None:
+        pass
+
+
+def duplicate_rate(lineup: Sequence[str], n_games: int, seed: int = 0) -> dict:
+    """
+    Play `n_games` with the agents in `lineup` and report the fraction of decisions taken from an
+    information set seen earlier in the run, overall, for bids and plays, and per round.
+    """
+    from skull_king.agents import build_agents
+    from skull_king.env import SkullKingGame
+
+    random.seed(seed)
+    np.random.seed(seed)
+    env = SkullKingGame(n_manual=0, n_random=len(lineup))
+    env.players = build_agents(list(lineup))
+    env.enable_hashing()
+    recorder = HashRecorder(env)
+    env.recorder = recorder
+    for _ in range(n_games):
+        env.play_game()
+        env.reset_game()
+
+    seen = set()
+    totals: Dict[str, List[int]] = {}
+    for h, kind, round_number in recorder.decisions:
+        duplicate = h in seen
+        seen.add(h)
+        for key in ("all", kind, f"round {round_number}"):
+            counts = totals.setdefault(key, [0, 0])
+            counts[0] += duplicate
+            counts[1] += 1
+    return {"decisions": len(recorder.decisions), "distinct": len(seen),
+            "rates": {key: duplicates / n for key, (duplicates, n) in totals.items()}}
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Rate of repeated information sets in self-play")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--lineup", nargs="+", default=["rl", "rl", "rl", "rl"],
+                        help="Agent specs, one per seat (see skull_king.agents.build_agents)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    result = duplicate_rate(args.lineup, args.games, args.seed)
+    print(f"{result['decisions']} decisions, {result['distinct']} distinct information sets")
+    for key, rate in result["rates"].items():
+        print(f"  {key:>9}: {rate:.2%} repeated")
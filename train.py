@@ -1,25 +1,108 @@
+import logging
 import os
+from argparse import ArgumentParser, Namespace
+from typing import List
 
 from skull_king.env import SkullKingGame
 from skull_king.agents import RLAgent
+from skull_king.metrics import METRICS
+from skull_king.obs import MAX_SEATS
+from skull_king.checkpoint import CheckpointManager, restore_training_state, training_state
+from skull_king.pipeline import PipelinedTrainer
+
+def train_distributed(args):
+    from skull_king.distributed import train_actor_learner
+
+    learner = RLAgent(0, max_seats=args.max_seats)
+    train_actor_learner(learner, n_actors=args.actors or None, n_rl=args.n_agents, n_players=args.players,
+                        max_updates=args.max_updates, publish_interval=args.publish_interval)
+
+    print("Saving networks")
+    os.makedirs("local", exist_ok=True)
+    learner.save("local/learner.torch")
+
+
+def train_league_mode(args):
+    from skull_king.league import train_league
+
+    learner = RLAgent(0, max_seats=args.max_seats)
+    train_league(learner, n_actors=args.actors or None, n_learner=args.learner_seats, n_players=args.players,
+                 games_per_actor=args.games_per_actor, pool_size=args.pool_size,
+                 freeze_interval=args.freeze_interval, max_updates=args.max_updates,
+                 publish_interval=args.publish_interval)
+
+    print("Saving networks")
+    os.makedirs("local", exist_ok=True)
+    learner.save("local/learner.torch")
+
+
+def train_ppo(args):
+    from skull_king.ppo import PPOTrainer
+
+    trainer = PPOTrainer(n_envs=args.envs, n_learner=args.n_agents, n_players=args.players,
+                         n_steps=args.rollout_steps, max_seats=args.max_seats)
+    for _ in range(args.num_episodes):
+        trainer.iterate()
+
+    print("Saving networks")
+    os.makedirs("local", exist_ok=True)
+    trainer.save("local/ppo.ppo")
+
 
 def train(args):
-    game = SkullKingGame(n_manual=0, n_random=4 - args.n_agents, n_rl=args.n_agents)
+    if args.metrics_file is not None:
+        METRICS.enable(args.metrics_file, interval=args.metrics_interval)
+
+    game = SkullKingGame(n_manual=0, n_random=args.players - args.n_agents, n_rl=args.n_agents,
+                         prioritized_replay=args.prioritized, replay_dir=args.replay_dir,
+                         packed_replay=args.packed_replay, network=args.network, max_seats=args.max_seats)
+
+    start_episode = 0
+    checkpoints = None
+    if args.checkpoint_dir is not None:
+        checkpoints = CheckpointManager(args.checkpoint_dir, keep_last=args.keep_last)
+        state = checkpoints.load_latest() if args.resume else None
+        if state is not None:
+            start_episode = restore_training_state(game, state)["episode"]
 
-    # Modified version of game.play_game to allow for training
-    for i in range(args.num_episodes):
-        for i in range(1, 11):
-            game.round = i
-            game.play_round()
-            round_scores = game.score_round()
-            game.player_scores += round_scores
+    if args.pipelined:
+        if checkpoints is not None:
+            raise ValueError("--pipelined does not support checkpointing yet")
+        PipelinedTrainer(game, refresh_interval=args.refresh_interval,
+                         updates_per_transition=args.utd).run(args.num_episodes)
+    elif args.round_slices:
+        if checkpoints is not None:
+            raise ValueError("--round-slices does not support checkpointing yet")
+        from skull_king.rounds import RoundSampler, train_round_slices
 
-            game.cleanup_round()
-            for player in game.players:
-                if isinstance(player, RLAgent):
-                    player.optimize()
+        sampler = RoundSampler(game.n_rounds, weights=args.round_weights, adaptive=args.adaptive_rounds)
+        # As many rounds as the same number of full games would play
+        counts = train_round_slices(game, args.num_episodes * game.n_rounds, sampler)
+        print(f"Rounds played: {counts.tolist()}")
+    else:
+        # Modified version of game.play_game to allow for training
+        for episode in range(start_episode, args.num_episodes):
+            for i in range(1, game.n_rounds + 1):
+                game.round = i
+                game.play_round()
+                round_scores = game.score_round()
+                game.player_scores += round_scores
 
-        game.reset_game()
+                game.cleanup_round()
+                for player in game.players:
+                    if isinstance(player, RLAgent):
+                        player.optimize()
+                METRICS.maybe_flush()
+
+            game.reset_game()
+            METRICS.count("games")
+
+            if checkpoints is not None and (episode + 1) % args.checkpoint_every == 0:
+                checkpoints.save_async(training_state(game, {"episode": episode + 1}), episode + 1)
+
+    if checkpoints is not None:
+        checkpoints.wait()
+    METRICS.flush()
 
     print("Saving networks")
     os.makedirs("local", exist_ok=True)
@@ -35,13 +118,85 @@ def train(args):
         print("next state:", sample[2])
         print("reward:", sample[3])
 
-if __name__ == "__main__":
-    from argparse import ArgumentParser
 
+def parse_args(argv: List[str] = None) -> Namespace:
     parser = ArgumentParser()
     parser.add_argument("-n", "--n-agents", type=int, default=4)
     parser.add_argument("--num_episodes", type=int, default=100)
+    parser.add_argument("--players", type=int, default=4, help="Table size, RL agents included")
+    parser.add_argument("--max-seats", type=int, default=None,
+                        help="Use seat-relative observations padded to this many seats "
+                             "(default: 8 for tables other than 4 players)")
+    parser.add_argument("--prioritized", action="store_true", help="Use prioritized experience replay")
+    parser.add_argument("--network", choices=["dense", "set"], default="dense",
+                        help="Network family: dense one-hot input layers, or set encoders over card ids "
+                             "(the same function, but slower on CPU)")
+    parser.add_argument("--packed-replay", action="store_true",
+                        help="Store replay observations bit-packed, with 10x the capacity")
+    parser.add_argument("--replay-dir", type=str, default=None,
+                        help="Keep replay memories in memory-mapped files under this directory")
+    parser.add_argument("--checkpoint-dir", type=str, default=None,
+                        help="Periodically write full training checkpoints to this directory")
+    parser.add_argument("--checkpoint-every", type=int, default=10, help="Episodes between checkpoints")
+    parser.add_argument("--keep-last", type=int, default=3, help="Number of checkpoints to keep")
+    parser.add_argument("--resume", action="store_true", help="Resume from the latest checkpoint in --checkpoint-dir")
+    parser.add_argument("--metrics-file", type=str, default=None,
+                        help="Write throughput and latency metrics to this .jsonl or .csv file")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, help="Seconds between metrics flushes")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Optimize on a learner thread while the simulation keeps playing")
+    parser.add_argument("--refresh-interval", type=int, default=10,
+                        help="Learner updates between refreshing the weights the simulation acts with")
+    parser.add_argument("--utd", type=float, default=None,
+                        help="Maximum learner updates per collected transition when --pipelined")
+    parser.add_argument("--actor-learner", action="store_true",
+                        help="Train with separate actor processes feeding a learner process")
+    parser.add_argument("--actors", type=int, default=0, help="Number of actor processes (default: one per spare core)")
+    parser.add_argument("--max-updates", type=int, default=10000)
+    parser.add_argument("--publish-interval", type=int, default=10,
+                        help="Learner updates between publishing new weights to the actors")
+    parser.add_argument("--round-slices", action="store_true",
+                        help="Train on single rounds sampled by --round-weights instead of full games")
+    parser.add_argument("--round-weights", type=float, nargs="+", default=None,
+                        help="Relative frequency of each round with --round-slices (default: proportional to the round)")
+    parser.add_argument("--adaptive-rounds", action="store_true",
+                        help="With --round-slices, favour the rounds where the agents miss their bids most")
+    parser.add_argument("--ppo", action="store_true",
+                        help="Train a PPOAgent on-policy instead; --num_episodes counts rollouts, "
+                             "--n-agents the PPO seats per game")
+    parser.add_argument("--envs", type=int, default=16, help="Games played at once when collecting PPO rollouts")
+    parser.add_argument("--rollout-steps", type=int, default=4096, help="Decisions collected per PPO rollout")
+    parser.add_argument("--league", action="store_true",
+                        help="Actor-learner training against a pool of frozen snapshots of the learner")
+    parser.add_argument("--learner-seats", type=int, default=2, help="Seats per league game played by the learner")
+    parser.add_argument("--games-per-actor", type=int, default=8,
+                        help="League games each actor plays at once, batching their frozen seats")
+    parser.add_argument("--pool-size", type=int, default=200, help="Maximum number of frozen snapshots")
+    parser.add_argument("--freeze-interval", type=int, default=100,
+                        help="Learner updates between freezing a new snapshot into the pool")
+
+    args = parser.parse_args(argv)
+    if args.max_seats is None and args.players != 4:
+        # RL networks without max_seats are sized for the 4 player layout
+        args.max_seats = MAX_SEATS
+    if args.max_seats is not None and args.players > args.max_seats:
+        parser.error(f"--players {args.players} doesn't fit in --max-seats {args.max_seats}")
+    if args.network != "dense" and (args.league or args.actor_learner):
+        parser.error("--league and --actor-learner share dense networks between processes; use --network dense")
+    return args
 
-    args = parser.parse_args()
 
-    train(args)
+if __name__ == "__main__":
+    args = parse_args()
+    if args.ppo:
+        logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.WARNING)
+        logging.getLogger("skull_king.ppo").setLevel(logging.INFO)
+        train_ppo(args)
+    elif args.league:
+        logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.INFO)
+        train_league_mode(args)
+    elif args.actor_learner:
+        logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.INFO)
+        train_distributed(args)
+    else:
+        train(args)